@@ -0,0 +1,172 @@
+"""
+Background I/O for single-process extraction (--prefetch).
+
+Overlaps image reads and output writes with the parsing and rendering done on
+the main thread:
+  - SongPrefetcher reads the sequence data of the next few songs on a reader
+    thread (file reads release the GIL).
+  - BackgroundWriter lets the output generators write to a local spool
+    directory, and moves finished files to the output directory on a writer
+    thread. The number of files waiting to be moved is bounded, so the main
+    thread blocks (backpressure) when the output storage can't keep up.
+"""
+
+import queue
+import shutil
+import tempfile
+import threading
+import contextlib
+from pathlib import Path
+from typing import Callable, Iterator, List, Tuple
+
+from build_cache import atomic_output
+
+
+# Songs read ahead of the one being parsed
+DEFAULT_PREFETCH = 4
+
+# Finished output files waiting for the writer thread
+DEFAULT_WRITE_QUEUE = 16
+
+_DONE = object()  # End-of-queue marker
+
+
+class SongPrefetcher:
+    """Read songs' sequence data on a background thread, in order.
+
+    Usage:
+        with SongPrefetcher(extractor.extract_sequence_data, songs) as prefetcher:
+            for song, data, error in prefetcher:
+                ...
+    """
+
+    def __init__(self, read: Callable, songs: List, depth: int = DEFAULT_PREFETCH):
+        """Start reading.
+
+        Args:
+            read: Function returning a song's sequence data
+            songs: Songs in processing order
+            depth: Number of songs read ahead
+        """
+        self._read = read
+        self._songs = songs
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, depth))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='song-prefetch', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        for song in self._songs:
+            try:
+                item = (song, self._read(song), None)
+            except Exception as e:
+                item = (song, None, e)
+            # Wait for room, giving up if the consumer has stopped
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if self._stop.is_set():
+                return
+        self._queue.put(_DONE)
+
+    def __iter__(self) -> Iterator[Tuple]:
+        """Yield (song, data, error) per song; error is the read's exception, if any."""
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            yield item
+
+    def close(self):
+        """Stop reading ahead and wait for the reader thread."""
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class BackgroundWriter:
+    """Move finished output files into place on a background thread.
+
+    output() is a drop-in for build_cache.atomic_output(): the generator writes
+    to a spool file with the same name, and once it is complete the file is
+    queued and moved atomically to its destination by the writer thread. Items
+    are handled in submission order, so a manifest written with write_text()
+    after a song's outputs only lands once those outputs are in place.
+    """
+
+    def __init__(self, max_pending: int = DEFAULT_WRITE_QUEUE):
+        """Create the spool directory and start the writer thread.
+
+        Args:
+            max_pending: Finished files that may wait for the writer thread
+                before output() blocks
+        """
+        self._spool = Path(tempfile.mkdtemp(prefix='akao-spool-'))
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_pending))
+        self.errors: List[Tuple[Path, str]] = []  # Failed writes (path, error), reported by the caller
+        self._thread = threading.Thread(target=self._run, name='output-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            path, spool_file, text, skip_after_error = item
+            if skip_after_error and self.errors:
+                continue
+            try:
+                with atomic_output(path) as tmp:
+                    if spool_file is None:
+                        tmp.write_text(text)
+                    else:
+                        shutil.move(str(spool_file), str(tmp))
+            except Exception as e:
+                self.errors.append((path, str(e)))
+            finally:
+                if spool_file is not None:
+                    shutil.rmtree(spool_file.parent, ignore_errors=True)
+
+    @contextlib.contextmanager
+    def output(self, path: Path):
+        """Yield a spool path for path's contents; queue it for the writer on success."""
+        spool_file = Path(tempfile.mkdtemp(dir=self._spool)) / Path(path).name
+        try:
+            yield spool_file
+        except BaseException:
+            shutil.rmtree(spool_file.parent, ignore_errors=True)
+            raise
+        self._queue.put((Path(path), spool_file, None, False))
+
+    def write_text(self, path: Path, text: str, skip_after_error: bool = False):
+        """Queue a text file (e.g. a manifest snapshot).
+
+        Args:
+            path: Destination file
+            text: File contents
+            skip_after_error: Drop the write if an earlier write failed (so a
+                manifest never lists outputs that weren't written)
+        """
+        self._queue.put((Path(path), None, text, skip_after_error))
+
+    def close(self):
+        """Wait for every queued file to be written, then remove the spool directory."""
+        self._queue.put(_DONE)
+        self._thread.join()
+        shutil.rmtree(self._spool, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
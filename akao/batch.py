@@ -0,0 +1,221 @@
+"""
+Multi-game batch extraction.
+
+A batch file lists extraction jobs: a game config, its ROM/ISO, an optional
+song filter and an output directory. Every game is loaded once (config, image,
+format handler and tables); the songs of all games then go through one pool of
+forked worker processes, where an idle worker takes the next song of any game.
+Workers reading from the same image are limited to `image_concurrency` at a
+time, so an optical drive or network mount isn't read by every worker at once.
+
+Example batch file:
+
+    jobs: 4                   # Worker processes (default: CPU count; --jobs overrides)
+    image_concurrency: 1      # Workers reading one image at a time (default: 1)
+    games:
+      - config: ct.yaml
+        source: ../snes/ct/chrono.smc
+        songs: [0x15]         # Only these song IDs (default: all)
+        output_dir: out/ct    # Default: current directory
+      - config: ff9.yaml
+        source: ff9.iso
+        formats: mid,xml      # Overrides --formats for this game
+
+Relative paths are relative to the current directory, as on the command line.
+"""
+
+import os
+import sys
+import time
+import contextlib
+import traceback
+import multiprocessing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import run_report
+from extractor import SequenceExtractor, extract_song_captured
+from game_profile import load_yaml
+
+
+@dataclass
+class BatchJob:
+    """One game of a batch file."""
+    config: str
+    source: Optional[str] = None
+    songs: Optional[List[int]] = None  # Song IDs to extract (None = all)
+    output_dir: str = '.'
+    formats: Optional[str] = None  # None = the batch-wide formats
+    image_concurrency: Optional[int] = None  # None = the batch-wide limit
+
+
+def load_batch(path: Path) -> Dict:
+    """Read a batch file.
+
+    Returns:
+        Dict with 'jobs' (worker processes, None if unset), 'image_concurrency'
+        and 'games' (list of BatchJob)
+    """
+    data = load_yaml(Path(path)) or {}
+
+    games = []
+    for entry in data.get('games') or []:
+        if 'config' not in entry:
+            raise ValueError(f"{path}: every game needs a 'config'")
+        songs = entry.get('songs')
+        if songs is not None:
+            songs = [int(str(song_id), 0) for song_id in (songs if isinstance(songs, list) else [songs])]
+        games.append(BatchJob(config=entry['config'], source=entry.get('source'), songs=songs,
+                              output_dir=str(entry.get('output_dir', '.')), formats=entry.get('formats'),
+                              image_concurrency=entry.get('image_concurrency')))
+
+    return {'jobs': data.get('jobs'), 'image_concurrency': data.get('image_concurrency', 1), 'games': games}
+
+
+def _image_key(extractor: SequenceExtractor, job: BatchJob) -> str:
+    """Identify the image a game's songs are read from (games may share one)."""
+    if 'akao_directory' in extractor.config:
+        return str(Path(extractor.config['akao_directory']).resolve())
+    if job.source:
+        return str(Path(job.source).resolve())
+    return str(Path(job.config).resolve())
+
+
+# Per-game state shared with the worker processes (inherited at fork), and the
+# (game index, song) tasks they are sent by index
+_batch_games: List[Dict] = []
+_batch_tasks: List = []
+
+
+def _batch_worker(index: int) -> Dict:
+    """Extract one song of the batch in a worker process."""
+    game_idx, song = _batch_tasks[index]
+    game = _batch_games[game_idx]
+    report = run_report.active()
+    if report is not None:
+        report.game = game['summary']['game']  # Label this song's spans
+    return extract_song_captured(game['extractor'], song, game['formats'], game['output_root'],
+                                 game['manifest'], game['force'], image_lock=game['image_lock'])
+
+
+def run_batch(path: Path, jobs: Optional[int] = None, formats=None, force: bool = False,
+              report: Optional[run_report.RunReport] = None, **extractor_options) -> List[Dict]:
+    """Extract every game of a batch file through one worker pool.
+
+    Args:
+        path: Batch file (see module docstring)
+        jobs: Worker processes (None = the batch file's jobs, or the CPU count)
+        formats: Output formats for games that don't set their own
+        force: Re-extract every song regardless of the build manifests
+        report: Optional run_report.RunReport that records per-stage timings
+            and counters of every song, labeled with its game
+        **extractor_options: Passed to each SequenceExtractor (patch_based_tracks,
+            compressed_musicxml, debug_events, from_ir)
+
+    Returns:
+        Per-game summary dicts with 'game', 'songs', 'ok', 'skipped', 'failed'
+        and 'seconds' (the games' song time)
+    """
+    global _batch_games, _batch_tasks
+
+    batch = load_batch(path)
+    jobs = jobs or batch['jobs'] or os.cpu_count() or 1
+    use_fork = jobs > 1 and 'fork' in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork') if use_fork else None
+
+    # Load every game once; the workers inherit them
+    games: List[Dict] = []
+    tasks = []
+    image_locks: Dict[str, object] = {}
+    for job in batch['games']:
+        summary = {'game': Path(job.config).stem, 'songs': 0, 'ok': 0, 'skipped': 0, 'failed': 0, 'seconds': 0.0}
+        game = {'job': job, 'summary': summary, 'extractor': None, 'manifest': None}
+        games.append(game)
+        print(f"Loading: {job.config}")
+        try:
+            extractor = SequenceExtractor(job.config, job.source, **extractor_options)
+            game['extractor'] = extractor  # Closed with the others, even if preparing it fails
+            plan = extractor.prepare_extraction(job.songs, job.formats or formats, force, Path(job.output_dir))
+        except Exception as e:
+            print(f"  ERROR: {e} {traceback.format_exc()}")
+            summary['failed'] += 1
+            continue
+        if plan is None:
+            continue
+        songs, game['formats'], game['output_root'], game['manifest'] = plan
+        game['force'] = force
+
+        # The ISO handle (and its file position) is shared by all workers, so
+        # ISO reads are always one at a time
+        image_key = _image_key(extractor, job)
+        limit = 1 if extractor.iso else (job.image_concurrency or batch['image_concurrency'])
+        if image_key not in image_locks:
+            image_locks[image_key] = context.BoundedSemaphore(limit) if context else contextlib.nullcontext()
+        game['image_lock'] = image_locks[image_key]
+
+        if game['manifest'] is not None:
+            game['manifest'].autosave = False  # Entries are merged and saved here
+        summary['songs'] = len(songs)
+        tasks.extend((len(games) - 1, song) for song in songs)
+
+    _batch_games, _batch_tasks = games, tasks
+    report_context = contextlib.ExitStack()
+    start = time.perf_counter()
+    pool = None
+    try:
+        if report is not None:
+            report_context.enter_context(report.activate())
+        if use_fork and len(tasks) > 1:
+            pool = context.Pool(min(jobs, len(tasks)))
+            results = pool.imap(_batch_worker, range(len(tasks)))
+        else:
+            results = map(_batch_worker, range(len(tasks)))
+
+        # Logs come back in task order, grouped by game
+        current_game = None
+        for (game_idx, song), result in zip(tasks, results):
+            game = games[game_idx]
+            if game_idx != current_game:
+                print(f"=== {game['job'].config} ({game['summary']['songs']} songs) ===")
+                current_game = game_idx
+            sys.stdout.write(result['log'])
+            sys.stdout.flush()
+            summary = game['summary']
+            summary['failed' if result['status'] == 'error' else result['status']] += 1
+            summary['seconds'] += result['seconds']
+            if report is not None:
+                report.merge(result['spans'])
+            if result['entry'] is not None:
+                game['manifest'].songs[f"{song.id:02X}"] = result['entry']
+                game['manifest'].save()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        report_context.close()
+        _batch_games, _batch_tasks = [], []
+        for game in games:
+            if game['manifest'] is not None:
+                game['manifest'].autosave = True
+                game['extractor'].finish_extraction(game['manifest'], all_songs=game['job'].songs is None)
+            if game['extractor'] is not None:
+                game['extractor'].close()
+
+    summaries = [game['summary'] for game in games]
+    print_summary(summaries, time.perf_counter() - start, min(jobs, max(len(tasks), 1)) if use_fork else 1)
+    return summaries
+
+
+def print_summary(summaries: List[Dict], wall_seconds: float, jobs: int):
+    """Print the per-game table of songs, failures and song time."""
+    print()
+    print(f"{'Game':<24} {'Songs':>6} {'OK':>6} {'Skip':>6} {'Fail':>6} {'Time':>9}")
+    for summary in summaries + [{
+            'game': 'Total', **{key: sum(s[key] for s in summaries)
+                                for key in ('songs', 'ok', 'skipped', 'failed', 'seconds')}}]:
+        print(f"{summary['game']:<24} {summary['songs']:>6} {summary['ok']:>6} {summary['skipped']:>6} "
+              f"{summary['failed']:>6} {summary['seconds']:>8.1f}s")
+    print(f"Wall time {wall_seconds:.1f}s with {jobs} jobs")
@@ -0,0 +1,14 @@
+"""
+Benchmark suite for the format handlers and output generators.
+
+Synthetic AKAO new-style, FF7 AKAO and SNES games of configurable length,
+voice count, loop nesting and fade density (see fixtures.py) are run through
+Pass 1, loop analysis, Pass 2 and each output generator, reporting events/sec
+and peak memory per stage against a stored baseline (see runner.py). The CLI's
+start-up overhead is checked against a fixed budget too.
+
+    python -m benchmarks                         # compare with baseline.json (the first run records it)
+    python -m benchmarks --scenarios snes,ff7    # a subset
+    python -m benchmarks --update-baseline       # re-record the baseline
+    python -m benchmarks --memory-budget 4       # also fail on any stage peak over 4 MiB
+"""
@@ -0,0 +1,111 @@
+"""
+Run the benchmarks: python -m benchmarks [options] (from the akao directory).
+"""
+
+import sys
+
+from .runner import (DEFAULT_THRESHOLD, SCENARIOS, STARTUP_BUDGET, compare, load_baseline,
+                     measure_startup, over_budget, run_benchmarks, save_baseline)
+
+
+def main():
+    """Main entry point."""
+    names = None
+    repeat = 5
+    threshold = DEFAULT_THRESHOLD
+    memory = True
+    update_baseline = False
+    memory_budget = None  # MiB
+    startup = True
+
+    args = sys.argv[1:]
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '--scenarios' and i + 1 < len(args):
+            # Next arg is a comma-separated list of scenario names
+            names = [name.strip() for name in args[i + 1].split(',') if name.strip()]
+            i += 1  # Skip next arg
+        elif arg == '--repeat' and i + 1 < len(args):
+            repeat = int(args[i + 1])
+            i += 1  # Skip next arg
+        elif arg == '--threshold' and i + 1 < len(args):
+            threshold = float(args[i + 1])
+            i += 1  # Skip next arg
+        elif arg == '--memory-budget' and i + 1 < len(args):
+            memory_budget = float(args[i + 1])
+            i += 1  # Skip next arg
+        elif arg == '--no-memory':
+            memory = False
+        elif arg == '--no-startup':
+            startup = False
+        elif arg == '--update-baseline':
+            update_baseline = True
+        else:
+            print("Usage: python -m benchmarks [options]")
+            print()
+            print("Options:")
+            print("  --scenarios <list>      - Scenarios to run, comma-separated (default: all)")
+            print(f"                            {', '.join(SCENARIOS)}")
+            print("  --repeat <n>            - Timed runs per song; the fastest counts (default: 5)")
+            print("  --threshold <f>         - Fail if events/sec drops or peak memory grows by more")
+            print(f"                            than this fraction of the baseline (default: {DEFAULT_THRESHOLD})")
+            print("  --memory-budget <MiB>   - Also fail if any stage's peak memory exceeds this")
+            print("  --no-memory             - Skip the tracemalloc run (no peak memory figures)")
+            print("  --no-startup            - Skip the CLI start-up check (extracting a one-song game")
+            print(f"                            in a new process; budget: {STARTUP_BUDGET * 1000:.0f} ms)")
+            print("  --update-baseline       - Store the results as the new baseline instead of comparing")
+            print()
+            print("The baseline (benchmarks/baseline.json) is machine specific and not checked in:")
+            print("the first run on a machine records it, later runs compare against it.")
+            sys.exit(1)
+        i += 1
+
+    if memory_budget is not None and not memory:
+        print("Error: --memory-budget needs the memory run (drop --no-memory)")
+        sys.exit(1)
+
+    try:
+        results = run_benchmarks(names, repeat=repeat, memory=memory)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if memory_budget is not None:
+        exceeded = over_budget(results, memory_budget)
+        if exceeded:
+            print(f"\n{len(exceeded)} stage(s) over the memory budget of {memory_budget:,.1f} MiB:")
+            for message in exceeded:
+                print(f"  {message}")
+            sys.exit(1)
+
+    if startup:
+        overhead = measure_startup(repeat)
+        print(f"\nCLI start-up: {overhead * 1000:.1f} ms over the bare interpreter "
+              f"(budget {STARTUP_BUDGET * 1000:.0f} ms)")
+        if overhead >= STARTUP_BUDGET:
+            print("CLI start-up over budget")
+            sys.exit(1)
+
+    if update_baseline:
+        save_baseline(results)
+        print(f"\nBaseline updated: {', '.join(results)}")
+        return
+
+    baseline = load_baseline()
+    if not baseline:
+        # Baselines are per machine and not checked in: the first run records one
+        save_baseline(results)
+        print("\nNo baseline on this machine yet: recorded this run as benchmarks/baseline.json")
+        return
+    regressions = compare(results, baseline, threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {threshold:.0%} of the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {threshold:.0%} of the baseline")
+
+
+if __name__ == '__main__':
+    main()
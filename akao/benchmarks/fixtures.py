@@ -0,0 +1,385 @@
+"""
+Synthetic sequence fixtures for the benchmarks.
+
+Songs are built from a seeded random stream of format-independent ops (notes,
+octave/volume/patch/tempo changes, fades, nested repeats, and a goto back to
+the voice's loop point), which each encoder turns into its format's bytes.
+write_game() writes the songs out as a game the extractor loads like a real
+one, so benchmarks run the same code paths as an extraction:
+  - akao_newstyle, akao_ff7: AKAO .bin files in an akao_directory
+  - snes_unified: a LoROM image with a song pointer table, opcode length and
+    duration tables, and an FF2-style (voice pointer) header per song
+
+Format differences the fixtures follow:
+  - AKAO new-style repeats (C8) take no count with the fallback opcode table,
+    so every repeat plays 255 times; keep its loop_depth small
+  - AKAO new-style has no fade opcodes in Pass 1, so its fades are written as
+    volume changes (A8) to the fade target
+"""
+
+import json
+import random
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# A repeat block (nested loop_depth deep) is started every this many ops
+REPEAT_INTERVAL = 48
+
+# Times a SNES/FF7 repeat block is played
+REPEAT_COUNT = 2
+
+# Instruments used by patch changes (all mapped in the fixture configs)
+INSTRUMENTS = 8
+
+TIE, REST = 12, 13  # Note numbers of ties and rests (as in AKAO)
+
+Op = Tuple  # ('note', note, dur_idx), ('volume', value), ('fade', duration, target), ...
+
+
+@dataclass
+class FixtureSpec:
+    """Shape of a synthetic game's songs."""
+    format: str  # Format handler name: akao_newstyle, akao_ff7 or snes_unified
+    voices: int = 4
+    length: int = 400  # Ops per voice, counting each repeat block once
+    loop_depth: int = 1  # Nesting depth of repeat blocks (0 = none)
+    fade_density: float = 0.05  # Probability that an op is a volume or pan fade
+    songs: int = 1
+    seed: int = 1
+
+
+def _repeat_block(rng: random.Random, depth: int) -> List[Op]:
+    """A repeat block nested depth deep, with a few notes at each level."""
+    ops: List[Op] = [('loop_start', REPEAT_COUNT)]
+    ops += [('note', rng.randrange(12), rng.randrange(11)) for _ in range(rng.randint(2, 4))]
+    if depth > 1:
+        ops += _repeat_block(rng, depth - 1)
+    ops += [('note', rng.randrange(12), rng.randrange(11)) for _ in range(rng.randint(1, 3))]
+    ops.append(('loop_end', REPEAT_COUNT))
+    return ops
+
+
+def voice_ops(rng: random.Random, spec: FixtureSpec) -> Tuple[List[Op], int]:
+    """Generate one voice's ops.
+
+    Returns:
+        Tuple of (ops, index of the op the closing goto jumps back to). The
+        goto itself is added by the encoders.
+    """
+    ops: List[Op] = [
+        ('tempo', rng.randint(0x3000, 0x7000)),
+        ('octave', 4),
+        ('patch', rng.randrange(INSTRUMENTS)),
+        ('volume', rng.randint(0x40, 0x7F)),
+    ]
+    loop_point = len(ops)
+    octave = 4
+
+    while len(ops) - loop_point < spec.length:
+        step = len(ops) - loop_point
+        r = rng.random()
+        if spec.loop_depth and step % REPEAT_INTERVAL == REPEAT_INTERVAL - 1:
+            ops += _repeat_block(rng, spec.loop_depth)
+        elif r < spec.fade_density:
+            kind = 'fade' if rng.random() < 0.7 else 'pan_fade'
+            ops.append((kind, rng.randint(0x10, 0xC0), rng.randint(0x10, 0x7F)))
+        elif r < spec.fade_density + 0.75:
+            ops.append(('note', rng.choices(range(14), weights=[6] * 12 + [1, 2])[0], rng.randrange(11)))
+        elif r < spec.fade_density + 0.82:
+            # Stay within octaves 2-6
+            if octave < 6 and (octave <= 2 or rng.random() < 0.5):
+                octave += 1
+                ops.append(('octave_up',))
+            else:
+                octave -= 1
+                ops.append(('octave_down',))
+        elif r < spec.fade_density + 0.90:
+            ops.append(('volume', rng.randint(0x20, 0x7F)))
+        elif r < spec.fade_density + 0.95:
+            ops.append(('patch', rng.randrange(INSTRUMENTS)))
+        else:
+            ops.append(('tempo', rng.randint(0x3000, 0x7000)))
+    return ops, loop_point
+
+
+def _encode_voice(ops: List[Op], loop_point: int, start: int,
+                  encode_op: Callable[[Op], bytes], encode_goto: Callable[[int, int], bytes]) -> bytes:
+    """Encode ops placed at buffer offset start, ending with a goto to the loop point."""
+    out = bytearray()
+    target = start
+    for i, op in enumerate(ops):
+        if i == loop_point:
+            target = start + len(out)
+        out += encode_op(op)
+    out += encode_goto(start + len(out), target)
+    return bytes(out)
+
+
+# AKAO new-style (FF8, FF9, Chrono Cross)
+
+def _newstyle_op(op: Op) -> bytes:
+    kind = op[0]
+    if kind == 'note':
+        return bytes([op[1] * 11 + op[2]])
+    if kind == 'octave':
+        return bytes([0xA5, op[1]])
+    if kind == 'octave_up':
+        return b'\xA6'
+    if kind == 'octave_down':
+        return b'\xA7'
+    if kind == 'volume':
+        return bytes([0xA8, op[1]])
+    if kind == 'fade':
+        return bytes([0xA8, op[2]])  # No fade opcode: jump to the target
+    if kind == 'pan_fade':
+        return b''
+    if kind == 'patch':
+        return bytes([0xA1, op[1]])
+    if kind == 'tempo':
+        return b'\xFE\x00' + struct.pack('<H', op[1])
+    if kind == 'loop_start':
+        return b'\xC8'
+    if kind == 'loop_end':
+        return bytes([0xC9, op[1]])
+    raise ValueError(f"Unknown op {kind}")
+
+
+def _newstyle_goto(pos: int, target: int) -> bytes:
+    # Relative to the first operand byte
+    return b'\xFE\x06' + struct.pack('<h', target - (pos + 2))
+
+
+def build_newstyle_song(rng: random.Random, spec: FixtureSpec, song_id: int) -> bytes:
+    """AKAO new-style song: 0x40-byte header, voice mask at 0x20, self-relative voice pointers at 0x40."""
+    body_start = 0x40 + 2 * spec.voices
+    bodies = bytearray()
+    pointers = bytearray()
+    for v in range(spec.voices):
+        ops, loop_point = voice_ops(rng, spec)
+        start = body_start + len(bodies)
+        pointers += struct.pack('<H', start - (0x40 + 2 * v))
+        bodies += _encode_voice(ops, loop_point, start, _newstyle_op, _newstyle_goto)
+
+    header = bytearray(0x40)
+    header[0:4] = b'AKAO'
+    header[0x20:0x24] = struct.pack('<I', (1 << spec.voices) - 1)
+    data = header + pointers + bodies
+    data[4:8] = struct.pack('<HH', song_id, len(data))
+    return bytes(data)
+
+
+# AKAO FF7
+
+def _ff7_op(op: Op) -> bytes:
+    kind = op[0]
+    if kind == 'fade':
+        return bytes([0xA9, op[1], op[2]])
+    if kind == 'pan_fade':
+        return bytes([0xAB, op[1], op[2]])
+    if kind == 'tempo':
+        return b'\xE8' + struct.pack('<H', op[1])
+    return _newstyle_op(op)
+
+
+def _ff7_goto(pos: int, target: int) -> bytes:
+    # Relative to the byte after the operands
+    return b'\xEE' + struct.pack('<h', target - (pos + 3))
+
+
+def build_ff7_song(rng: random.Random, spec: FixtureSpec, song_id: int) -> bytes:
+    """FF7 AKAO song: voice mask at 0x10, voice pointers at 0x14 relative to the pointer + 2."""
+    body_start = max(0x40, 0x14 + 2 * spec.voices)
+    bodies = bytearray()
+    pointers = bytearray()
+    for v in range(spec.voices):
+        ops, loop_point = voice_ops(rng, spec)
+        start = body_start + len(bodies)
+        pointers += struct.pack('<H', start - (0x14 + 2 * v + 2))
+        bodies += _encode_voice(ops, loop_point, start, _ff7_op, _ff7_goto)
+
+    data = bytearray(body_start)
+    data[0:4] = b'AKAO'
+    data[0x10:0x14] = struct.pack('<I', (1 << spec.voices) - 1)
+    data[0x14:0x14 + len(pointers)] = pointers
+    data += bodies
+    data[4:8] = struct.pack('<HH', song_id, len(data))
+    return bytes(data)
+
+
+# SNES (FF2-style header; opcodes as in SNES_OPCODES)
+
+SNES_SPC_LOAD_ADDRESS = 0x2000
+SNES_FIRST_OPCODE = 0xD2
+SNES_DURATIONS = [0xC0, 0x90, 0x60, 0x48, 0x40, 0x30, 0x24, 0x20, 0x18, 0x10, 0x0C, 0x08, 0x06, 0x04, 0x03]
+
+# Opcode -> (semantic, operand count)
+SNES_OPCODES = {
+    0xD2: ('tempo', 1),
+    0xD3: ('volume', 1),
+    0xD4: ('volume_fade', 2),
+    0xD5: ('pan', 1),
+    0xD6: ('pan_fade', 2),
+    0xD7: ('octave_set', 1),
+    0xD8: ('octave_inc', 0),
+    0xD9: ('octave_dec', 0),
+    0xDA: ('patch_change', 1),
+    0xDB: ('loop_start', 1),
+    0xDC: ('loop_end', 0),
+    0xDD: ('goto', 2),
+    0xFF: ('halt', 0),
+}
+
+# ROM layout (file offsets; the ROM is LoROM with base address 00/8000)
+_SNES_POINTER_TABLE = 0x0000
+_SNES_OPCODE_TABLE = 0x0100
+_SNES_DURATION_TABLE = 0x0140
+_SNES_SONGS = 0x0200
+_SNES_HEADER = 0x7FC0  # LoROM internal header (keeps mapping detection deterministic)
+
+
+def _snes_op(op: Op) -> bytes:
+    kind = op[0]
+    if kind == 'note':
+        return bytes([op[1] * len(SNES_DURATIONS) + op[2]])
+    if kind == 'octave':
+        return bytes([0xD7, op[1]])
+    if kind == 'octave_up':
+        return b'\xD8'
+    if kind == 'octave_down':
+        return b'\xD9'
+    if kind == 'volume':
+        return bytes([0xD3, op[1] * 2])  # 8-bit volume
+    if kind == 'fade':
+        return bytes([0xD4, op[1], op[2] * 2])
+    if kind == 'pan_fade':
+        return bytes([0xD6, op[1], op[2] * 2])
+    if kind == 'patch':
+        return bytes([0xDA, op[1]])
+    if kind == 'tempo':
+        return bytes([0xD2, op[1] >> 8])  # 8-bit tempo
+    if kind == 'loop_start':
+        return bytes([0xDB, op[1]])
+    if kind == 'loop_end':
+        return b'\xDC'
+    raise ValueError(f"Unknown op {kind}")
+
+
+def _snes_goto(pos: int, target: int) -> bytes:
+    # Absolute SPC RAM address
+    return b'\xDD' + struct.pack('<H', target + SNES_SPC_LOAD_ADDRESS)
+
+
+def build_snes_song(rng: random.Random, spec: FixtureSpec, song_id: int) -> bytes:
+    """SNES song data (without its length prefix): 8 voice pointers (SPC addresses), then the voices."""
+    if spec.voices > 8:
+        raise ValueError("SNES songs have at most 8 voices")
+    body_start = 0x10
+    bodies = bytearray()
+    pointers = [0] * 8  # Unused voices: pointer < 0x100
+    for v in range(spec.voices):
+        ops, loop_point = voice_ops(rng, spec)
+        start = body_start + len(bodies)
+        pointers[v] = start + SNES_SPC_LOAD_ADDRESS
+        bodies += _encode_voice(ops, loop_point, start, _snes_op, _snes_goto)
+    return struct.pack('<8H', *pointers) + bytes(bodies)
+
+
+def build_snes_rom(songs: List[bytes]) -> bytes:
+    """LoROM image holding the songs and the tables snes_config() points at."""
+    rom = bytearray(_SNES_SONGS)
+    oplen = [0] * 46
+    for opcode, (_, params) in SNES_OPCODES.items():
+        oplen[opcode - SNES_FIRST_OPCODE] = params
+    rom[_SNES_OPCODE_TABLE:_SNES_OPCODE_TABLE + 46] = bytes(oplen)
+    rom[_SNES_DURATION_TABLE:_SNES_DURATION_TABLE + len(SNES_DURATIONS)] = bytes(SNES_DURATIONS)
+
+    for i, song in enumerate(songs):
+        offset = len(rom)
+        if offset < _SNES_HEADER + 0x40 and offset + len(song) + 2 > _SNES_HEADER:
+            offset = _SNES_HEADER + 0x40  # Skip the internal header
+            rom += bytes(offset - len(rom))
+        rom[_SNES_POINTER_TABLE + i * 3:_SNES_POINTER_TABLE + i * 3 + 3] = struct.pack('<I', offset)[:3]
+        rom += struct.pack('<H', len(song)) + song
+
+    # Pad to whole KiB (an extra 512 bytes would be taken for an SMC header)
+    rom += bytes(max(_SNES_HEADER + 0x40, -(-len(rom) // 1024) * 1024) - len(rom))
+    header = bytearray(0x20)
+    header[0:21] = b'AKAO BENCHMARK'.ljust(21)
+    header[21] = 0x20  # LoROM
+    header[28:32] = struct.pack('<HH', 0x0000, 0xFFFF)  # Checksum and complement
+    rom[_SNES_HEADER:_SNES_HEADER + 0x20] = header
+    return bytes(rom)
+
+
+def snes_config(song_count: int) -> Dict:
+    """Config entries for a ROM from build_snes_rom()."""
+    return {
+        'base_address': 0x008000,
+        'song_pointer_table': {'style': 'offsets', 'offset': _SNES_POINTER_TABLE, 'count': song_count},
+        'spc_load_address': SNES_SPC_LOAD_ADDRESS,
+        'note_divisor': len(SNES_DURATIONS),
+        'first_opcode': SNES_FIRST_OPCODE,
+        'tie_note_value': TIE,
+        'rest_note_value': REST,
+        'opcodes': {opcode: {'semantic': semantic} for opcode, (semantic, _) in SNES_OPCODES.items()},
+        'opcode_table': {'address': 0x008000 + _SNES_OPCODE_TABLE, 'size': 46, 'type': 'byte'},
+        'duration_table': {'address': 0x008000 + _SNES_DURATION_TABLE,
+                           'size': len(SNES_DURATIONS), 'type': 'byte'},
+        'instrument_mapping': {'type': 'direct', 'param': 0},
+    }
+
+
+SONG_BUILDERS = {
+    'akao_newstyle': build_newstyle_song,
+    'akao_ff7': build_ff7_song,
+    'snes_unified': build_snes_song,
+}
+
+
+def build_songs(spec: FixtureSpec) -> List[bytes]:
+    """Build the spec's songs (deterministic for a given spec).
+
+    Raises:
+        ValueError: If the spec's format has no fixture builder
+    """
+    if spec.format not in SONG_BUILDERS:
+        raise ValueError(f"No fixtures for format {spec.format!r} (choose from {', '.join(SONG_BUILDERS)})")
+    rng = random.Random(spec.seed)
+    return [SONG_BUILDERS[spec.format](rng, spec, song_id) for song_id in range(spec.songs)]
+
+
+def write_game(spec: FixtureSpec, directory: Path) -> Tuple[Path, Optional[Path]]:
+    """Write a synthetic game (config plus AKAO files or ROM) to directory.
+
+    Returns:
+        Tuple of (config path, ROM path or None), as passed to SequenceExtractor
+    """
+    directory = Path(directory)
+    songs = build_songs(spec)
+    config: Dict = {
+        'game': f"Synthetic {spec.format} benchmark",
+        'format': spec.format,
+        'console_type': 'snes' if spec.format == 'snes_unified' else 'psx',
+        'patch_map': {i: {'gm_patch': i * 9 % 128} for i in range(INSTRUMENTS)},
+        'songs': [{'id': i, 'title': f"Song {i}", 'sector': 0} for i in range(len(songs))],
+    }
+
+    source = None
+    if spec.format == 'snes_unified':
+        config.update(snes_config(len(songs)))
+        source = directory / 'game.smc'
+        source.write_bytes(build_snes_rom(songs))
+    else:
+        akao_dir = directory / 'akao'
+        akao_dir.mkdir(parents=True, exist_ok=True)
+        config['akao_directory'] = str(akao_dir)
+        for song_id, song in enumerate(songs):
+            (akao_dir / f"{song_id:02x}.bin").write_bytes(song)
+
+    # JSON is valid YAML (keys are stringified; the profile loader converts them back)
+    config_path = directory / 'game.yaml'
+    config_path.write_text(json.dumps(config, indent=2))
+    return config_path, source
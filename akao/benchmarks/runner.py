@@ -0,0 +1,300 @@
+"""
+Benchmark runner: times each extraction stage on synthetic games and compares
+the results with a stored baseline.
+
+Stages (per song, in dependency order):
+    pass1   Pass 1 (parse_all_tracks)              events = IR events
+    loops   Loop analysis (analyze_song_structure) events = IR events
+    pass2   Pass 2 at MIDI length (MidiGenerator.render) events = MIDI events
+    txt     Text disassembly                        events = IR events
+    ir      IR dump                                 events = IR events
+    mid     Standard MIDI File (to memory)          events = MIDI events
+    xml     MusicXML (to memory, runs its own Pass 2) events = IR events
+
+The CLI's start-up overhead (extract_akao.py loading a small synthetic SNES game
+and extracting its one song, over the bare interpreter) is checked against a
+fixed budget.
+
+Throughput is the best of `repeat` runs, timed with the garbage collector
+disabled (as timeit does) so collections triggered by earlier stages don't
+land in later ones. Peak memory is measured in a
+separate run under tracemalloc (which slows everything down) as the peak
+allocated while the stage ran, above what was allocated before it.
+"""
+
+import gc
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+import contextlib
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from library import open_game
+from pipeline import SongPipeline
+
+from .fixtures import FixtureSpec, write_game
+
+
+STAGES = ('pass1', 'loops', 'pass2', 'txt', 'ir', 'mid', 'xml')
+
+# Scenario name -> synthetic game
+SCENARIOS: Dict[str, FixtureSpec] = {
+    'newstyle': FixtureSpec('akao_newstyle', voices=8, length=300, loop_depth=0, fade_density=0.05),
+    'newstyle-repeats': FixtureSpec('akao_newstyle', voices=4, length=100, loop_depth=1, fade_density=0.05),
+    'ff7': FixtureSpec('akao_ff7', voices=8, length=300, loop_depth=1, fade_density=0.05),
+    'ff7-fades': FixtureSpec('akao_ff7', voices=8, length=300, loop_depth=2, fade_density=0.3),
+    'snes': FixtureSpec('snes_unified', voices=8, length=300, loop_depth=1, fade_density=0.05),
+    'snes-nested': FixtureSpec('snes_unified', voices=8, length=300, loop_depth=3, fade_density=0.15),
+}
+
+BASELINE_FILE = Path(__file__).with_name('baseline.json')
+BASELINE_VERSION = 1
+
+# Default regression threshold: 25% fewer events/sec or 25% more peak memory
+DEFAULT_THRESHOLD = 0.25
+
+# Peak memory growth below this is noise, whatever the ratio
+MEMORY_SLACK_KIB = 64
+
+# Start-up overhead budget for the CLI on top of the bare interpreter (seconds)
+STARTUP_BUDGET = 0.1
+
+# Game for the start-up check: loading it dominates, the song itself is tiny
+STARTUP_GAME = FixtureSpec('snes_unified', voices=1, length=4, loop_depth=0, fade_density=0.0)
+
+AKAO_DIR = Path(__file__).resolve().parent.parent
+
+
+def _stage_calls(extractor, song, data: bytes) -> List[Tuple[str, Callable, Callable]]:
+    """(stage, run, event count) for each stage, sharing one fresh pipeline."""
+    pipeline = SongPipeline(extractor, song, '', data=data)
+    get = pipeline.get
+
+    def ir_events():
+        return sum(len(track['ir_events']) for track in get('tracks')['tracks'].values())
+
+    def midi_events():
+        tracks, conductor_events = get('midi_events')
+        return sum(len(track['events']) for track in tracks) + len(conductor_events)
+
+    return [
+        ('pass1', lambda: get('tracks'), ir_events),
+        ('loops', lambda: get('loops'), ir_events),
+        ('pass2', lambda: get('midi_events'), midi_events),
+        ('txt', lambda: extractor.disassemble_to_text(song, get('tracks')), ir_events),
+        ('ir', lambda: extractor.dump_ir_to_text(song, get('tracks'), get('loops')), ir_events),
+        ('mid', lambda: extractor.midi_generator.write_midi(io.BytesIO(), *get('midi_events')), midi_events),
+        ('xml', lambda: extractor.generate_musicxml(song, get('tracks'), get('loops'), io.StringIO(),
+                                                    compressed=False), ir_events),
+    ]
+
+
+def _run_stages(extractor, song, data: bytes, trace: bool = False) -> Dict[str, Tuple[float, int, int]]:
+    """Run every stage of one song once.
+
+    Returns:
+        Dict of stage -> (seconds, events, peak bytes; 0 unless trace)
+    """
+    results = {}
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for stage, run, count in _stage_calls(extractor, song, data):
+            if trace:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            run()
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - before if trace else 0
+            results[stage] = (seconds, count(), peak)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return results
+
+
+@contextlib.contextmanager
+def _profile_cache(directory: str):
+    """Keep the fixture's compiled profile out of the user's profile cache."""
+    saved = os.environ.get('AKAO_CACHE_DIR')
+    os.environ['AKAO_CACHE_DIR'] = directory
+    try:
+        yield
+    finally:
+        if saved is None:
+            del os.environ['AKAO_CACHE_DIR']
+        else:
+            os.environ['AKAO_CACHE_DIR'] = saved
+
+
+def run_scenario(spec: FixtureSpec, repeat: int = 5, memory: bool = True) -> Dict[str, Dict]:
+    """Benchmark every stage on a synthetic game.
+
+    Args:
+        spec: Synthetic game to build
+        repeat: Timed runs per song (the fastest counts)
+        memory: Also measure peak memory per stage (one more run, under tracemalloc)
+
+    Returns:
+        Dict of stage -> {'events', 'seconds', 'events_per_sec', 'peak_kib'}
+        (peak_kib is None without memory), summed over the game's songs
+    """
+    totals = {stage: {'events': 0, 'seconds': 0.0, 'peak_kib': 0.0 if memory else None} for stage in STAGES}
+
+    with tempfile.TemporaryDirectory() as tmp, _profile_cache(tmp), \
+            open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            contextlib.redirect_stderr(devnull):  # Loading messages and Pass 2 debug lines
+        config, source = write_game(spec, Path(tmp))
+        with open_game(str(config), str(source) if source else None) as game:
+            extractor = game.extractor
+            for song in game.songs:
+                data = extractor.extract_sequence_data(song)
+                runs = [_run_stages(extractor, song, data) for _ in range(max(1, repeat))]
+                for stage in STAGES:
+                    totals[stage]['events'] += runs[0][stage][1]
+                    totals[stage]['seconds'] += min(run[stage][0] for run in runs)
+
+                if memory:
+                    tracemalloc.start()
+                    try:
+                        traced = _run_stages(extractor, song, data, trace=True)
+                    finally:
+                        tracemalloc.stop()
+                    for stage in STAGES:
+                        totals[stage]['peak_kib'] = max(totals[stage]['peak_kib'], traced[stage][2] / 1024)
+
+    for result in totals.values():
+        result['events_per_sec'] = result['events'] / result['seconds'] if result['seconds'] else 0.0
+    return totals
+
+
+def run_benchmarks(names: Optional[List[str]] = None, repeat: int = 5, memory: bool = True) -> Dict[str, Dict]:
+    """Run scenarios by name (default: all of SCENARIOS), printing a line per stage.
+
+    Returns:
+        Dict of scenario -> run_scenario() result
+
+    Raises:
+        ValueError: If a scenario name is unknown
+    """
+    names = list(SCENARIOS) if names is None else names
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenario(s): {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    results = {}
+    for name in names:
+        spec = SCENARIOS[name]
+        print(f"{name}: {spec.format}, {spec.voices} voices x {spec.length} ops, "
+              f"loop depth {spec.loop_depth}, fade density {spec.fade_density}")
+        results[name] = run_scenario(spec, repeat=repeat, memory=memory)
+        for stage, result in results[name].items():
+            peak = f"  peak {result['peak_kib']:9.1f} KiB" if result['peak_kib'] is not None else ''
+            print(f"  {stage:<6} {result['events']:>8} events  {result['seconds'] * 1000:8.1f} ms  "
+                  f"{result['events_per_sec']:>12,.0f} events/s{peak}")
+    return results
+
+
+def _best_time(args: List[str], runs: int, cwd: Path) -> float:
+    """Fastest wall time of a few runs of the interpreter with args.
+
+    Raises:
+        subprocess.CalledProcessError: If a run fails (a failing CLI would look fast)
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def measure_startup(runs: int = 5) -> float:
+    """CLI start-up overhead in seconds, over a bare interpreter.
+
+    Times extract_akao.py extracting STARTUP_GAME's song to MIDI (forced, so
+    the build manifest doesn't skip it): importing the extractor, loading the
+    config, the handler and the ROM, and writing the output.
+    """
+    with tempfile.TemporaryDirectory() as tmp, _profile_cache(tmp):
+        config, source = write_game(STARTUP_GAME, Path(tmp))
+        command = [str(AKAO_DIR / 'extract_akao.py'), str(config), str(source), '--formats', 'mid', '--force']
+        return _best_time(command, runs, Path(tmp)) - _best_time(['-c', 'pass'], runs, Path(tmp))
+
+
+def load_baseline(path: Path = BASELINE_FILE) -> Dict[str, Dict]:
+    """Load stored results (scenario -> stage -> {'events_per_sec', 'peak_kib'}); {} if there are none."""
+    try:
+        with open(path) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError(f"{path}: baseline version {baseline.get('version')} (expected {BASELINE_VERSION}); "
+                         f"re-record it with --update-baseline")
+    return baseline['scenarios']
+
+
+def save_baseline(results: Dict[str, Dict], path: Path = BASELINE_FILE):
+    """Store results as the baseline, merged with the stored scenarios not run this time."""
+    scenarios = load_baseline(path)
+    for name, stages in results.items():
+        scenarios[name] = {stage: {'events_per_sec': round(result['events_per_sec'], 1),
+                                   'peak_kib': None if result['peak_kib'] is None else round(result['peak_kib'], 1)}
+                           for stage, result in stages.items()}
+    with open(path, 'w') as f:
+        json.dump({'version': BASELINE_VERSION, 'scenarios': scenarios}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Find stages that regressed against the baseline.
+
+    Args:
+        results: run_benchmarks() output
+        baseline: load_baseline() output
+        threshold: Allowed relative loss of events/sec and growth of peak memory
+
+    Returns:
+        One message per regression (empty if there are none); scenarios and
+        stages missing from the baseline are not compared
+    """
+    regressions = []
+    for name, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(name, {}).get(stage)
+            if base is None:
+                continue
+            if result['events_per_sec'] < base['events_per_sec'] * (1 - threshold):
+                regressions.append(f"{name} {stage}: {result['events_per_sec']:,.0f} events/s "
+                                   f"(baseline {base['events_per_sec']:,.0f})")
+            peak, base_peak = result['peak_kib'], base.get('peak_kib')
+            if peak is not None and base_peak is not None and \
+                    peak > base_peak * (1 + threshold) and peak - base_peak > MEMORY_SLACK_KIB:
+                regressions.append(f"{name} {stage}: peak {peak:,.1f} KiB (baseline {base_peak:,.1f} KiB)")
+    return regressions
+
+
+def over_budget(results: Dict[str, Dict], budget_mib: float) -> List[str]:
+    """Find stages whose peak memory exceeds a fixed budget, whatever the baseline.
+
+    Args:
+        results: run_benchmarks() output (with memory; stages without peak memory are skipped)
+        budget_mib: Peak memory budget per stage in MiB (the unit of extract_akao.py --memory-budget)
+
+    Returns:
+        One message per stage over the budget (empty if there are none)
+    """
+    budget_kib = budget_mib * 1024
+    return [f"{name} {stage}: peak {result['peak_kib']:,.1f} KiB (budget {budget_mib:,.1f} MiB)"
+            for name, stages in results.items() for stage, result in stages.items()
+            if result['peak_kib'] is not None and result['peak_kib'] > budget_kib]
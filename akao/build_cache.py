@@ -0,0 +1,256 @@
+"""
+Content-addressed build manifest for incremental extraction.
+
+The manifest (stored in the output directory) records, per song, a fingerprint
+of everything that affects its outputs:
+  - the raw sequence bytes
+  - the game config, excluding the song list and the patch maps
+  - the patch_map/patch_map_low entries the song actually references
+  - output options and the extractor version stamp
+Songs whose fingerprint is unchanged and whose outputs still exist are skipped.
+Outputs and the manifest itself are written atomically (temp file + rename).
+
+Each entry also keeps a decode fingerprint (everything except the patch maps)
+and the manifest keeps a digest per patch map entry, indexed by the songs that
+reference it. After a patch_map edit only the songs using a changed entry are
+re-rendered, and those with an IR cache skip Pass 1 (patches are resolved in
+Pass 2).
+"""
+
+import os
+import json
+import hashlib
+import contextlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from ir_events import IREventType
+
+
+MANIFEST_NAME = 'extract_manifest.json'
+MANIFEST_VERSION = 2
+
+# Config sections hashed per referenced instrument instead of as a whole
+PATCH_MAP_SECTIONS = ('patch_map', 'patch_map_low')
+
+# Config sections that never affect a single song's output
+IGNORED_SECTIONS = ('songs',)
+
+
+def _canonical(value) -> bytes:
+    """Stable JSON encoding used for hashing."""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def _int_key(key) -> Optional[int]:
+    """Normalize a patch map key (int or hex/decimal string) to int."""
+    if isinstance(key, int):
+        return key
+    try:
+        return int(str(key), 0)
+    except ValueError:
+        return None
+
+
+def referenced_instruments(track_data: Dict, patch_resolver=None) -> List[int]:
+    """Collect every instrument/patch number a parsed song can look up.
+
+    Includes raw instrument IDs and patch map slots from patch changes and
+    notes, the song's instrument and percussion tables (inst_table/dual_map
+    indirection) and, given a resolver, the GM patch numbers the slots resolve
+    to (used as PatchMapper keys in patch-based output).
+
+    Args:
+        track_data: Output from parse_all_tracks()
+        patch_resolver: Optional PatchResolver of the format handler
+
+    Returns:
+        Sorted list of instrument IDs
+    """
+    ids = {0}  # Out-of-range table lookups fall back to instrument 0
+    header = track_data.get('header', {})
+    slots = set()  # (patch_bank, patch_slot) pairs
+    ids.update(header.get('instrument_table') or [])
+    for entry in header.get('percussion_table') or []:
+        ids.add(entry['instrument_id'])
+
+    for track in track_data['tracks'].values():
+        for event in track['ir_events']:
+            if event.type == IREventType.PATCH_CHANGE:
+                ids.add(event.inst_id)
+                slots.add((event.patch_bank, event.patch_slot))
+            elif event.metadata:
+                ids.add(event.metadata.get('inst_id'))
+                if 'patch_slot' in event.metadata:
+                    slots.add((event.metadata['patch_bank'], event.metadata['patch_slot']))
+
+    ids.update(slot for _, slot in slots)
+    if patch_resolver is not None:
+        ids.update(patch_resolver.resolve(bank, slot)[0] for bank, slot in slots)
+
+    return sorted(i for i in ids if isinstance(i, int))
+
+
+def config_digest(config: Dict) -> str:
+    """Hash of all config sections that apply to every song."""
+    shared = {k: v for k, v in config.items()
+              if k not in PATCH_MAP_SECTIONS and k not in IGNORED_SECTIONS}
+    return hashlib.sha256(_canonical(shared)).hexdigest()
+
+
+def _patch_tables(config: Dict) -> List[Dict[int, Dict]]:
+    """The patch map sections of config, keyed by int instrument ID."""
+    return [{_int_key(k): v for k, v in (config.get(section) or {}).items()}
+            for section in PATCH_MAP_SECTIONS]
+
+
+def patch_digest(config: Dict, instruments: Iterable[int]) -> str:
+    """Hash of the patch map entries for the given instrument IDs."""
+    entries = [[[i, table.get(i)] for i in instruments] for table in _patch_tables(config)]
+    return hashlib.sha256(_canonical(entries)).hexdigest()
+
+
+def patch_entry_digests(config: Dict) -> Dict[str, str]:
+    """Short hash of each instrument's patch map entries, keyed by hex instrument ID."""
+    tables = _patch_tables(config)
+    instruments = sorted({i for table in tables for i in table if i is not None})
+    return {f"{i:02X}": hashlib.sha256(_canonical([table.get(i) for table in tables])).hexdigest()[:16]
+            for i in instruments}
+
+
+def song_fingerprint(sequence: bytes, song_entry: Dict, tables: Dict, config_hash: str,
+                     patches_hash: str, options: Dict, version: str) -> str:
+    """Combine all inputs of one song into a single fingerprint.
+
+    tables holds the ROM/executable tables the format handler reads for the
+    song besides its sequence data (see SequenceFormat.source_tables()).
+    """
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(sequence).digest())
+    for part in (song_entry, tables, config_hash, patches_hash, options, version):
+        h.update(_canonical(part))
+    return h.hexdigest()
+
+
+@contextlib.contextmanager
+def atomic_output(path: Path):
+    """Yield a temporary path for path's contents; rename it into place on success.
+
+    The temporary file lives in a private directory next to path and has the
+    same file name, so writers that derive anything from the name (e.g. the
+    .mxl suffix and inner score name) behave the same.
+    """
+    path = Path(path)
+    tmp_dir = path.parent / f".tmp{os.getpid()}"
+    tmp_dir.mkdir(exist_ok=True)
+    tmp = tmp_dir / path.name
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+        with contextlib.suppress(OSError):
+            tmp_dir.rmdir()
+
+
+class BuildManifest:
+    """Per-song fingerprints and outputs from previous runs."""
+
+    def __init__(self, output_root: Path, version: str):
+        """Load the manifest from output_root (if present).
+
+        Args:
+            output_root: Output directory containing the manifest
+            version: Extractor version stamp; a different stamp invalidates all entries
+        """
+        self.path = Path(output_root) / MANIFEST_NAME
+        self.output_root = Path(output_root)
+        self.version = version
+        self.songs: Dict[str, Dict] = {}
+        self.patch_entries: Dict[str, str] = {}  # Hex instrument ID -> patch_entry_digests() value
+        self.autosave = True  # Saved after each song; off in --jobs workers, where the parent saves
+
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('manifest_version') == MANIFEST_VERSION and data.get('extractor_version') == version:
+                    self.songs = data.get('songs', {})
+                    self.patch_entries = data.get('patch_entries', {})
+            except (OSError, ValueError):
+                # Unreadable manifest: rebuild everything
+                self.songs = {}
+                self.patch_entries = {}
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the recorded entry for a song, if any."""
+        return self.songs.get(key)
+
+    def is_up_to_date(self, key: str, fingerprint: str) -> bool:
+        """True if the song's fingerprint matches and all its outputs exist."""
+        entry = self.songs.get(key)
+        if entry is None or entry.get('fingerprint') != fingerprint:
+            return False
+        return all((self.output_root / rel).exists() for rel in entry.get('outputs', []))
+
+    def is_decoded(self, key: str, decode_fingerprint: str) -> bool:
+        """True if the song's Pass 1 inputs (all but the patch maps) are unchanged."""
+        entry = self.songs.get(key)
+        return entry is not None and entry.get('decode_fingerprint') == decode_fingerprint
+
+    def record(self, key: str, fingerprint: str, outputs: Iterable[Path], instruments: List[int],
+               decode_fingerprint: Optional[str] = None):
+        """Record a song's fingerprints, outputs and referenced instruments."""
+        self.songs[key] = {
+            'fingerprint': fingerprint,
+            'decode_fingerprint': decode_fingerprint,
+            'outputs': sorted(Path(os.path.relpath(p, self.output_root)).as_posix() for p in outputs),
+            'instruments': instruments,
+        }
+
+    def instrument_index(self) -> Dict[int, List[str]]:
+        """Map each referenced instrument ID to the keys of the songs using it."""
+        index: Dict[int, List[str]] = {}
+        for key in sorted(self.songs):
+            for inst_id in self.songs[key].get('instruments', []):
+                index.setdefault(inst_id, []).append(key)
+        return index
+
+    def songs_using(self, instruments: Iterable[int]) -> List[str]:
+        """Keys of the recorded songs that reference any of the given instruments."""
+        index = self.instrument_index()
+        return sorted({key for inst_id in instruments for key in index.get(inst_id, [])})
+
+    def changed_instruments(self, config: Dict) -> List[int]:
+        """Instrument IDs whose patch map entries differ from those of the last run."""
+        current = patch_entry_digests(config)
+        changed = {k for k in current.keys() | self.patch_entries.keys()
+                   if current.get(k) != self.patch_entries.get(k)}
+        return sorted(int(k, 16) for k in changed)
+
+    def record_patches(self, config: Dict):
+        """Remember the current patch map entries for changed_instruments()."""
+        self.patch_entries = patch_entry_digests(config)
+
+    def forget_outputs(self, outputs: Iterable[Path]):
+        """Drop the entries of songs with any of these outputs (e.g. failed writes)."""
+        missing = {Path(os.path.relpath(p, self.output_root)).as_posix() for p in outputs}
+        self.songs = {key: entry for key, entry in self.songs.items()
+                      if not missing.intersection(entry.get('outputs', []))}
+
+    def dumps(self) -> str:
+        """The manifest file contents."""
+        data = {
+            'manifest_version': MANIFEST_VERSION,
+            'extractor_version': self.version,
+            'songs': self.songs,
+            'patch_entries': self.patch_entries,
+        }
+        return json.dumps(data, indent=1, sort_keys=True)
+
+    def save(self):
+        """Write the manifest atomically."""
+        with atomic_output(self.path) as tmp:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(self.dumps())
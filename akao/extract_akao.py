@@ -8,14 +8,26 @@ Chris Bongaarts - 2025-11-02 with help from Claude
 import sys
 import traceback
 
-# Import the extractor
-from extractor import SequenceExtractor
+# The extractor and its backends are imported once the arguments are parsed,
+# and only those the command needs (see main())
 
 
 def main():
     """Main entry point."""
     # Parse command-line arguments
     patch_based_tracks = False
+    compressed_musicxml = False
+    debug_events = False
+    formats = None
+    force = False
+    from_ir = False
+    jobs = None
+    prefetch = 0
+    port = None  # Default: server.DEFAULT_PORT
+    report_file = None
+    trace_file = None
+    memprofile = False
+    memory_budget = None  # MiB
     song_id_filter = None
     args = []
 
@@ -24,6 +36,45 @@ def main():
         arg = sys.argv[1 + i]
         if arg == '--patch-based-tracks':
             patch_based_tracks = True
+        elif arg == '--mxl':
+            compressed_musicxml = True
+        elif arg == '--debug-events':
+            debug_events = True
+        elif arg == '--force':
+            force = True
+        elif arg == '--from-ir':
+            from_ir = True
+        elif arg == '--memprofile':
+            memprofile = True
+        elif arg == '--formats' and i + 1 < len(sys.argv[1:]):
+            # Next arg is a comma-separated list of output formats
+            formats = sys.argv[1 + i + 1]
+            i += 1  # Skip next arg
+        elif arg == '--jobs' and i + 1 < len(sys.argv[1:]):
+            # Next arg is the number of worker processes
+            jobs = int(sys.argv[1 + i + 1])
+            i += 1  # Skip next arg
+        elif arg == '--prefetch' and i + 1 < len(sys.argv[1:]):
+            # Next arg is the number of songs to read ahead
+            prefetch = int(sys.argv[1 + i + 1])
+            i += 1  # Skip next arg
+        elif arg == '--port' and i + 1 < len(sys.argv[1:]):
+            # Next arg is the extraction server's port
+            port = int(sys.argv[1 + i + 1])
+            i += 1  # Skip next arg
+        elif arg == '--report' and i + 1 < len(sys.argv[1:]):
+            # Next arg is the JSON run report file
+            report_file = sys.argv[1 + i + 1]
+            i += 1  # Skip next arg
+        elif arg == '--trace' and i + 1 < len(sys.argv[1:]):
+            # Next arg is the Chrome trace file
+            trace_file = sys.argv[1 + i + 1]
+            i += 1  # Skip next arg
+        elif arg == '--memory-budget' and i + 1 < len(sys.argv[1:]):
+            # Next arg is the per-song peak memory budget in MiB
+            memory_budget = float(sys.argv[1 + i + 1])
+            memprofile = True
+            i += 1  # Skip next arg
         elif arg == '--song' and i + 1 < len(sys.argv[1:]):
             # Next arg is the song ID
             song_id_filter = int(sys.argv[1 + i + 1], 0)  # Support hex with 0x prefix
@@ -32,34 +83,147 @@ def main():
             args.append(arg)
         i += 1
 
-    if len(args) < 2:
+    batch = len(args) == 2 and args[0] == 'batch'
+    server = len(args) == 1 and args[0] == 'serve'
+    client = len(args) in (2, 3) and args[0] == 'client'
+    if not (batch or server or client) and len(args) < (1 if from_ir else 2):
         print("Usage: python extract_akao.py <config.yaml> <source_file> [options]")
+        print("       python extract_akao.py <config.yaml> --from-ir [options]")
+        print("       python extract_akao.py batch <batch.yaml> [options]")
+        print("       python extract_akao.py serve [--port <n>]")
+        print("       python extract_akao.py client <config.yaml> <source_file> [options]")
         print()
         print("Arguments:")
         print("  config.yaml             - Game metadata configuration file")
         print("  source_file             - ISO/ROM file containing the game data")
+        print("  batch.yaml              - List of games (config, source, songs, output_dir) to")
+        print("                            extract through one worker pool (see batch.py)")
         print()
         print("Options:")
         print("  --patch-based-tracks    - Organize MIDI tracks by instrument/patch instead of sequence")
         print("  --song <id>             - Extract only the specified song ID (decimal or hex with 0x)")
+        print("  --mxl                   - Write compressed MusicXML (.mxl) instead of .musicxml")
+        print("  --debug-events          - Also write raw MIDI events to .events files (NDJSON)")
+        print("  --formats <list>        - Output formats to produce, comma-separated from")
+        print("                            txt,ir,ircache,mid,events,xml (default: txt,ir,mid,xml)")
+        print("                            ircache writes binary IR for later --from-ir runs")
+        print("  --force                 - Re-extract all songs, even if unchanged since the last run")
+        print("  --jobs <n>              - Extract songs in n worker processes (output and log order")
+        print("                            are the same as with one process)")
+        print("  --prefetch <k>          - Read the next k songs and write outputs on background")
+        print("                            threads, overlapping I/O with parsing (one process)")
+        print("  --from-ir               - Render ir/mid/events/xml from ircache/ files written by an")
+        print("                            earlier run, without reading the ROM/ISO")
+        print("  --port <n>              - Extraction server port for serve/client (default: 8765)")
+        print("  --report <file>         - Write per-song/per-voice stage timings and counters (IR and")
+        print("                            MIDI events, loop iterations, Pass 2 stops) as JSON")
+        print("  --trace <file>          - Write the stage timings as a Chrome trace (chrome://tracing")
+        print("                            or Perfetto), one timeline row per worker process")
+        print("  --memprofile            - Measure peak and retained memory per stage and song with")
+        print("                            tracemalloc (slow; not with --prefetch) and print the top")
+        print("                            allocation sites; included in --report/--trace output")
+        print("  --memory-budget <MiB>   - Warn about songs whose peak exceeds this (implies --memprofile)")
+        print()
+        print("serve keeps images, handlers and Pass 1 results loaded between requests; client")
+        print("sends it a render request (--song, --formats, --patch-based-tracks, --mxl and")
+        print("--debug-events apply) instead of extracting in a new process.")
         print()
         print("Examples:")
         print("  python extract_akao.py ff9.yaml ff9.iso")
         print("  python extract_akao.py ff8.yaml ff8.iso --patch-based-tracks")
         print("  python extract_akao.py ff3.yaml ff3.smc --song 0x0D")
+        print("  python extract_akao.py ff3.yaml ff3.smc --formats mid")
+        print("  python extract_akao.py ff9.yaml ff9.iso --jobs 8")
+        print("  python extract_akao.py ff9.yaml ff9.iso --jobs 8 --report run.json --trace run.trace.json")
+        print("  python extract_akao.py ff9.yaml ff9.iso --memprofile --memory-budget 64")
+        print("  python extract_akao.py batch test_songs.yaml --formats mid")
+        print("  python extract_akao.py client ff3.yaml ff3.smc --song 0x0D --formats mid")
+        print("  python extract_akao.py ff9.yaml ff9.iso --formats txt,ir,ircache,mid,xml")
+        print("  python extract_akao.py ff9.yaml --from-ir --formats mid")
         sys.exit(1)
 
+    if server:
+        from server import DEFAULT_PORT, serve
+        serve(port or DEFAULT_PORT)
+        return
+
+    if client:
+        args = args[1:]
+
     config_file = args[0]
-    source_file = args[1]
+    source_file = args[1] if len(args) > 1 else None
+
+    from pipeline import parse_formats
+    if formats is not None:
+        try:
+            formats = parse_formats(formats)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+    report = None
+    if report_file or trace_file or memprofile:
+        from run_report import RunReport
+        report = RunReport(memory=memprofile,
+                           memory_budget=None if memory_budget is None else int(memory_budget * 1024 * 1024))
+        if memprofile and prefetch:
+            print("WARNING: --prefetch reads songs on another thread; memory figures will mix stages")
+
+    if batch:
+        from batch import run_batch
+        try:
+            run_batch(args[1], jobs=jobs, formats=formats, force=force, report=report,
+                      patch_based_tracks=patch_based_tracks, compressed_musicxml=compressed_musicxml,
+                      debug_events=debug_events, from_ir=from_ir)
+        except Exception as e:
+            print(f"\nError: {e}")
+            traceback.print_exc()
+            sys.exit(1)
+        write_report(report, report_file, trace_file)
+        return
 
+    if client:
+        from server import DEFAULT_PORT, render_request, send_request
+        try:
+            result = send_request('/render', render_request(
+                config_file, source_file, song_id_filter, formats, patch_based_tracks=patch_based_tracks,
+                compressed_musicxml=compressed_musicxml, debug_events=debug_events), port=port or DEFAULT_PORT)
+        except (ConnectionError, RuntimeError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        sys.stdout.write(result['log'])
+        print(f"Rendered in {result['seconds']:.2f}s on the extraction server")
+        return
+
+    from extractor import SequenceExtractor
     try:
-        extractor = SequenceExtractor(config_file, source_file, patch_based_tracks=patch_based_tracks)
-        extractor.extract_all(song_id_filter=song_id_filter)
+        extractor = SequenceExtractor(config_file, source_file, patch_based_tracks=patch_based_tracks,
+                                      compressed_musicxml=compressed_musicxml,
+                                      debug_events=debug_events, from_ir=from_ir)
+        extractor.extract_all(song_id_filter=song_id_filter, formats=formats, force=force,
+                              jobs=jobs or 1, prefetch=prefetch, report=report)
     except Exception as e:
         print(f"\nError: {e}")
         print("\nFull traceback:")
         traceback.print_exc()
         sys.exit(1)
+    write_report(report, report_file, trace_file)
+
+
+def write_report(report, report_file, trace_file):
+    """Print the memory summary and write the run report and/or trace, if requested."""
+    if report is None:
+        return
+    if report.memory:
+        print()
+        for line in report.memory_summary():
+            print(line)
+    if report_file:
+        report.write(report_file)
+        print(f"Run report written to {report_file}")
+    if trace_file:
+        report.write_trace(trace_file)
+        print(f"Trace written to {trace_file}")
 
 
 if __name__ == '__main__':
@@ -3,44 +3,141 @@ Sequence extraction orchestrator.
 Handles ROM/ISO loading, format detection, song extraction, and batch processing.
 """
 
+import io
 import sys
+import time
 import struct
 import traceback
-import yaml
+import contextlib
 import re
 from pathlib import Path
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Dict, Iterator, Optional, TYPE_CHECKING
+from dataclasses import asdict
 from io import BytesIO
-import pycdlib.pycdlib as pycdlib_module
 
-# Import base classes
-from format_base import PatchMapper, SequenceFormat, SongMetadata
+# Import base classes (format handlers, pycdlib, multiprocessing and the
+# background I/O threads are imported on first use, so start-up only loads
+# what a run needs)
+from format_base import PatchMapper, SequenceFormat, SongMetadata, load_format_handler
+from game_profile import GameProfile, load_profile
 
-# Import format handlers
-from format_snes import SNESUnified
-from format_psx import AKAONewStyle, AKAOFF7, Raw2352FileWrapper
+if TYPE_CHECKING:
+    import pycdlib.pycdlib as pycdlib_module
+    from background_io import BackgroundWriter
 
 # Import output generators
+from build_cache import (BuildManifest, config_digest, patch_digest,
+                         referenced_instruments, song_fingerprint)
+from ir_cache import IRCacheFile
+from pipeline import DEFAULT_FORMATS, FORMAT_DIRS, IR_RENDER_FORMATS, SongPipeline, parse_formats
 from output_generators import (
     disassemble_to_text as disasm_to_text_func,
     dump_ir_to_text as dump_ir_func,
     MidiGenerator,
     MusicXmlGenerator
 )
+from scheduler import iter_song_events
+from seek_index import SeekIndex
+import run_report
+
+
+# Version stamp recorded in the build manifest. Bump when a code change alters
+# output for unchanged inputs, so the next run regenerates every song.
+EXTRACTOR_VERSION = '2025.11.5'
+
+# State shared with --jobs worker processes, inherited copy-on-write at fork:
+# (extractor, songs, sequence data per song, formats, output_root, manifest, force)
+_worker_state: Optional[Tuple] = None
+
+
+def extract_song_captured(extractor, song: SongMetadata, formats, output_root: Path,
+                          manifest: Optional[BuildManifest] = None, force: bool = False,
+                          data: Optional[bytes] = None, image_lock=None) -> Dict:
+    """Run extractor.process_song() with its log captured, for worker processes.
+
+    stdout and stderr (warnings, debug output) go into the same log, so the
+    caller replays them in the order the song wrote them.
+
+    Args:
+        extractor: SequenceExtractor the song belongs to
+        song: Song metadata
+        formats: Output format names
+        output_root: Directory containing the txt/, mid/ and xml/ folders
+        manifest: Optional build manifest (not saved; the caller merges 'entry')
+        force: Re-extract even if the manifest says the song is up to date
+        data: Raw sequence data, if already read
+        image_lock: Lock (or semaphore) held while reading the sequence data
+            from the image, if data is None
+
+    Returns:
+        Dict with the song's captured log ('log'), 'status' (ok, skipped or
+        error), 'seconds', its run report spans ('spans', empty without an
+        active report) and, with a manifest, its new manifest entry ('entry')
+    """
+    report = run_report.active()
+    mark = report.mark() if report is not None else 0
+    log = io.StringIO()
+    start = time.perf_counter()
+    status = 'ok'
+    with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            if data is None and image_lock is not None and not extractor.from_ir:
+                with image_lock:
+                    data = extractor.read_sequence(song)
+            written = extractor.process_song(song, formats, output_root, manifest=manifest,
+                                             force=force, data=data)
+            if not written:
+                status = 'skipped'
+        except Exception as e:
+            print(f"  ERROR: {e} {traceback.format_exc()}")
+            status = 'error'
+    return {
+        'log': log.getvalue(),
+        'status': status,
+        'seconds': time.perf_counter() - start,
+        'spans': report.since(mark) if report is not None else [],
+        'entry': manifest.get(f"{song.id:02X}") if manifest is not None else None,
+    }
+
+
+def _extract_song_worker(index: int) -> Dict:
+    """Extract songs[index] of _worker_state in a worker process."""
+    extractor, songs, sequences, formats, output_root, manifest, force = _worker_state
+    return extract_song_captured(extractor, songs[index], formats, output_root, manifest, force,
+                                 data=sequences[index])
 
 
 class SequenceExtractor:
     """Main extractor class."""
 
-    def __init__(self, config_path: str, source_file: str, patch_based_tracks: bool = False):
-        """Initialize with YAML config file and source ISO/ROM file."""
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+    def __init__(self, config_path: str, source_file: Optional[str], patch_based_tracks: bool = False,
+                 compressed_musicxml: bool = False, debug_events: bool = False, from_ir: bool = False):
+        """Initialize with YAML config file and source ISO/ROM file.
+
+        Args:
+            config_path: Path to game YAML config
+            source_file: ISO/ROM file containing the game data (unused with from_ir)
+            patch_based_tracks: Organize MIDI tracks by patch instead of sequence voice
+            compressed_musicxml: Write compressed .mxl instead of plain .musicxml
+            debug_events: Also write raw MIDI events to .events (NDJSON) files
+            from_ir: Render from binary IR caches (ircache/) written by a previous
+                run instead of reading the ROM/ISO and running Pass 1
+        """
+        # Validated, normalized config (from the profile cache unless the YAML changed)
+        self.profile: GameProfile = load_profile(config_path)
+        self.config = self.profile.config
 
         self.source_file = source_file
-        self.console_type = self.config.get('console_type', 'psx')
-        self.output_dir = Path(self.config.get('output_dir', 'output'))
+        self.console_type = self.profile.console_type
+        self.output_dir = Path(self.config.get('output_dir', '.'))  # Contains the txt/, mid/ and xml/ folders
         self.patch_based_tracks = patch_based_tracks  # Organize by patch instead of sequence track
+        self.musicxml_ext = '.mxl' if compressed_musicxml else '.musicxml'
+        self.debug_events = debug_events  # Include .events in the default output formats
+        self._config_hash: Optional[str] = None  # Build manifest digest of shared config sections
+        self.from_ir = from_ir  # Render from IR caches; no ROM/ISO access
+        self.seek_indexes: Dict[str, SeekIndex] = {}  # Output basename -> Pass 2 checkpoints
+        self.song_times: Dict[str, float] = {}  # Hex song ID -> seconds spent in a --jobs worker
+        self.writer: Optional['BackgroundWriter'] = None  # Moves outputs into place in --prefetch mode
 
         # Initialize patch mapper
         patch_map_config = self.config.get('patch_map', {})
@@ -51,12 +148,19 @@ class SequenceExtractor:
         self._img_file_cache = {}  # Cache of open file handles for large IMG files
 
         # Handle SNES ROMs differently from PSX ISOs
-        self.iso: Optional[pycdlib_module.PyCdlib]
+        self.iso: Optional['pycdlib_module.PyCdlib']
         self.sector_size: Optional[int]
         self.raw_sector_size: Optional[int]
 
+        if from_ir:
+            # Rendering from IR caches: nothing to load
+            self.iso = None
+            self.sector_size = None
+            self.raw_sector_size = None
+            self.rom_data = b''
+            print("Rendering from IR cache files (ROM/ISO not used)")
         # Check for directory-based loading (FF7 pre-extracted files)
-        if 'akao_directory' in self.config:
+        elif 'akao_directory' in self.config:
             # Directory-based: No ISO/ROM loading needed
             self.iso = None
             self.sector_size = None
@@ -81,10 +185,12 @@ class SequenceExtractor:
             self.raw_sector_size = self.sector_size
 
             # Open the ISO with pycdlib
+            import pycdlib.pycdlib as pycdlib_module
             self.iso = pycdlib_module.PyCdlib()
 
             if self.sector_size == 2352:
                 # Use our wrapper for on-the-fly conversion
+                from format_psx import Raw2352FileWrapper
                 print("Opening raw CD-ROM image with on-the-fly conversion...")
                 self._raw_wrapper = Raw2352FileWrapper(source_file)
                 self.iso.open_fp(self._raw_wrapper)
@@ -96,22 +202,41 @@ class SequenceExtractor:
             # This will set _exe_file_handle as a side effect
             self.rom_data: bytes = self._load_executable()
 
-        # Create format handler with ROM data
-        format_name = self.config.get('format', 'akao_newstyle')
+        # Create format handler with ROM data (only the configured handler is imported)
+        self.format_name = self.profile.format
+        handler_class = load_format_handler(self.format_name)
         self.format_handler: SequenceFormat
-        if format_name == 'akao_newstyle':
-            self.format_handler = AKAONewStyle(self.config, self.rom_data, exe_iso_reader=self)
-        elif format_name == 'akao_ff7':
-            self.format_handler = AKAOFF7(self.config, self.rom_data, exe_iso_reader=self)
-        elif format_name == 'snes_unified':
-            self.format_handler = SNESUnified(self.config, self.rom_data)
+        if from_ir:
+            # Pass 2 only: skip the ROM tables the handlers normally read
+            self.format_handler = handler_class.for_rendering(self.config)
+        elif self.format_name == 'snes_unified':
+            self.format_handler = handler_class(self.config, self.rom_data, tables=self.profile.handler_tables)
         else:
-            raise ValueError(f"Unknown format: {format_name}")
+            self.format_handler = handler_class(self.config, self.rom_data, exe_iso_reader=self)
 
         # Initialize output generators
-        self.midi_generator = MidiGenerator(self.format_handler, self.patch_mapper, self.patch_based_tracks)
+        self.midi_generator = MidiGenerator(self.format_handler, self.patch_mapper, self.patch_based_tracks,
+                                            debug_events=debug_events,
+                                            loop_mode=self.config.get('midi_render', {}).get('loop_mode', 'unroll'))
         self.musicxml_generator = MusicXmlGenerator(self.format_handler, self.patch_mapper, self.patch_based_tracks)
 
+    def reload_patch_maps(self, profile: GameProfile):
+        """Switch to an edited config whose only changes are in the patch maps (or song list).
+
+        The image, ROM tables and Pass 1 results stay valid: the IR keeps patch
+        map slots, which are resolved against the new maps in Pass 2.
+
+        Args:
+            profile: The edited game config's profile
+        """
+        self.profile = profile
+        config = self.config = profile.config
+        self.format_handler.config = config
+        self.format_handler._init_render_state(config)
+        self.patch_mapper = PatchMapper(config.get('patch_map', {}))
+        self.midi_generator.patch_mapper = self.patch_mapper
+        self.musicxml_generator.patch_mapper = self.patch_mapper
+
     def _load_executable(self) -> bytes:
         """Load the console executable from the disc image."""
         if self.console_type == 'psx':
@@ -364,6 +489,14 @@ class SequenceExtractor:
                 f.seek(offset)
                 return f.read(song.length)
 
+    def read_sequence(self, song: SongMetadata) -> bytes:
+        """extract_sequence_data(), timed as a 'read' span of the active run report.
+
+        For reads ahead of or outside a SongPipeline (--jobs, --prefetch, batch).
+        """
+        with run_report.span('read', song=self.output_basename(song)):
+            return self.extract_sequence_data(song)
+
     def parse_all_tracks(self, song: SongMetadata, data: bytes, use_alternate_pointers: bool = False) -> Optional[Dict]:
         """Parse all tracks for a song (Pass 1) and return IR events + disassembly.
 
@@ -392,7 +525,8 @@ class SequenceExtractor:
         """
         # Parse header (pass song_id for FF3, and use_alternate_pointers flag)
         # parse_header() now returns track_offsets for all formats
-        header = self.format_handler.parse_header(data, song.id, use_alternate_pointers)
+        with run_report.span('header'):
+            header = self.format_handler.parse_header(data, song.id, use_alternate_pointers)
         track_offsets = header.get('track_offsets', [])
 
         # Check if song has any valid tracks
@@ -403,7 +537,7 @@ class SequenceExtractor:
 
         # Read instrument table for SNES formats
         instrument_table = None
-        if isinstance(self.format_handler, SNESUnified):
+        if self.format_name == 'snes_unified':
             # SNESUnified: check if instrument_table is in header (FF3/SoM style) or needs to be read (FF2 style)
             instrument_table = header.get('instrument_table')
             if instrument_table is None:
@@ -412,7 +546,7 @@ class SequenceExtractor:
 
         # Read percussion table for SNES formats (CT/FF3-specific)
         percussion_table = None
-        if isinstance(self.format_handler, SNESUnified):
+        if self.format_name == 'snes_unified':
             # Check if percussion_table is in header (FF3/CT style) or needs to be read
             percussion_table = header.get('percussion_table')
             if percussion_table is None and self.format_handler.percussion_table_offset is not None:
@@ -427,11 +561,13 @@ class SequenceExtractor:
         for voice_num, offset in enumerate(track_offsets):
             # Call _parse_track_pass1 to get disassembly and IR events
             # Returns: (disasm_lines, ir_events)
-            disasm_lines, ir_events = self.format_handler._parse_track_pass1(
-                data, offset, voice_num, instrument_table or [], vaddroffset,
-                track_boundaries=header.get('track_boundaries'),
-                percussion_table=percussion_table
-            )
+            with run_report.span('pass1', voice=voice_num):
+                disasm_lines, ir_events = self.format_handler._parse_track_pass1(
+                    data, offset, voice_num, instrument_table or [], vaddroffset,
+                    track_boundaries=header.get('track_boundaries'),
+                    percussion_table=percussion_table
+                )
+                run_report.count('ir_events', len(ir_events))
 
             tracks[voice_num] = {
                 'offset': offset,
@@ -511,134 +647,479 @@ class SequenceExtractor:
         """Generate MIDI file from sequence with patch mapping support."""
         self.midi_generator.generate(song, track_data, loop_analysis, output_path)
 
-    def generate_musicxml(self, song: SongMetadata, track_data: Dict, loop_analysis: Dict, output_path: Path):
-        """Generate MusicXML from sequence data."""
-        self.musicxml_generator.generate(song, track_data, loop_analysis, output_path)
+    def generate_musicxml(self, song: SongMetadata, track_data: Dict, loop_analysis: Dict, output_path,
+                          compressed: Optional[bool] = None):
+        """Generate MusicXML from sequence data (to a path or file object)."""
+        self.musicxml_generator.generate(song, track_data, loop_analysis, output_path, compressed)
+
+    def iter_events(self, song: SongMetadata, voice: Optional[int] = None,
+                    until_tick: Optional[int] = None, output_root: Path = Path('.'),
+                    start_tick: int = 0) -> Iterator[Dict]:
+        """Stream a song's MIDI events as Pass 2 produces them.
+
+        Loops are followed indefinitely and events are handed out as soon as
+        they are final, so a player can start after the first few bars. For a
+        looping song the stream only ends at until_tick or when the consumer
+        stops iterating; memory stays bounded either way. In from_ir mode the
+        tracks are read from the song's IR cache.
 
-    def extract_all(self, song_id_filter=None):
-        """Extract all songs defined in config.
+        With start_tick, the song is fast-forwarded to the window start without
+        emitting events; the latest tempo, program and controller settings are
+        re-emitted at start_tick. Interpreter checkpoints are kept in the
+        song's seek index (see seek_index()), so later windows of the same song
+        resume from the nearest checkpoint.
 
         Args:
-            song_id_filter: If specified, only extract this song ID
+            song: Song metadata
+            voice: Voice to render on its own (events in generation order), or
+                None for all voices merged in time order (tagged with 'voice')
+            until_tick: Stop before this time in MIDI ticks (None = no limit)
+            output_root: Directory containing the ircache/ folder (from_ir only)
+            start_tick: First MIDI tick to emit (96 ticks per quarter note)
+
+        Yields:
+            MIDI event dictionaries
         """
-        songs = [SongMetadata(**s) for s in self.config.get('songs', [])]
+        pipeline = SongPipeline(self, song, self.output_basename(song), output_root)
+        if self.from_ir:
+            with IRCacheFile(pipeline.output_path('ircache')) as cache:
+                pipeline.preload(tracks=cache.track_data(), loops=cache.loop_analysis())
+        if pipeline.is_empty():
+            return
+
+        # Embed loop_info in track_data for Pass 2
+        track_data = pipeline.get('tracks')
+        loop_analysis = pipeline.get('loops')
+        for voice_num, track in track_data['tracks'].items():
+            track['loop_info'] = loop_analysis['tracks'][voice_num]['loop_info']
 
-        # Apply song ID filter if specified
-        if song_id_filter is not None:
-            songs = [s for s in songs if s.id == song_id_filter]
-            if not songs:
-                print(f"WARNING: Song ID {song_id_filter:02X} not found in config")
-                return
+        seek_index = self.seek_index(song)
+        if voice is None:
+            windows = seek_index.windows(sorted(track_data['tracks']), start_tick, until_tick)
+            yield from iter_song_events(self.format_handler, track_data, endless=True, windows=windows)
+            return
 
-        # Create output directories
-        text_dir = Path('txt')
-        midi_dir = Path('mid')
-        xml_dir = Path('xml')
-        text_dir.mkdir(exist_ok=True)
-        midi_dir.mkdir(exist_ok=True)
-        xml_dir.mkdir(exist_ok=True)
+        window = seek_index.window(voice, start_tick, until_tick)
+        for _, events in self.format_handler._iter_track_pass2(track_data, voice, endless=True, window=window):
+            yield from events
 
-        for song in songs:
-            # Use title if provided, otherwise fall back to AKAO ID
-            if hasattr(song, 'title') and song.title:
-                # Always prepend ID for consistency
-                filename = f"{song.id:02X} {song.title}"
-            else:
-                # No title, use AKAO ID
-                filename = f"AKAO_{song.id:02X}"
+    def seek_index(self, song: SongMetadata) -> SeekIndex:
+        """Pass 2 checkpoints of a song, shared by all iter_events() calls for it.
+
+        The index can be saved with SeekIndex.save() and reloaded into
+        seek_indexes (keyed by output_basename()) by a later run.
+        """
+        key = self.output_basename(song)
+        if key not in self.seek_indexes:
+            self.seek_indexes[key] = SeekIndex()
+        return self.seek_indexes[key]
+
+    def output_basename(self, song: SongMetadata, alternate: bool = False) -> str:
+        """Sanitized output filename (without extension) for a song.
+
+        Args:
+            song: Song metadata
+            alternate: If True, name the alternate voice pointer version (FF3)
+        """
+        suffix = 'alt' if alternate else ''
+        # Use title if provided, otherwise fall back to AKAO ID
+        if hasattr(song, 'title') and song.title:
+            # Always prepend ID for consistency
+            filename = f"{song.id:02X}{suffix} {song.title}"
+        else:
+            # No title, use AKAO ID
+            filename = f"AKAO_{song.id:02X}{suffix}"
+
+        # Sanitize filename for Windows/cross-platform compatibility
+        # Replace characters that are invalid in Windows filenames
+        invalid_chars = '<>:"/\\|?*'
+        for char in invalid_chars:
+            filename = filename.replace(char, '_')
+        return filename
+
+    def process_song(self, song: SongMetadata, formats=DEFAULT_FORMATS, output_root: Path = Path('.'),
+                     manifest: Optional[BuildManifest] = None, force: bool = False,
+                     data: Optional[bytes] = None) -> List[Path]:
+        """Extract one song (and its alternate version, if any) to the requested formats.
+
+        Only the pipeline stages needed by the requested formats are run. With a
+        manifest, the song is skipped if its inputs are unchanged since the last
+        run and its outputs still exist. If only its patch map entries changed
+        and it has an IR cache (ircache format, no txt), it is re-rendered from
+        the cache without re-running Pass 1.
 
-            # Sanitize filename for Windows/cross-platform compatibility
-            # Replace characters that are invalid in Windows filenames
-            invalid_chars = '<>:"/\\|?*'
-            for char in invalid_chars:
-                filename = filename.replace(char, '_')
+        Args:
+            song: Song metadata
+            formats: Output format names (see pipeline.OUTPUT_FORMATS)
+            output_root: Directory containing the txt/, mid/ and xml/ folders
+            manifest: Optional build manifest for incremental extraction
+            force: Re-extract even if the manifest says the song is up to date
+            data: Raw sequence data, if already extracted
 
-            print(f"Processing: {filename}")
+        Returns:
+            Paths of the files written (empty if skipped)
+        """
+        filename = self.output_basename(song)
+        print(f"Processing: {filename}")
+
+        if self.from_ir:
+            return self._render_from_ir(song, formats, output_root)
+
+        pipeline = SongPipeline(self, song, filename, output_root, data=data, writer=self.writer)
+        song_key = f"{song.id:02X}"
+        patches_only = False  # Only patch map entries changed since the last run
+
+        if manifest is not None:
+            previous = manifest.get(song_key)
+            if previous is not None and not force:
+                fingerprint = self._song_fingerprint(song, pipeline.get('sequence'),
+                                                     previous.get('instruments', []), formats)
+                if manifest.is_up_to_date(song_key, fingerprint):
+                    print(f"  SKIP: {filename} (unchanged)")
+                    return []
+                # The IR does not depend on the patch maps, so a cached IR is still valid
+                patches_only = ('ircache' in formats and 'txt' not in formats
+                                and pipeline.output_path('ircache').exists()
+                                and manifest.is_decoded(song_key, self._song_fingerprint(
+                                    song, pipeline.get('sequence'), None, formats)))
+
+        written: List[Path] = []
+        instruments: set = set()
+
+        if patches_only:
+            print("  Patch map changed; rendering from IR cache")
+            written.extend(self._render_from_ir(song, formats, output_root, instruments))
+        # Check if song is empty (no valid voice pointers)
+        elif pipeline.is_empty():
+            if 'txt' in formats:
+                # Generate minimal stub file
+                stub_output = f"Song {song.id:02X}: {song.title}\n\n  [Empty song - no valid voice data]\n"
+                text_file = pipeline.output_path('txt')
+                with pipeline.output(text_file) as tmp:
+                    tmp.write_text(stub_output)
+                written.append(text_file)
+            print(f"  SKIP: {song.title} (no valid voice data)")
+        else:
+            written.extend(pipeline.run(formats))
+            instruments.update(referenced_instruments(pipeline.get('tracks'), self.format_handler.patch_resolver))
+            print(f"  OK: Generated {', '.join(path.name for path in written)}")
+
+            # Check if song has alternate voice pointers (FF3 feature)
+            if pipeline.get('tracks')['header'].get('has_alternate_pointers', False):
+                alt_filename = self.output_basename(song, alternate=True)
+                print(f"  Processing alternate version: {alt_filename}")
+
+                # Re-parse with alternate pointers (sequence data is shared)
+                alt_pipeline = SongPipeline(self, song, alt_filename, output_root, data=pipeline.get('sequence'),
+                                            use_alternate_pointers=True, writer=self.writer)
+
+                # Skip if alternate version is also empty
+                if alt_pipeline.is_empty():
+                    print(f"  SKIP: {alt_filename} (no valid voice data)")
+                else:
+                    written.extend(alt_pipeline.run(formats))
+                    instruments.update(referenced_instruments(alt_pipeline.get('tracks'),
+                                                              self.format_handler.patch_resolver))
+                    print(f"  OK: Generated alternate files for {alt_filename}")
+
+        if manifest is not None:
+            instrument_list = sorted(instruments)
+            fingerprint = self._song_fingerprint(song, pipeline.get('sequence'), instrument_list, formats)
+            decode_fingerprint = self._song_fingerprint(song, pipeline.get('sequence'), None, formats)
+            manifest.record(song_key, fingerprint, written, instrument_list, decode_fingerprint)
+            if manifest.autosave:
+                manifest.save()
+
+        return written
+
+    def _extract_parallel(self, songs: List[SongMetadata], formats, output_root: Path,
+                          manifest: Optional[BuildManifest], force: bool, jobs: int):
+        """Extract songs in forked worker processes.
+
+        The loaded image, format handler and tables are inherited by the
+        workers copy-on-write. Song bytes are read here first, since the
+        workers would otherwise share the ISO file position. Each worker's log
+        is captured and printed in song order, and its manifest entry is merged
+        and saved here, so output and log are the same as a one-process run.
+
+        Args:
+            songs: Songs to extract
+            formats: Output format names
+            output_root: Directory containing the txt/, mid/ and xml/ folders
+            manifest: Optional build manifest for incremental extraction
+            force: Re-extract even if the manifest says a song is up to date
+            jobs: Number of worker processes
+        """
+        global _worker_state
 
+        report = run_report.active()
+        read = self.extract_sequence_data if report is None else self.read_sequence
+        sequences: List[Optional[bytes]] = []
+        for song in songs:
             try:
-                # Extract data
-                data = self.extract_sequence_data(song)
-
-                # Parse all tracks once (Pass 1)
-                track_data = self.parse_all_tracks(song, data)
-
-                # Check if song is empty (no valid voice pointers)
-                if track_data is None:
-                    # Generate minimal stub file
-                    stub_output = f"Song {song.id:02X}: {song.title}\n\n  [Empty song - no valid voice data]\n"
-                    text_file = text_dir / f"{filename}.txt"
-                    text_file.write_text(stub_output)
-                    print(f"  SKIP: {song.title} (no valid voice data)")
-                    continue
-
-                # Analyze loop structure
-                loop_analysis = self.analyze_song_structure(track_data)
-
-                # Generate text disassembly
-                text_output = self.disassemble_to_text(song, track_data)
-                text_file = text_dir / f"{filename}.txt"
-                text_file.write_text(text_output)
-
-                # Generate IR dump
-                ir_output = self.dump_ir_to_text(song, track_data, loop_analysis)
-                ir_file = text_dir / f"{filename}.ir"
-                ir_file.write_text(ir_output)
-
-                # Generate MIDI
-                midi_file = midi_dir / f"{filename}.mid"
-                self.generate_midi(song, track_data, loop_analysis, midi_file)
-
-                # Generate MusicXML
-                xml_file = xml_dir / f"{filename}.musicxml"
-                self.generate_musicxml(song, track_data, loop_analysis, xml_file)
-
-                print(f"  OK: Generated {text_file.name}, {ir_file.name}, {midi_file.name}, and {xml_file.name}")
-
-                # Check if song has alternate voice pointers (FF3 feature)
-                if track_data['header'].get('has_alternate_pointers', False):
-                    # Generate alternate filename (insert "alt" after song ID)
-                    if hasattr(song, 'title') and song.title:
-                        alt_filename = f"{song.id:02X}alt {song.title}"
-                    else:
-                        alt_filename = f"AKAO_{song.id:02X}alt"
+                sequences.append(None if self.from_ir else read(song))
+            except Exception:
+                sequences.append(None)  # Reported when the worker retries the read
+        if self._config_hash is None:
+            self._config_hash = config_digest(self.config)
+
+        if manifest is not None:
+            manifest.autosave = False
+        _worker_state = (self, songs, sequences, formats, output_root, manifest, force)
+        start = time.perf_counter()
+        counts = {'ok': 0, 'skipped': 0, 'error': 0}
+        song_time = 0.0  # Sum of the per-song times, for comparison with the wall time
+        import multiprocessing
+        try:
+            with multiprocessing.get_context('fork').Pool(min(jobs, len(songs))) as pool:
+                for song, result in zip(songs, pool.imap(_extract_song_worker, range(len(songs)))):
+                    sys.stdout.write(result['log'])
+                    sys.stdout.flush()
+                    counts[result['status']] += 1
+                    self.song_times[f"{song.id:02X}"] = result['seconds']
+                    song_time += result['seconds']
+                    if report is not None:
+                        report.merge(result['spans'])
+                    if result['entry'] is not None:
+                        manifest.songs[f"{song.id:02X}"] = result['entry']
+                        manifest.save()
+        finally:
+            _worker_state = None
+            if manifest is not None:
+                manifest.autosave = True
+
+        print(f"Extracted {len(songs)} songs with {min(jobs, len(songs))} jobs in "
+              f"{time.perf_counter() - start:.1f}s ({counts['ok']} ok, {counts['skipped']} skipped, "
+              f"{counts['error']} failed; {song_time:.1f}s of song time)")
+
+    def _extract_pipelined(self, songs: List[SongMetadata], formats, output_root: Path,
+                           manifest: Optional[BuildManifest], force: bool, prefetch: int):
+        """Extract songs on this thread, with image reads and output writes in the background.
+
+        A reader thread fetches the next `prefetch` songs' sequence data while
+        the current song is parsed and rendered, and output files are moved
+        into place by a writer thread (with a bounded queue). The manifest is
+        queued behind each song's outputs, so it never lists a file before the
+        file is written.
 
-                    # Sanitize filename (same as standard version)
-                    for char in invalid_chars:
-                        alt_filename = alt_filename.replace(char, '_')
+        Args:
+            songs: Songs to extract
+            formats: Output format names
+            output_root: Directory containing the txt/, mid/ and xml/ folders
+            manifest: Optional build manifest for incremental extraction
+            force: Re-extract even if the manifest says a song is up to date
+            prefetch: Number of songs read ahead
+        """
+        from background_io import BackgroundWriter, SongPrefetcher
 
-                    print(f"  Processing alternate version: {alt_filename}")
+        read = (lambda song: None) if self.from_ir else self.read_sequence
+        if manifest is not None:
+            manifest.autosave = False
+        self.writer = BackgroundWriter()
+        try:
+            with SongPrefetcher(read, songs, prefetch) as prefetcher:
+                for song, data, error in prefetcher:
+                    try:
+                        if error is not None:
+                            print(f"Processing: {self.output_basename(song)}")
+                            raise error
+                        self.process_song(song, formats, output_root, manifest=manifest, force=force, data=data)
+                    except Exception as e:
+                        print(f"  ERROR: {e} {traceback.format_exc()}")
+                    if manifest is not None:
+                        self.writer.write_text(manifest.path, manifest.dumps(), skip_after_error=True)
+        finally:
+            self.writer.close()
+            errors = self.writer.errors
+            self.writer = None
+            if manifest is not None:
+                manifest.autosave = True
+
+        for path, message in errors:
+            print(f"  ERROR: could not write {path}: {message}")
+        if errors and manifest is not None:
+            # Extract those songs again next time
+            manifest.forget_outputs(path for path, _ in errors)
+            manifest.save()
+
+    def _render_from_ir(self, song: SongMetadata, formats, output_root: Path,
+                        instruments: Optional[set] = None) -> List[Path]:
+        """Render a song (and its alternate version, if cached) from its IR cache files.
 
-                    # Re-parse with alternate pointers
-                    alt_track_data = self.parse_all_tracks(song, data, use_alternate_pointers=True)
+        Args:
+            song: Song metadata
+            formats: Output format names (any of pipeline.IR_RENDER_FORMATS, plus
+                ircache, which keeps the existing cache file)
+            output_root: Directory containing the ircache/, txt/, mid/ and xml/ folders
+            instruments: Optional set updated with the instruments the song references
 
-                    # Skip if alternate version is also empty
-                    if alt_track_data is None:
-                        print(f"  SKIP: {alt_filename} (no valid voice data)")
-                    else:
-                        alt_loop_analysis = self.analyze_song_structure(alt_track_data)
+        Returns:
+            Paths of the files written (and kept IR cache files)
+        """
+        render_formats = [fmt for fmt in formats if fmt != 'ircache']
+        written: List[Path] = []
+        for alternate in (False, True):
+            filename = self.output_basename(song, alternate)
+            pipeline = SongPipeline(self, song, filename, output_root, writer=self.writer)
+            cache_path = pipeline.output_path('ircache')
+            if not cache_path.exists():
+                # Empty songs and songs without alternate pointers have no cache file
+                if not alternate:
+                    print(f"  SKIP: {filename} (no IR cache)")
+                continue
+
+            with IRCacheFile(cache_path) as cache:
+                pipeline.preload(tracks=cache.track_data(), loops=cache.loop_analysis())
+            paths = pipeline.run(render_formats)
+            written.extend(paths)
+            if 'ircache' in formats:
+                written.append(cache_path)
+            if instruments is not None:
+                instruments.update(referenced_instruments(pipeline.get('tracks'),
+                                                          self.format_handler.patch_resolver))
+            print(f"  OK: Generated {', '.join(path.name for path in paths)}")
+
+        return written
+
+    def _song_fingerprint(self, song: SongMetadata, data: bytes, instruments: Optional[List[int]], formats) -> str:
+        """Fingerprint of every input that affects a song's outputs.
+
+        With instruments None, the patch maps are left out (the decode
+        fingerprint: inputs of Pass 1 and of the IR cache). Image tables the
+        format handler reads besides the song data are part of both.
+        """
+        if self._config_hash is None:
+            self._config_hash = config_digest(self.config)
+        options = {
+            'formats': list(formats),
+            'patch_based_tracks': self.patch_based_tracks,
+            'musicxml_ext': self.musicxml_ext,
+        }
+        patches_hash = '' if instruments is None else patch_digest(self.config, instruments)
+        return song_fingerprint(data, asdict(song), self.format_handler.source_tables(song.id), self._config_hash,
+                                patches_hash, options, EXTRACTOR_VERSION)
 
-                        # Generate all outputs with "alt" filename
-                        alt_text = self.disassemble_to_text(song, alt_track_data)
-                        (text_dir / f"{alt_filename}.txt").write_text(alt_text)
+    def extract_all(self, song_id_filter=None, formats=None, force: bool = False, jobs: int = 1,
+                    prefetch: int = 0, report: Optional[run_report.RunReport] = None):
+        """Extract all songs defined in config, under its output_dir (default: current directory).
 
-                        alt_ir = self.dump_ir_to_text(song, alt_track_data, alt_loop_analysis)
-                        (text_dir / f"{alt_filename}.ir").write_text(alt_ir)
+        Songs whose inputs are unchanged since the previous run (per the build
+        manifest in the output directory) are skipped unless force is set.
+        In from_ir mode songs are rendered from ircache/ without consulting the
+        manifest, and the default formats are those that do not need the ROM/ISO.
 
-                        self.generate_midi(song, alt_track_data, alt_loop_analysis, midi_dir / f"{alt_filename}.mid")
-                        self.generate_musicxml(song, alt_track_data, alt_loop_analysis, xml_dir / f"{alt_filename}.musicxml")
+        Args:
+            song_id_filter: If specified, only extract this song ID
+            formats: Output formats to produce, as a comma-separated string or
+                list (any of txt, ir, ircache, mid, events, xml). Defaults to
+                txt, ir, mid and xml (plus events if debug_events was set).
+            force: Re-extract every song regardless of the manifest
+            jobs: Number of worker processes (see _extract_parallel())
+            prefetch: With one process, read this many songs ahead and write
+                outputs in the background (see _extract_pipelined(); 0 = off)
+            report: Optional run_report.RunReport that records per-stage
+                timings and counters of the run (including --jobs workers),
+                and in its memory mode peak and retained memory
+        """
+        plan = self.prepare_extraction(None if song_id_filter is None else [song_id_filter], formats, force,
+                                       self.output_dir)
+        if plan is None:
+            return
+        songs, formats, output_root, manifest = plan
+
+        if report is not None and report.game is None:
+            report.game = Path(self.profile.path).stem
+
+        parallel = jobs > 1 and len(songs) > 1
+        can_fork = False
+        if parallel:
+            import multiprocessing  # Only --jobs runs need it
+            can_fork = 'fork' in multiprocessing.get_all_start_methods()
+        with report.activate() if report is not None else contextlib.nullcontext():
+            if parallel and can_fork:
+                self._extract_parallel(songs, formats, output_root, manifest, force, jobs)
+            elif prefetch > 0:
+                self._extract_pipelined(songs, formats, output_root, manifest, force, prefetch)
+            else:
+                if parallel:
+                    print("WARNING: --jobs needs fork(); extracting songs one at a time")
+                for song in songs:
+                    try:
+                        self.process_song(song, formats, output_root, manifest=manifest, force=force)
+                    except Exception as e:
+                        print(f"  ERROR: {e} {traceback.format_exc()}")
 
-                        print(f"  OK: Generated alternate files for {alt_filename}")
+        self.finish_extraction(manifest, all_songs=song_id_filter is None)
+        self.close()
 
-            except Exception as e:
-                print(f"  ERROR: {e} {traceback.format_exc()}")
+    def prepare_extraction(self, song_ids: Optional[List[int]] = None, formats=None, force: bool = False,
+                           output_root: Path = Path('.')) -> Optional[Tuple]:
+        """Select songs and formats, create output directories and load the manifest.
 
+        Args:
+            song_ids: If specified, only extract these song IDs
+            formats: Output formats to produce (see extract_all())
+            force: Re-extract every song regardless of the manifest
+            output_root: Directory to create the txt/, mid/ and xml/ folders in
+
+        Returns:
+            Tuple of (songs, formats, output_root, manifest), or None if none of
+            song_ids is in the config. manifest is None in from_ir mode.
+        """
+        if self.from_ir and formats is None:
+            formats = [fmt for fmt in DEFAULT_FORMATS if fmt in IR_RENDER_FORMATS]
+        formats = parse_formats(formats)
+        if self.debug_events and 'events' not in formats:
+            formats = parse_formats(formats + ('events',))
+        if self.from_ir:
+            unsupported = [fmt for fmt in formats if fmt not in IR_RENDER_FORMATS]
+            if unsupported:
+                raise ValueError(f"Cannot render {', '.join(unsupported)} from IR cache "
+                                 f"(choose from {','.join(IR_RENDER_FORMATS)})")
+
+        songs = list(self.profile.songs)
+
+        # Apply song ID filter if specified
+        if song_ids is not None:
+            songs = [s for s in songs if s.id in song_ids]
+            if not songs:
+                print(f"WARNING: Song ID {', '.join(f'{i:02X}' for i in song_ids)} not found in config")
+                return None
+
+        # Create output directories (only those the selected formats write to)
+        output_root = Path(output_root)
+        for dir_name in sorted({FORMAT_DIRS[fmt] for fmt in formats}):
+            (output_root / dir_name).mkdir(parents=True, exist_ok=True)
+
+        manifest = None if self.from_ir else BuildManifest(output_root, EXTRACTOR_VERSION)
+        if manifest is not None and manifest.songs and not force:
+            changed = manifest.changed_instruments(self.config)
+            if changed:
+                affected = manifest.songs_using(changed)
+                print(f"patch_map: {len(changed)} entries changed, {len(affected)} songs affected")
+
+        return songs, formats, output_root, manifest
+
+    def finish_extraction(self, manifest: Optional[BuildManifest], all_songs: bool = True):
+        """Save the manifest after a run, with the patch map baseline if every song was extracted."""
+        if manifest is not None and all_songs:
+            # Baseline for the next run's patch_map change summary
+            manifest.record_patches(self.config)
+            manifest.save()
+
+    def close(self):
+        """Close the ISO, executable and cached IMG file handles (safe to call twice)."""
         # Close the ISO and wrapper when done (SNES ROMs don't use ISO)
         if self.iso:
             self.iso.close()
+            self.iso = None
         if hasattr(self, '_raw_wrapper'):
             self._raw_wrapper.close()
+            del self._raw_wrapper
         if self._exe_file_handle:
             self._exe_file_handle.close()
+            self._exe_file_handle = None
         # Close all cached IMG file handles
         for handle in self._img_file_cache.values():
             handle.close()
+        self._img_file_cache.clear()
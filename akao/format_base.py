@@ -2,9 +2,12 @@
 Base classes and shared utilities for sequence format handlers.
 """
 
+import copy
+import importlib
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import List, Tuple, Dict, Optional
+from bisect import bisect_right
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
 
 # Import IR event classes
 from ir_events import IREvent, IREventType
@@ -50,6 +53,21 @@ GM_INSTRUMENTS = [
     "Telephone Ring", "Helicopter", "Applause", "Gunshot"
 ]
 
+# Why a voice's Pass 2 stopped (see SequenceFormat._iter_track_pass2())
+PASS2_STOPS = (
+    'end',              # Ran past the last IR event
+    'halt',             # HALT (or a loop point with no loop playback requested)
+    'target_time',      # Reached the target playthrough time
+    'window_end',       # Reached the end of the requested time window
+    'bad_goto',         # GOTO to a missing event (or an invalid event index)
+    'iteration_limit',  # Emergency brake: too many IR events executed
+    'time_limit',       # Emergency brake: too much time spent
+    'event_limit',      # Emergency brake: too many MIDI events
+)
+
+# The stops that are emergency brakes rather than normal ends
+PASS2_BRAKES = ('iteration_limit', 'time_limit', 'event_limit')
+
 
 @dataclass
 class PatchInfo:
@@ -66,32 +84,35 @@ class PatchInfo:
 class PatchMapper:
     """Maps game-specific patch numbers to General MIDI patches."""
 
-    def __init__(self, patch_map: Optional[Dict] = None):
-        """Initialize with optional patch mapping configuration."""
-        self.patch_map: Dict[int, PatchInfo] = {}
+    DEFAULT_PATCH = PatchInfo(gm_patch=0, name="Acoustic Grand Piano")
 
-        if patch_map:
-            for patch_num, info in patch_map.items():
-                if isinstance(info, dict):
-                    self.patch_map[patch_num] = PatchInfo(
-                        gm_patch=info.get('gm_patch', 0),
-                        transpose=info.get('transpose', 0),
-                        name=info.get('name')
-                    )
-                elif isinstance(info, int):
-                    # Simple mapping: just GM patch number
-                    self.patch_map[patch_num] = PatchInfo(gm_patch=info)
+    def __init__(self, patch_map: Optional[Dict] = None, resolver: Optional['PatchResolver'] = None):
+        """Initialize with optional patch mapping configuration.
 
-    def get_patch_info(self, patch_num: int) -> PatchInfo:
-        """Get patch info for a given patch number, with default fallback."""
-        if patch_num in self.patch_map:
-            return self.patch_map[patch_num]
-        # Default: use piano (patch 0) with no transposition
-        return PatchInfo(gm_patch=0, name="Acoustic Grand Piano")
+        Args:
+            patch_map: Patch map config (ignored if resolver is given)
+            resolver: Compiled patch maps to share instead of compiling patch_map
+        """
+        self.resolver = resolver if resolver is not None else PatchResolver(patch_map)
+        bank = self.resolver.banks[PatchResolver.BANK_HIGH]
 
-    def get_instrument_name(self, patch_num: int) -> str:
-        """Get human-readable instrument name for a patch."""
-        info = self.get_patch_info(patch_num)
+        # PatchInfo and display name per patch number, built once so lookups are list indexing
+        self._infos: List[PatchInfo] = []
+        self._instrument_names: List[str] = []
+        self.patch_map: Dict[int, PatchInfo] = {}
+        for patch_num, mapped in enumerate(bank.mapped):
+            if mapped:
+                info = PatchInfo(gm_patch=bank.gm_patch[patch_num], transpose=bank.transpose[patch_num],
+                                 name=self.resolver.names[bank.name_id[patch_num]])
+                self.patch_map[patch_num] = info
+            else:
+                info = self.DEFAULT_PATCH
+            self._infos.append(info)
+            self._instrument_names.append(self._describe(info))
+        self._default_name = self._describe(self.DEFAULT_PATCH)
+
+    @staticmethod
+    def _describe(info: PatchInfo) -> str:
         if info.name:
             return info.name
         if info.is_percussion():
@@ -100,10 +121,299 @@ class PatchMapper:
             return GM_INSTRUMENTS[info.gm_patch]
         return f"Unknown Instrument ({info.gm_patch})"
 
+    def get_patch_info(self, patch_num: int) -> PatchInfo:
+        """Get patch info for a given patch number, with default fallback."""
+        if 0 <= patch_num < len(self._infos):
+            return self._infos[patch_num]
+        # Default: use piano (patch 0) with no transposition
+        return self.DEFAULT_PATCH
+
+    def get_instrument_name(self, patch_num: int) -> str:
+        """Get human-readable instrument name for a patch."""
+        if 0 <= patch_num < len(self._instrument_names):
+            return self._instrument_names[patch_num]
+        return self._default_name
+
+
+class PatchTable:
+    """Dense lookup arrays for one patch map, indexed by slot (instrument ID).
+
+    Unmapped slots hold the defaults (GM patch 0, no transpose, no name).
+    """
+
+    def __init__(self, size: int):
+        self.mapped = [False] * size
+        self.gm_patch = [0] * size
+        self.transpose = [0] * size
+        self.perc_key = [0] * size  # abs(gm_patch) for percussion entries, else 0
+        self.name_id = [0] * size  # Index into PatchResolver.names (0 = no name)
+        self.entries = [(0, 0)] * size  # (gm_patch, transpose) pairs for resolve()
+
+
+class PatchResolver:
+    """Compiled patch maps used to resolve IR patch references.
+
+    Pass 1 records only which patch map entry an instrument refers to (bank and
+    slot); the GM patch and transpose are looked up here at render time. Each
+    patch map is compiled once into a PatchTable, so lookups are list indexing.
+    """
+
+    BANK_HIGH = 0  # patch_map
+    BANK_LOW = 1   # patch_map_low (dual_map instruments below the split)
+
+    MIN_SLOTS = 0x100  # Instrument IDs are byte operands
+
+    def __init__(self, patch_map: Optional[Dict] = None, patch_map_low: Optional[Dict] = None):
+        """Compile patch maps (keys: instrument ID as int or "0x.." string).
+
+        Args:
+            patch_map: Main patch map
+            patch_map_low: Low patch map; if empty, the main map is used instead
+        """
+        self.names: List[Optional[str]] = [None]  # Name id -> instrument name
+        high = self._compile(patch_map)
+        low = self._compile(patch_map_low) if patch_map_low else high
+        self.banks: List[PatchTable] = [high, low]
+
+    def _compile(self, patch_map: Optional[Dict]) -> PatchTable:
+        entries = {}
+        for key, info in (patch_map or {}).items():
+            slot = int(key, 0) if isinstance(key, str) else key
+            if slot < 0:
+                continue
+            if isinstance(info, int):
+                info = {'gm_patch': info}  # Simple mapping: just GM patch number
+            entries[slot] = info
+
+        table = PatchTable(max([self.MIN_SLOTS] + [slot + 1 for slot in entries]))
+        for slot, info in entries.items():
+            gm_patch = info.get('gm_patch', 0)
+            transpose = info.get('transpose', 0)
+            table.mapped[slot] = True
+            table.gm_patch[slot] = gm_patch
+            table.transpose[slot] = transpose
+            table.perc_key[slot] = -gm_patch if gm_patch < 0 else 0
+            table.entries[slot] = (gm_patch, transpose)
+            if info.get('name'):
+                table.name_id[slot] = len(self.names)
+                self.names.append(info['name'])
+        return table
+
+    def resolve(self, bank: int, slot: Optional[int]) -> Tuple[int, int]:
+        """Return (gm_patch, transpose_octaves) for a patch reference.
+
+        Unmapped instruments (and slot None, i.e. no patch change yet) give (0, 0).
+        """
+        entries = self.banks[bank].entries
+        if slot is None or not 0 <= slot < len(entries):
+            return (0, 0)
+        return entries[slot]
+
+
+@dataclass
+class Pass2State:
+    """Pass 2 interpreter state, the part of it saved in seek checkpoints.
+
+    _iter_track_pass2() keeps the variables that carry over from one IR event
+    to the next here rather than in locals, so Pass2Window can copy the whole
+    state. Handlers with more state (e.g. volume fades) subclass it; every
+    field must be JSON-serializable, since SeekIndex stores checkpoints as JSON.
+    """
+    i: int = 0  # Index of the next IR event
+    current_voice_num: int = 0  # Track whose IR events are being executed
+    total_time: int = 0  # Playback time in MIDI ticks
+    midi_events: List[Dict] = field(default_factory=list)  # Events not yet handed out
+    loop_stack: List[Dict] = field(default_factory=list)
+    octave: int = 4
+    velocity: int = 100
+    tempo: int = 120
+    current_pan: int = 64
+    perc_key: int = 0
+    transpose_octaves: int = 0
+    gate_time: int = 2
+    slur_enabled: bool = False
+    roll_enabled: bool = False
+    staccato_percentage: int = 100
+    utility_duration_override: Optional[int] = None
+    master_volume: float = 0
+    volume_multiplier: float = 0
+
+
+class Pass2Window:
+    """Time window and seek checkpoints for one voice's Pass 2 run.
+
+    Events before start_tick are interpreted but not emitted; the latest tempo,
+    program change and controller values among them are re-emitted at
+    start_tick, so the window starts with the right settings. Every interval
+    ticks the interpreter state is appended to checkpoints (a SeekIndex entry),
+    and a run whose window starts after a checkpoint resumes from it instead
+    of from the first event.
+
+    A checkpoint at time T holds the interpreter state (Pass2State), the
+    settings in effect before T and the events already handed out that start
+    at or after T (e.g. the rest of a volume fade), so resuming from it
+    reproduces every event from T on.
+    """
+
+    def __init__(self, start_tick: int = 0, end_tick: Optional[int] = None,
+                 checkpoints: Optional[List[Dict]] = None, interval: int = 0):
+        """Initialize the window.
+
+        Args:
+            start_tick: First MIDI tick to emit events for
+            end_tick: Stop before this MIDI tick (None = no limit)
+            checkpoints: Checkpoints of this voice, in time order; new ones are appended
+            interval: Checkpoint spacing in MIDI ticks (0 = don't record checkpoints)
+        """
+        self.start_tick = start_tick
+        self.end_tick = end_tick
+        self.checkpoints = checkpoints if checkpoints is not None else []
+        self.interval = interval
+        self.chase: Dict[str, Dict] = {}  # Latest setting before start_tick, per setting
+        self.opened = start_tick <= 0  # Chased settings have been emitted
+        self._settled: Dict[str, Dict] = {}  # Latest setting before the last checkpoint
+        self._pending: List[Dict] = []  # Events handed out since then (for the next checkpoint)
+
+        # Resume from the last checkpoint at or before the window start
+        index = bisect_right([checkpoint['time'] for checkpoint in self.checkpoints], start_tick)
+        self.resume: Optional[Dict] = self.checkpoints[index - 1] if index else None
+        if self.resume is not None:
+            self.chase = copy.deepcopy(self.resume['chase'])
+            self._settled = copy.deepcopy(self.resume['chase'])
+        self._next_checkpoint = (self.checkpoints[-1]['time'] if self.checkpoints else 0) + interval
+
+    @staticmethod
+    def _fold(settings: Dict[str, Dict], event: Dict):
+        """Record event as the latest value of its setting (tempo, program, controller)."""
+        key = f"{event['type']}:{event.get('channel')}:{event.get('controller')}"
+        current = settings.get(key)
+        if current is None or event['time'] >= current['time']:
+            settings[key] = event
+
+    def restore(self, state_class: type) -> Pass2State:
+        """Interpreter state of the resume checkpoint.
+
+        The events handed out before the checkpoint that start after it are put
+        back in front of midi_events, so they are emitted (or chased) again.
+
+        Args:
+            state_class: Pass2State (sub)class the handler's Pass 2 runs with
+
+        Returns:
+            A new state_class instance, independent of the checkpoint
+        """
+        state = state_class(**copy.deepcopy(self.resume['state']))
+        state.midi_events[:0] = copy.deepcopy(self.resume['ahead'])
+        return state
+
+    def filter(self, events: List[Dict]) -> List[Dict]:
+        """Drop events outside the window, chasing settings that precede it.
+
+        Args:
+            events: Finished Pass 2 events, in generation order
+
+        Returns:
+            Events to emit (chased settings, retimed to start_tick, come first)
+        """
+        emit = []
+        for event in events:
+            if self.interval:
+                self._pending.append(dict(event))  # Copy: consumers may modify emitted events
+            event_time = event['time']
+            if event_time < self.start_tick:
+                if event['type'] != 'note':
+                    self._fold(self.chase, event)
+            elif self.end_tick is None or event_time < self.end_tick:
+                emit.append(event)
+        if emit and not self.opened:
+            self.opened = True
+            chased = sorted(self.chase.values(), key=lambda event: event['time'])
+            emit[:0] = [dict(event, time=self.start_tick) for event in chased]
+        return emit
+
+    def checkpoint_due(self, total_time: int) -> bool:
+        """True if a checkpoint should be recorded at this time."""
+        return self.interval > 0 and total_time >= self._next_checkpoint
+
+    def checkpoint(self, state: Pass2State):
+        """Record the interpreter state (at the top of the Pass 2 loop).
+
+        Args:
+            state: Current Pass 2 state; a copy is saved
+        """
+        total_time = state.total_time
+        ahead = []
+        for event in self._pending:
+            if event['time'] >= total_time:
+                ahead.append(event)
+            elif event['type'] != 'note':
+                self._fold(self._settled, event)
+        self._pending = ahead
+        self.checkpoints.append({
+            'time': total_time,
+            'chase': copy.deepcopy(self._settled),
+            'ahead': copy.deepcopy(ahead),
+            'state': asdict(state),  # Deep copy
+        })
+        self._next_checkpoint = total_time + self.interval
+
 
 class SequenceFormat(ABC):
     """Abstract base class for sequence format handlers."""
 
+    @classmethod
+    def compile_config(cls, config: Dict) -> Dict:
+        """Derive lookup tables from a normalized config, once per config (see game_profile).
+
+        The result is cached with the game profile and passed back to the
+        handler, so per-run setup doesn't rebuild it.
+
+        Args:
+            config: Game configuration dict with int opcode/patch map keys
+
+        Returns:
+            Dict of tables (none by default)
+        """
+        return {}
+
+    @classmethod
+    def for_rendering(cls, config: Dict) -> 'SequenceFormat':
+        """Create a handler that can only run Pass 2, without any ROM/ISO data.
+
+        Pass 2 depends only on the config (initial voice state, patch maps), so the ROM
+        tables read by __init__ (duration/opcode tables, song pointers) are skipped.
+        Used when rendering from a cached IR file.
+
+        Args:
+            config: Game configuration dict
+
+        Returns:
+            Handler instance supporting _parse_track_pass2()
+        """
+        handler = cls.__new__(cls)
+        handler.config = config
+        handler.rom_data = b''
+        handler._init_render_state(config)
+        return handler
+
+    def _init_render_state(self, config: Dict):
+        """Set up the state Pass 2 needs from config (initial voice state, patch resolver)."""
+        self.patch_resolver = PatchResolver()
+
+    def source_tables(self, song_id: int) -> Dict[str, List]:
+        """Tables read from the ROM/executable (outside the song data) that affect a song.
+
+        Part of the song's build manifest fingerprint, so the song is rebuilt
+        when one of them changes in the image.
+
+        Args:
+            song_id: Song ID
+
+        Returns:
+            Dict of table name -> values as read (none by default)
+        """
+        return {}
+
     @abstractmethod
     def parse_header(self, data: bytes, song_id: int = 0, use_alternate_pointers: bool = False) -> Dict:
         """Parse the sequence header and return metadata.
@@ -144,7 +454,6 @@ class SequenceFormat(ABC):
         """
         pass
 
-    @abstractmethod
     def _parse_track_pass2(self, all_track_data: Dict, start_voice_num: int,
                           target_loop_time: int = 0) -> List[Dict]:
         """Pass 2: Expand IR events with loop execution to generate MIDI events.
@@ -159,10 +468,66 @@ class SequenceFormat(ABC):
             target_loop_time: Target playthrough time in ticks (0 = no loop expansion)
 
         Returns:
-            List of MIDI event dictionaries
+            List of MIDI event dictionaries, in the order Pass 2 generated them
+        """
+        midi_events = []
+        for _, events in self._iter_track_pass2(all_track_data, start_voice_num, target_loop_time):
+            midi_events.extend(events)
+        return midi_events
+
+    @abstractmethod
+    def _iter_track_pass2(self, all_track_data: Dict, start_voice_num: int,
+                          target_loop_time: int = 0, endless: bool = False,
+                          window: Optional[Pass2Window] = None,
+                          stats: Optional[Dict] = None) -> Iterator[Tuple[int, List[Dict]]]:
+        """Pass 2 as a generator, so several voices can be advanced together.
+
+        Yielded events are dropped from the generator's own buffer, so memory
+        stays bounded however long the consumer keeps iterating.
+
+        Args are as for _parse_track_pass2(), plus:
+            endless: Follow backwards GOTOs forever instead of stopping at the
+                loop point or target time. The emergency brakes then only bound
+                the work between two steps forward in time; the consumer decides
+                when to stop.
+            window: Only emit events inside this time window, resuming from
+                and recording seek checkpoints
+            stats: Optional dict that receives, once execution ends,
+                'loop_iterations' (jumps back by LOOP_END and backwards GOTOs)
+                and 'stop', the reason it ended: one of PASS2_STOPS
+
+        Yields:
+            (cursor, events) where events are the next finished MIDI events (in
+            generation order) and cursor is a lower bound on the time of every
+            event yielded later; see _pass2_ready()
         """
         pass
 
+    @staticmethod
+    def _pass2_ready(midi_events: List[Dict], total_time: int) -> Tuple[int, int]:
+        """Find which Pass 2 events can be handed out.
+
+        Everything before the last note is final; the last note (and anything
+        after it) is held back because a following TIE extends its duration.
+        Later events never start before the current time or a held event.
+
+        Args:
+            midi_events: Events generated and not yet handed out
+            total_time: Current playback time
+
+        Returns:
+            (ready, cursor): midi_events[:ready] are final, and no later
+            event starts before cursor
+        """
+        ready = len(midi_events)
+        while ready and midi_events[ready - 1]['type'] != 'note':
+            ready -= 1
+        if not ready:
+            # No unreleased note: everything generated so far is final
+            return len(midi_events), total_time
+        ready -= 1  # Hold the last note
+        return ready, min(total_time, midi_events[ready]['time'])
+
     def _find_event_by_offset(self, ir_events: List[IREvent], target_offset: int) -> Optional[int]:
         """Find IR event index by byte offset.
 
@@ -459,3 +824,24 @@ class SongMetadata:
     length: int = 0
     offset: Optional[int] = None
     file_path: Optional[str] = None  # ISO path or default_source_file path
+
+
+# Config 'format' -> (module, class) of its handler. Handlers are imported on
+# first use, so e.g. a SNES run never loads the PSX handlers.
+FORMAT_HANDLERS: Dict[str, Tuple[str, str]] = {
+    'akao_newstyle': ('format_psx', 'AKAONewStyle'),
+    'akao_ff7': ('format_psx', 'AKAOFF7'),
+    'snes_unified': ('format_snes', 'SNESUnified'),
+}
+
+
+def load_format_handler(format_name: str) -> type:
+    """Import and return the handler class for a config 'format' name.
+
+    Raises:
+        ValueError: If the format is unknown
+    """
+    if format_name not in FORMAT_HANDLERS:
+        raise ValueError(f"Unknown format: {format_name}")
+    module_name, class_name = FORMAT_HANDLERS[format_name]
+    return getattr(importlib.import_module(module_name), class_name)
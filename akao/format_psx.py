@@ -6,13 +6,13 @@ Supports FF7, FF8, FF9, Chrono Cross via config-driven architecture.
 import io
 import struct
 import sys
-from typing import List, Tuple, Dict, Optional, TYPE_CHECKING
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from extractor import SequenceExtractor
 
 # Import base classes
-from format_base import SequenceFormat, NOTE_NAMES
+from format_base import Pass2State, Pass2Window, PatchResolver, SequenceFormat, NOTE_NAMES
 
 # Import IR event classes
 from ir_events import (
@@ -128,6 +128,16 @@ class AKAOBase(SequenceFormat):
     exe_iso_reader: Optional['SequenceExtractor'] = None
     patch_map: Dict[int, Dict]  # Optional patch mapping
 
+    def _init_render_state(self, config: Dict):
+        """Set up the state Pass 2 needs from config (initial voice state, patch resolver)."""
+        self.default_tempo = config.get('default_tempo', 255)
+        self.default_octave = config.get('default_octave', 4)
+        self.default_velocity = config.get('default_velocity', 100)
+
+        # Initialize patch map (PSX GM mapping is otherwise done by PatchMapper when writing)
+        self.patch_map = {}
+        self.patch_resolver = PatchResolver(self.patch_map)
+
     def _calculate_adjusted_velocity(self, base_velocity: int,
                                       volume_multiplier: int,
                                       master_volume: int,
@@ -177,38 +187,42 @@ class AKAOBase(SequenceFormat):
         Returns:
             Tuple of (gm_patch, transpose_octaves, disasm_annotation)
         """
-        if hasattr(self, 'patch_map') and inst_id in self.patch_map:
-            patch_info = self.patch_map[inst_id]
-            gm_patch = patch_info['gm_patch']
-            transpose_octaves = patch_info.get('transpose', 0)
+        if inst_id not in self.patch_map:
+            # No patch mapping configured - default to Grand Piano (GM patch 0)
+            return 0, 0, ""
 
-            if gm_patch < 0:
-                annotation = f" -> PERC key={abs(gm_patch)}"
-            else:
-                annotation = f" -> GM patch {gm_patch}"
+        gm_patch, transpose_octaves = self.patch_resolver.resolve(PatchResolver.BANK_HIGH, inst_id)
+        if gm_patch < 0:
+            annotation = f" -> PERC key={abs(gm_patch)}"
         else:
-            gm_patch = 0
-            transpose_octaves = 0
-            annotation = ""
+            annotation = f" -> GM patch {gm_patch}"
 
         return gm_patch, transpose_octaves, annotation
 
-    def _parse_track_pass2(self, all_track_data: Dict, start_voice_num: int,
-                          target_loop_time: int = 0) -> List[Dict]:
+    def _iter_track_pass2(self, all_track_data: Dict, start_voice_num: int,
+                          target_loop_time: int = 0, endless: bool = False,
+                          window: Optional[Pass2Window] = None,
+                          stats: Optional[Dict] = None) -> Iterator[Tuple[int, List[Dict]]]:
         """Pass 2: Expand IR events with loop execution to generate MIDI events.
 
         Args:
             all_track_data: Complete track data from parse_all_tracks() (includes loop_info per track)
             start_voice_num: Starting voice/track number to execute from
             target_loop_time: Target playthrough time in ticks (0 = no loop expansion)
+            endless: Keep following backwards GOTOs until the consumer stops iterating
+            window: Optional time window / seek checkpoints (see Pass2Window)
+            stats: Optional dict that receives 'loop_iterations' and 'stop'
 
-        Returns:
-            List of MIDI event dictionaries
+        Yields:
+            (cursor, events) batches, see SequenceFormat._iter_track_pass2()
         """
+        # Interpreter state carried from one IR event to the next
+        state = Pass2State()
+
         # Initialize from starting track
-        current_voice_num = start_voice_num
-        ir_events = all_track_data['tracks'][current_voice_num]['ir_events']
-        loop_info = all_track_data['tracks'][current_voice_num].get('loop_info', {})
+        state.current_voice_num = start_voice_num
+        ir_events = all_track_data['tracks'][state.current_voice_num]['ir_events']
+        loop_info = all_track_data['tracks'][state.current_voice_num].get('loop_info', {})
 
         # Read MIDI rendering configuration
         midi_config = self.config.get('midi_render', {})
@@ -219,42 +233,49 @@ class AKAOBase(SequenceFormat):
         velocity_scale = midi_config.get('velocity_scale', 1.0)
 
         # Playback state
-        octave = self.default_octave
-        velocity = self.default_velocity
-        tempo = self.default_tempo
-        current_pan = 64  # MIDI center pan
-        perc_key = 0
-        transpose_octaves = 0
+        state.octave = self.default_octave
+        state.velocity = self.default_velocity
+        state.tempo = self.default_tempo
+        state.current_pan = 64  # MIDI center pan
+        state.perc_key = 0
+        state.transpose_octaves = 0
         current_channel = start_voice_num
 
         # Output MIDI events
-        midi_events = []
+        state.midi_events = []
 
         # Timing
-        total_time = 0
+        state.total_time = 0
 
         # Loop execution state
-        loop_stack = []  # Stack of {start_idx, count, iteration, max_count}
+        state.loop_stack = []  # Stack of {start_idx, count, iteration, max_count}
 
-        # Iteration limit (failsafe)
+        # Iteration limit (failsafe), per pass through the loop: voices shorter
+        # than the song play more passes to reach target_loop_time, so a limit
+        # for the whole run stopped them early
         max_iterations = max(len(ir_events) * 200, 10000)
         iteration_count = 0
+        loop_iterations = 0  # Jumps back by LOOP_END and backwards GOTOs
+        stop = 'end'  # Why execution stopped (see SequenceFormat._iter_track_pass2())
 
         # Emergency brakes (match SNESFF2/FF3)
         import time
-        start_time = time.time()
+        start_time = time.time()  # Reset whenever the consumer resumes this generator
+        elapsed_time = 0.0  # Time spent in this generator before the last yield
+        emitted = 0  # Events already yielded and dropped from midi_events
+        progress = -1  # Cursor of the last batch that moved time forward (endless mode)
         max_time_seconds = 5.0  # 5 second time limit
         max_midi_events = 100000  # Max MIDI events per track
 
         # Gate timing (native ticks before full duration when note-off happens)
-        gate_time = 2  # Default: 2 native ticks from end
-                       # Can be modified by slur/roll opcodes
-        slur_enabled = False  # Track slur state
-        roll_enabled = False  # Track roll state
-        staccato_percentage = 100  # Track staccato multiplier (100 = normal)
-        utility_duration_override = None  # One-shot duration override for next note
-        master_volume = 256  # Master volume multiplier (SoM) - 256 = normal (100%)
-        volume_multiplier = 0  # Volume multiplier (CT/FF3) - 0 = normal
+        state.gate_time = 2  # Default: 2 native ticks from end
+                             # Can be modified by slur/roll opcodes
+        state.slur_enabled = False  # Track slur state
+        state.roll_enabled = False  # Track roll state
+        state.staccato_percentage = 100  # Track staccato multiplier (100 = normal)
+        state.utility_duration_override = None  # One-shot duration override for next note
+        state.master_volume = 256  # Master volume multiplier (SoM) - 256 = normal (100%)
+        state.volume_multiplier = 0  # Volume multiplier (CT/FF3) - 0 = normal
 
         # Tick scaling factor (native ticks -> MIDI ticks)
         tick_scale = 2  # 48 native ticks/quarter -> 96 MIDI ticks/quarter
@@ -264,26 +285,62 @@ class AKAOBase(SequenceFormat):
         target_loop_time_midi = target_loop_time * tick_scale if target_loop_time > 0 else 0
 
         # Execute IR events
-        i = 0
-        while i < len(ir_events):
+        state.i = 0
+        if window is not None and window.resume is not None:
+            # Continue from a seek checkpoint instead of the first event
+            state = window.restore(Pass2State)
+            ir_events = all_track_data['tracks'][state.current_voice_num]['ir_events']
+            loop_info = all_track_data['tracks'][state.current_voice_num].get('loop_info', {})
+        pass_start_time = state.total_time  # Time at the start of the current pass
+
+        while state.i < len(ir_events):
             iteration_count += 1
+
+            # Hand finished events to the consumer (a TIE can still extend the last note)
+            ready, cursor = self._pass2_ready(state.midi_events, state.total_time)
+            if ready:
+                batch = state.midi_events[:ready]
+                del state.midi_events[:ready]  # Only the held-back tail is kept
+                emitted += ready
+                if window is not None:
+                    batch = window.filter(batch)
+                if batch:
+                    elapsed_time += time.time() - start_time
+                    yield cursor, batch
+                    start_time = time.time()
+                if endless and cursor > progress:
+                    # Brakes only bound the work between two steps forward in time
+                    progress = cursor
+                    iteration_count = 0
+                    elapsed_time = 0.0
+                    emitted = 0
+            if window is not None:
+                if window.end_tick is not None and cursor >= window.end_tick:
+                    stop = 'window_end'
+                    break
+                if window.checkpoint_due(state.total_time):
+                    window.checkpoint(state)
             if iteration_count > max_iterations:
                 print(f"WARNING: Track {start_voice_num} hit max iteration limit", file=sys.stderr)
+                stop = 'iteration_limit'
                 break
 
             # Check if we've reached target playthrough time
-            if target_loop_time_midi > 0 and total_time >= target_loop_time_midi:
+            if target_loop_time_midi > 0 and state.total_time >= target_loop_time_midi:
+                stop = 'target_time'
                 break
 
             # Emergency brakes (only warn, not error - looping is normal)
-            if time.time() - start_time > max_time_seconds:
+            if elapsed_time + time.time() - start_time > max_time_seconds:
                 # Silently stop - time limit reached (normal for looping songs)
+                stop = 'time_limit'
                 break
-            if len(midi_events) > max_midi_events:
+            if emitted + len(state.midi_events) > max_midi_events:
                 # Silently stop - MIDI event limit reached (normal for looping songs)
+                stop = 'event_limit'
                 break
 
-            event = ir_events[i]
+            event = ir_events[state.i]
 
             if event.type == IREventType.NOTE:
                 # Generate MIDI note
@@ -291,15 +348,15 @@ class AKAOBase(SequenceFormat):
                 dur = event.duration  # Native duration from Pass 1
 
                 # Apply octave and transposition
-                midi_note = (octave * 12) + note_num + (transpose_octaves * 12)
+                midi_note = (state.octave * 12) + note_num + (state.transpose_octaves * 12)
                 midi_note = max(0, min(127, midi_note))
 
                 # Get velocity from event metadata or current state
-                base_velocity = event.metadata.get('velocity', velocity)
+                base_velocity = event.metadata.get('velocity', state.velocity)
 
                 # Apply volume multipliers
                 adjusted_velocity = self._calculate_adjusted_velocity(
-                    base_velocity, volume_multiplier, master_volume, velocity_scale,
+                    base_velocity, state.volume_multiplier, state.master_volume, velocity_scale,
                     apply_multiplier, apply_master_volume_config
                 )
 
@@ -308,9 +365,9 @@ class AKAOBase(SequenceFormat):
                     # Expression strategy: constant velocity, use CC11 for dynamics
                     note_velocity = constant_velocity
                     # Generate CC11 event BEFORE the note
-                    midi_events.append({
+                    state.midi_events.append({
                         'type': 'controller',
-                        'time': total_time,
+                        'time': state.total_time,
                         'channel': current_channel,
                         'controller': 11,  # Expression
                         'value': adjusted_velocity
@@ -320,8 +377,8 @@ class AKAOBase(SequenceFormat):
                     note_velocity = adjusted_velocity
 
                 # Apply utility duration override (one-shot for this note only)
-                native_duration = utility_duration_override if utility_duration_override is not None else dur
-                utility_duration_override = None  # Clear after use
+                native_duration = state.utility_duration_override if state.utility_duration_override is not None else dur
+                state.utility_duration_override = None  # Clear after use
 
                 # Scale ORIGINAL native duration to MIDI ticks
                 # This is ALWAYS used for time advancement (next event timing)
@@ -329,20 +386,20 @@ class AKAOBase(SequenceFormat):
 
                 # Calculate note-off duration (gate timing OR staccato - mutually exclusive)
                 # Order of priority: slur/roll > staccato > gate
-                if slur_enabled or roll_enabled:
+                if state.slur_enabled or state.roll_enabled:
                     # Slur/roll: play full duration (no gap before next note)
                     gate_adjusted_dur = midi_dur
-                elif staccato_percentage < 100:
+                elif state.staccato_percentage < 100:
                     # Staccato: apply percentage reduction (replaces gate timing)
                     # Apply to ORIGINAL duration, not already-reduced duration
-                    gate_adjusted_dur = int(native_duration * staccato_percentage / 100) * tick_scale
+                    gate_adjusted_dur = int(native_duration * state.staccato_percentage / 100) * tick_scale
                 else:
                     # Normal articulation: apply standard gate timing (2 native ticks before end)
-                    gate_adjusted_dur = (native_duration - gate_time) * tick_scale
+                    gate_adjusted_dur = (native_duration - state.gate_time) * tick_scale
 
-                midi_events.append({
+                state.midi_events.append({
                     'type': 'note',
-                    'time': total_time,
+                    'time': state.total_time,
                     'duration': gate_adjusted_dur,  # Adjusted for articulation
                     'note': midi_note,
                     'velocity': note_velocity,  # Uses strategy-determined velocity
@@ -350,116 +407,115 @@ class AKAOBase(SequenceFormat):
                 })
 
                 # ALWAYS advance time by FULL MIDI duration (unmodified by staccato/gate)
-                total_time += midi_dur
-                i += 1
+                state.total_time += midi_dur
+                state.i += 1
 
             elif event.type == IREventType.REST:
                 # Scale native duration to MIDI ticks
                 midi_dur = event.duration * tick_scale
-                total_time += midi_dur
-                i += 1
+                state.total_time += midi_dur
+                state.i += 1
 
             elif event.type == IREventType.TIE:
                 # Extend previous note
                 # Scale native duration to MIDI ticks
                 tie_dur = event.duration * tick_scale
-                if midi_events and midi_events[-1]['type'] == 'note':
-                    midi_events[-1]['duration'] += tie_dur
-                total_time += tie_dur
-                i += 1
+                if state.midi_events and state.midi_events[-1]['type'] == 'note':
+                    state.midi_events[-1]['duration'] += tie_dur
+                state.total_time += tie_dur
+                state.i += 1
 
             elif event.type == IREventType.PATCH_CHANGE:
-                # Extract from IR event
-                gm_patch = event.gm_patch
-                transpose_octaves = event.transpose
+                # Resolve the instrument slot now, so patch_map edits don't need a new Pass 1
+                gm_patch, state.transpose_octaves = self.patch_resolver.resolve(event.patch_bank, event.patch_slot)
 
                 # Percussion mode check
                 if gm_patch < 0:
-                    perc_key = abs(gm_patch)
+                    state.perc_key = abs(gm_patch)
                 else:
-                    perc_key = 0
-                    midi_events.append({
+                    state.perc_key = 0
+                    state.midi_events.append({
                         'type': 'program_change',
-                        'time': total_time,
+                        'time': state.total_time,
                         'patch': gm_patch
                     })
 
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.TEMPO:
                 # Tempo change - add to midi_events (will be placed on track 0)
                 assert event.value is not None, "TEMPO event must have value"
-                midi_events.append({
+                state.midi_events.append({
                     'type': 'tempo',
-                    'time': total_time,
+                    'time': state.total_time,
                     'tempo': event.value
                 })
-                tempo = event.value
-                i += 1
+                state.tempo = event.value
+                state.i += 1
 
             elif event.type == IREventType.TEMPO_FADE:
                 # Tempo fade - generate tempo events at 2-tick intervals
                 assert event.duration is not None and event.value is not None, "TEMPO_FADE must have duration and value"
                 fade_duration = event.duration * tick_scale  # Convert to MIDI ticks
                 target_tempo = event.value
-                start_tempo = tempo
+                start_tempo = state.tempo
 
                 # Generate interpolated tempo events
                 fade_events = self._generate_fade_events(
-                    'tempo', start_tempo, target_tempo, fade_duration, total_time
+                    'tempo', start_tempo, target_tempo, fade_duration, state.total_time
                 )
-                midi_events.extend(fade_events)
+                state.midi_events.extend(fade_events)
 
                 # Update current tempo to target
-                tempo = target_tempo
-                i += 1
+                state.tempo = target_tempo
+                state.i += 1
 
             elif event.type == IREventType.OCTAVE_SET:
-                octave = event.value
-                i += 1
+                state.octave = event.value
+                state.i += 1
 
             elif event.type == IREventType.OCTAVE_INC:
-                octave += 1
-                i += 1
+                state.octave += 1
+                state.i += 1
 
             elif event.type == IREventType.OCTAVE_DEC:
-                octave -= 1
-                i += 1
+                state.octave -= 1
+                state.i += 1
 
             elif event.type == IREventType.VOLUME:
                 # IR stores normalized value (0-255 for PSX)
-                velocity = int(event.value)
+                state.velocity = int(event.value)
 
                 # For expression strategy, generate CC11 immediately
                 # (velocity strategy waits until NOTE event to apply)
                 if midi_strategy == 'expression':
                     # Apply volume multipliers
                     expr_value = self._calculate_adjusted_velocity(
-                        velocity, volume_multiplier, master_volume, velocity_scale,
+                        state.velocity, state.volume_multiplier, state.master_volume, velocity_scale,
                         apply_multiplier, apply_master_volume_config
                     )
-                    midi_events.append({
+                    state.midi_events.append({
                         'type': 'controller',
-                        'time': total_time,
+                        'time': state.total_time,
                         'channel': current_channel,
                         'controller': 11,  # Expression
                         'value': expr_value
                     })
 
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.PAN:
                 # Update current pan value
-                current_pan = int(event.value)
+                state.current_pan = int(event.value)
                 # Generate immediate MIDI CC 10 pan event
-                midi_events.append({
+                state.midi_events.append({
                     'type': 'controller',
-                    'time': total_time,
+                    'time': state.total_time,
                     'channel': current_channel,
                     'controller': 10,  # Pan CC
-                    'value': current_pan
+                    'value': state.current_pan
                 })
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.VOLUME_FADE:
                 # Volume fade - generate controller events at 2-tick intervals
@@ -474,160 +530,176 @@ class AKAOBase(SequenceFormat):
 
                 fade_duration = event.duration * tick_scale  # Convert to MIDI ticks
                 target_volume = event.value
-                start_volume = velocity
+                start_volume = state.velocity
 
                 # Generate interpolated controller events
                 fade_events = self._generate_fade_events(
                     'controller', start_volume, target_volume, fade_duration,
-                    total_time, current_channel, controller_num
+                    state.total_time, current_channel, controller_num
                 )
-                midi_events.extend(fade_events)
+                state.midi_events.extend(fade_events)
 
                 # Update current velocity to target
-                velocity = target_volume
-                i += 1
+                state.velocity = target_volume
+                state.i += 1
 
             elif event.type == IREventType.PAN_FADE:
                 # Pan fade - generate CC 10 events at 2-tick intervals
                 assert event.duration is not None and event.value is not None, "PAN_FADE must have duration and value"
                 fade_duration = event.duration * tick_scale  # Convert to MIDI ticks
                 target_pan = event.value
-                start_pan = current_pan
+                start_pan = state.current_pan
 
                 # Generate interpolated pan events
                 fade_events = self._generate_fade_events(
                     'controller', start_pan, target_pan, fade_duration,
-                    total_time, current_channel, 10  # CC 10 = pan
+                    state.total_time, current_channel, 10  # CC 10 = pan
                 )
-                midi_events.extend(fade_events)
+                state.midi_events.extend(fade_events)
 
                 # Update current pan to target
-                current_pan = target_pan
-                i += 1
+                state.current_pan = target_pan
+                state.i += 1
 
             elif event.type == IREventType.SLUR_ON:
-                slur_enabled = True
+                state.slur_enabled = True
                 # Emit MIDI CC 68 (legato pedal) = 127
-                midi_events.append({
+                state.midi_events.append({
                     'type': 'controller',
-                    'time': total_time,
+                    'time': state.total_time,
                     'controller': 68,  # Legato pedal CC
                     'value': 127
                 })
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.SLUR_OFF:
-                slur_enabled = False
+                state.slur_enabled = False
                 # Emit MIDI CC 68 (legato pedal) = 0
-                midi_events.append({
+                state.midi_events.append({
                     'type': 'controller',
-                    'time': total_time,
+                    'time': state.total_time,
                     'controller': 68,  # Legato pedal CC
                     'value': 0
                 })
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.ROLL_ON:
-                roll_enabled = True
-                i += 1
+                state.roll_enabled = True
+                state.i += 1
 
             elif event.type == IREventType.ROLL_OFF:
-                roll_enabled = False
-                i += 1
+                state.roll_enabled = False
+                state.i += 1
 
             elif event.type == IREventType.STACCATO:
                 # Set staccato percentage for all subsequent notes
                 assert event.value is not None, "STACCATO event must have value"
-                staccato_percentage = int(event.value)
-                i += 1
+                state.staccato_percentage = int(event.value)
+                state.i += 1
 
             elif event.type == IREventType.UTILITY_DURATION:
                 # Override duration for next note only
                 assert event.value is not None, "UTILITY_DURATION event must have value"
-                utility_duration_override = int(event.value)
-                i += 1
+                state.utility_duration_override = int(event.value)
+                state.i += 1
 
             elif event.type == IREventType.MASTER_VOLUME:
                 # Set master volume (SoM 0xF8) - global volume multiplier
                 assert event.value is not None, "MASTER_VOLUME event must have value"
-                master_volume = int(event.value)
-                i += 1
+                state.master_volume = int(event.value)
+                state.i += 1
 
             elif event.type == IREventType.VOLUME_MULTIPLIER:
                 # Set volume multiplier (CT/FF3 0xF4) - per-track multiplier
                 assert event.value is not None, "VOLUME_MULTIPLIER event must have value"
-                volume_multiplier = int(event.value)
-                i += 1
+                state.volume_multiplier = int(event.value)
+                state.i += 1
 
             elif event.type == IREventType.PERCUSSION_MODE_ON:
                 # Percussion mode handling is done in Pass 1
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.PERCUSSION_MODE_OFF:
                 # Percussion mode handling is done in Pass 1
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.LOOP_START:
                 # Push loop onto stack
-                loop_stack.append({
-                    'start_idx': i + 1,  # Next event after LOOP_START
+                state.loop_stack.append({
+                    'start_idx': state.i + 1,  # Next event after LOOP_START
                     'count': 0,
                     'max_count': event.loop_count
                 })
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.LOOP_END:
                 # Pop and potentially repeat
-                if loop_stack:
-                    loop = loop_stack[-1]
+                if state.loop_stack:
+                    loop = state.loop_stack[-1]
                     loop['count'] += 1
 
                     if loop['count'] < loop['max_count']:
                         # Repeat - jump back to start
-                        i = loop['start_idx']
+                        state.i = loop['start_idx']
+                        loop_iterations += 1
                     else:
                         # Done - pop and continue
-                        loop_stack.pop()
-                        i += 1
+                        state.loop_stack.pop()
+                        state.i += 1
                 else:
                     # Unmatched LOOP_END - skip
-                    i += 1
+                    state.i += 1
 
             elif event.type == IREventType.GOTO:
                 # Find target event
                 if event.target_offset is None:
                     # Invalid GOTO - halt
+                    stop = 'bad_goto'
                     break
 
                 target_idx = self._find_event_by_offset(ir_events, event.target_offset)
 
                 if target_idx is None:
                     # Invalid target - halt
+                    stop = 'bad_goto'
                     break
 
                 # Check if backwards (loop)
-                if target_idx < i:
-                    # Backwards GOTO - loop condition
-                    if target_loop_time > 0 and total_time >= target_loop_time:
+                if target_idx < state.i:
+                    # Backwards GOTO - loop condition (total_time is in MIDI ticks)
+                    if target_loop_time_midi > 0 and state.total_time >= target_loop_time_midi:
                         # Reached target duration - halt
+                        stop = 'target_time'
                         break
                     else:
                         # Continue looping
-                        i = target_idx
+                        state.i = target_idx
+                        loop_iterations += 1
+                        if state.total_time > pass_start_time:
+                            # The pass moved time forward; a pass that doesn't still hits the limit
+                            pass_start_time = state.total_time
+                            iteration_count = 0
                 else:
                     # Forward GOTO - could be cross-track
                     # For now, just jump forward
-                    i = target_idx
+                    state.i = target_idx
 
             elif event.type == IREventType.HALT:
                 # End of track
+                stop = 'halt'
                 break
 
             else:
                 # Unknown event type - skip
-                i += 1
+                state.i += 1
 
-        return midi_events
+        if stats is not None:
+            stats['loop_iterations'] = loop_iterations
+            stats['stop'] = stop
+        if window is not None:
+            state.midi_events = window.filter(state.midi_events)
+        if state.midi_events:
+            yield state.total_time, state.midi_events
 
 
 class AKAONewStyle(AKAOBase):
@@ -762,9 +834,7 @@ class AKAONewStyle(AKAOBase):
         self.fe_oplen[0x0f] = 1
 
         # Get state defaults from config
-        self.default_tempo = config.get('default_tempo', 255)
-        self.default_octave = config.get('default_octave', 4)
-        self.default_velocity = config.get('default_velocity', 100)
+        self._init_render_state(config)
 
         # Calculate tempo_factor from component values
         # tempo_factor = timer_period_us * timer_count * tempo_resolution
@@ -773,8 +843,9 @@ class AKAONewStyle(AKAOBase):
         tempo_resolution = config.get('tempo_resolution', 65536)
         self.tempo_factor = timer_period_us * timer_count * tempo_resolution
 
-        # Initialize patch map (populated from config if provided)
-        self.patch_map = {}
+    def source_tables(self, song_id: int) -> Dict[str, List]:
+        """Duration and opcode length tables (read from the executable if configured)."""
+        return {'duration_table': self.duration_table, 'oplen': self.oplen, 'fe_oplen': self.fe_oplen}
 
     def _read_rom_table(self, address: int, size: int, data_type: str) -> List[int]:
         """Read a table from the ROM image."""
@@ -920,9 +991,7 @@ class AKAONewStyle(AKAOBase):
         octave = self.default_octave
         velocity = self.default_velocity
         tempo = self.default_tempo
-        current_patch = 0  # Current GM patch
         inst_id = 0  # Raw instrument ID
-        transpose_octaves = 0
         util_dur = 0  # Utility duration override (one-shot)
 
         # Find end of track (next track start or end of data)
@@ -974,7 +1043,6 @@ class AKAONewStyle(AKAOBase):
                     event = make_note(p - 1, notenum, note_duration)
                     event.metadata = {
                         'velocity': velocity,
-                        'patch': current_patch,
                         'track_num': track_num,
                         'inst_id': inst_id,
                         'octave': octave  # Store current octave for debugging
@@ -1052,24 +1120,9 @@ class AKAONewStyle(AKAOBase):
                     # Program Change (FE 14) - treat as raw instrument ID (like 0xA1)
                     inst_id = operands[0]
 
-                    # Look up GM patch from patch_map if available
-                    if hasattr(self, 'patch_map') and inst_id in self.patch_map:
-                        patch_info = self.patch_map[inst_id]
-                        gm_patch = patch_info['gm_patch']
-                        transpose_octaves = patch_info.get('transpose', 0)
-
-                        # Add annotation to disasm line
-                        if gm_patch < 0:
-                            line += f" -> PERC key={abs(gm_patch)}"
-                        else:
-                            line += f" -> GM patch {gm_patch}"
-                    else:
-                        # No patch mapping configured - default to Grand Piano
-                        gm_patch = 0
-                        transpose_octaves = 0
-
-                    current_patch = gm_patch
-                    event = make_patch_change(p - oplen, inst_id, gm_patch, transpose_octaves, operands)
+                    # Annotate with the current patch_map entry; the IR keeps only the slot
+                    line += self._resolve_patch_info(inst_id)[2]
+                    event = make_patch_change(p - oplen, inst_id, inst_id, PatchResolver.BANK_HIGH, operands)
                     ir_events.append(event)
                 elif op1 == 0x15 and len(operands) >= 2:
                     # Time signature
@@ -1098,24 +1151,9 @@ class AKAONewStyle(AKAOBase):
                     # Program Change (A1)
                     inst_id = operands[0]
 
-                    # Look up GM patch from patch_map if available
-                    if hasattr(self, 'patch_map') and inst_id in self.patch_map:
-                        patch_info = self.patch_map[inst_id]
-                        gm_patch = patch_info['gm_patch']
-                        transpose_octaves = patch_info.get('transpose', 0)
-
-                        # Add annotation to disasm line
-                        if gm_patch < 0:
-                            line += f" -> PERC key={abs(gm_patch)}"
-                        else:
-                            line += f" -> GM patch {gm_patch}"
-                    else:
-                        # No patch mapping configured - default to Grand Piano (GM patch 0)
-                        gm_patch = 0
-                        transpose_octaves = 0
-
-                    current_patch = gm_patch
-                    event = make_patch_change(p - oplen, inst_id, gm_patch, transpose_octaves, operands)
+                    # Annotate with the current patch_map entry; the IR keeps only the slot
+                    line += self._resolve_patch_info(inst_id)[2]
+                    event = make_patch_change(p - oplen, inst_id, inst_id, PatchResolver.BANK_HIGH, operands)
                     ir_events.append(event)
                 elif cmd == 0xA2 and operands:
                     # Utility duration override (one-shot for next note)
@@ -1205,9 +1243,7 @@ class AKAOFF7(AKAOBase):
         self.exe_iso_reader = exe_iso_reader
 
         # Read configuration
-        self.default_tempo = config.get('default_tempo', 255)
-        self.default_octave = config.get('default_octave', 4)
-        self.default_velocity = config.get('default_velocity', 100)
+        self._init_render_state(config)
 
         # Tempo calculation
         self.tempo_factor = config.get('tempo_factor', 13107200000)
@@ -1377,7 +1413,7 @@ class AKAOFF7(AKAOBase):
                     disasm.append(line)
                     break
                 elif cmd in (0xA1, 0xF2) and operands:  # Program change
-                    ir_events.append(make_patch_change(p-oplen, operands[0], 0, 0))
+                    ir_events.append(make_patch_change(p-oplen, operands[0], operands[0]))
                 elif cmd == 0xA2 and operands:  # Utility duration
                     util_dur = operands[0]
                     ir_events.append(make_utility_duration(p-oplen, util_dur))
@@ -5,10 +5,11 @@ Supports FF2, FF3, FF5, CT, SD3, SoM via config-driven architecture.
 
 import struct
 import sys
-from typing import List, Tuple, Dict, Optional
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
 
 # Import base classes
-from format_base import SequenceFormat, NOTE_NAMES
+from format_base import Pass2State, Pass2Window, PatchResolver, SequenceFormat, NOTE_NAMES
 
 # Import IR event classes
 from ir_events import *
@@ -27,13 +28,32 @@ def snes_addr_to_offset(snes_addr: int, has_header: bool = True) -> int:
     if has_header:
         file_offset += 0x200
     return file_offset
+
+
+@dataclass
+class SNESPass2State(Pass2State):
+    """Pass 2 state of SNESUnified: adds the SPC-style volume fade."""
+    volume_fade_active: bool = False
+    volume_fade_target: float = 0.0
+    volume_fade_delta: float = 0.0
+    volume_fade_ticks_remaining: int = 0
+
+
 class SNESUnified(SequenceFormat):
     """Unified SNES music format handler - config-driven for all SNES AKAO games."""
 
     # OPCODE_NAMES will be built from config in __init__
 
-    def __init__(self, config: Dict, rom_data: bytes):
-        """Initialize with game-specific config and ROM data."""
+    def __init__(self, config: Dict, rom_data: bytes, tables: Optional[Dict] = None):
+        """Initialize with game-specific config and ROM data.
+
+        Args:
+            config: Game configuration dict
+            rom_data: ROM contents
+            tables: Output of compile_config() for this config (None = build them here)
+        """
+        if tables is None:
+            tables = self.compile_config(config)
         self.config = config
         self.rom_data: bytes = rom_data
         self.has_smc_header = len(rom_data) % 1024 == 512  # SMC header is 512 bytes
@@ -77,10 +97,8 @@ class SNESUnified(SequenceFormat):
             self.opcode_table = [1] * 46
             self.opcode_table_includes_opcode = False
 
-        # Get state defaults from config
-        self.default_tempo = config.get('default_tempo', 255)
-        self.default_octave = config.get('default_octave', 4)
-        self.default_velocity = config.get('default_velocity', 64)
+        # Get state defaults and patch maps from config
+        self._init_render_state(config)
 
         # Calculate tempo_factor from component values
         # tempo_factor = timer_period_us * timer_count * tempo_resolution
@@ -89,32 +107,11 @@ class SNESUnified(SequenceFormat):
         tempo_resolution = config.get('tempo_resolution', 256)
         self.tempo_factor = timer_period_us * timer_count * tempo_resolution
 
-        # Build patch map from config (instrument_id -> PatchInfo)
-        self.patch_map = {}
-        if 'patch_map' in config:
-            for inst_id_str, patch_info in config['patch_map'].items():
-                # Convert hex string to int (handles both "0x00" and "00" formats)
-                if isinstance(inst_id_str, str):
-                    inst_id = int(inst_id_str, 0)  # base 0 auto-detects hex with 0x prefix
-                else:
-                    inst_id = inst_id_str
-                self.patch_map[inst_id] = patch_info
-
-        # Build patch_map_low for FF3 dual_map handler (optional)
-        self.patch_map_low = {}
-        if 'patch_map_low' in config:
-            for inst_id_str, patch_info in config['patch_map_low'].items():
-                if isinstance(inst_id_str, str):
-                    inst_id = int(inst_id_str, 0)
-                else:
-                    inst_id = inst_id_str
-                self.patch_map_low[inst_id] = patch_info
-
         # Get base address for song pointers
         self.base_address = config.get('base_address', 0x04C000)
 
-        # PHASE 2: Build opcode dispatch table from config
-        self.opcode_dispatch = self._build_opcode_dispatch()
+        # PHASE 2: Opcode dispatch table from config
+        self.opcode_dispatch = tables['opcode_dispatch']
 
         # Calculate base_offset once for reuse
         base_offset = self._snes_addr_to_offset(self.base_address)
@@ -141,14 +138,24 @@ class SNESUnified(SequenceFormat):
         self.instrument_mapping = config.get('instrument_mapping')
         if self.instrument_mapping is None:
             self.instrument_mapping = {'type': 'direct', 'param': 0}
+        self._patch_slot_tables: Dict[Tuple, List[Tuple[int, int]]] = {}  # See _patch_slot_table()
 
         # Read song pointer table (may set instrument_table_offset for FF2 style)
         self.song_pointers = self._read_song_pointer_table()
 
-        # Build opcode names for disassembly from config
-        self.OPCODE_NAMES = self._build_opcode_names()
+        # Opcode names for disassembly from config
+        self.OPCODE_NAMES = tables['opcode_names']
+
+    @classmethod
+    def compile_config(cls, config: Dict) -> Dict:
+        """Build the opcode dispatch table and opcode names from config."""
+        return {
+            'opcode_dispatch': cls._build_opcode_dispatch(config),
+            'opcode_names': cls._build_opcode_names(config),
+        }
 
-    def _build_opcode_names(self) -> Dict[int, str]:
+    @staticmethod
+    def _build_opcode_names(config: Dict) -> Dict[int, str]:
         """Build opcode name dictionary from YAML config for disassembly.
 
         Returns:
@@ -223,7 +230,7 @@ class SNESUnified(SequenceFormat):
         }
 
         names = {}
-        opcodes_config = self.config.get('opcodes', {})
+        opcodes_config = config.get('opcodes', {})
 
         for opcode_key, op_config in opcodes_config.items():
             # Convert opcode key to int
@@ -238,7 +245,8 @@ class SNESUnified(SequenceFormat):
 
         return names
 
-    def _build_opcode_dispatch(self) -> Dict[int, Dict]:
+    @staticmethod
+    def _build_opcode_dispatch(config: Dict) -> Dict[int, Dict]:
         """Build opcode dispatch table from YAML config.
 
         Returns:
@@ -250,7 +258,7 @@ class SNESUnified(SequenceFormat):
         """
         dispatch = {}
 
-        opcodes_config = self.config.get('opcodes', {})
+        opcodes_config = config.get('opcodes', {})
 
         for opcode_key, op_config in opcodes_config.items():
             # Convert opcode key to int (handles 0xD2, "0xD2", 210, etc.)
@@ -457,6 +465,16 @@ class SNESUnified(SequenceFormat):
         return instruments
 
 
+    def source_tables(self, song_id: int) -> Dict[str, List]:
+        """Duration, opcode length, instrument and percussion tables read from the ROM."""
+        return {
+            'duration_table': self.duration_table,
+            'opcode_table': self.opcode_table,
+            'instrument_table': self._read_song_instrument_table(song_id),
+            'percussion_table': self._read_song_percussion_table(song_id),
+        }
+
+
     def _read_song_percussion_table(self, song_id: int) -> List[Dict]:
         """Read the percussion table for a specific song (CT/FF3-specific).
 
@@ -610,8 +628,10 @@ class SNESUnified(SequenceFormat):
             target_offset = target_spc_addr - self.spc_load_address
         return target_offset, target_spc_addr
 
-    def _parse_track_pass2(self, all_track_data: Dict, start_voice_num: int,
-                          target_loop_time: int = 0) -> List[Dict]:
+    def _iter_track_pass2(self, all_track_data: Dict, start_voice_num: int,
+                          target_loop_time: int = 0, endless: bool = False,
+                          window: Optional[Pass2Window] = None,
+                          stats: Optional[Dict] = None) -> Iterator[Tuple[int, List[Dict]]]:
         """Pass 2: Expand IR events with loop execution to generate MIDI events.
 
         This pass takes all track data and executes from a starting voice, expanding loops,
@@ -621,18 +641,27 @@ class SNESUnified(SequenceFormat):
             all_track_data: Complete track data from parse_all_tracks()
             start_voice_num: Starting track/voice number (0-7)
             target_loop_time: Target absolute time for all tracks (0 = no looping)
+            endless: Keep following backwards GOTOs until the consumer stops iterating
+            window: Optional time window / seek checkpoints (see Pass2Window)
+            stats: Optional dict that receives 'loop_iterations' and 'stop'
 
-        Returns:
-            List of MIDI event dictionaries
+        Yields:
+            (cursor, events) batches, see SequenceFormat._iter_track_pass2()
         """
         import time
-        start_time = time.time()
+        start_time = time.time()  # Reset whenever the consumer resumes this generator
+        elapsed_time = 0.0  # Time spent in this generator before the last yield
+        emitted = 0  # Events already yielded and dropped from midi_events
+        progress = -1  # Cursor of the last batch that moved time forward (endless mode)
         max_time_seconds = 2.0  # Emergency brake: 2 second time limit
         max_midi_events = 50000  # Emergency brake: max MIDI events per track
 
+        # Interpreter state carried from one IR event to the next
+        state = SNESPass2State()
+
         # Gate timing (native ticks before full duration when note-off happens)
-        gate_time = 2  # Default: 2 native ticks from end
-                       # Can be modified by slur/legato opcodes
+        state.gate_time = 2  # Default: 2 native ticks from end
+                             # Can be modified by slur/legato opcodes
 
         # Tick scaling factor (native ticks -> MIDI ticks)
         tick_scale = 2  # 48 native ticks/quarter -> 96 MIDI ticks/quarter
@@ -642,13 +671,13 @@ class SNESUnified(SequenceFormat):
         # (loop analyzer works in native ticks, Pass 2 works in MIDI ticks)
         target_loop_time_midi = target_loop_time * tick_scale if target_loop_time > 0 else 0
 
-        midi_events = []
-        total_time = 0
+        state.midi_events = []
+        state.total_time = 0
 
         # Start with the specified voice
-        current_voice_num = start_voice_num
-        ir_events = all_track_data['tracks'][current_voice_num]['ir_events']
-        loop_info = all_track_data['tracks'][current_voice_num].get('loop_info', {})
+        state.current_voice_num = start_voice_num
+        ir_events = all_track_data['tracks'][state.current_voice_num]['ir_events']
+        loop_info = all_track_data['tracks'][state.current_voice_num].get('loop_info', {})
 
         # Read MIDI rendering configuration
         midi_config = self.config.get('midi_render', {})
@@ -659,33 +688,33 @@ class SNESUnified(SequenceFormat):
         velocity_scale = midi_config.get('velocity_scale', 1.0)  # Global velocity scaling
 
         # Playback state
-        octave = self.default_octave
-        velocity = self.default_velocity
-        tempo = self.default_tempo
-        current_pan = 64  # MIDI center pan
-        perc_key = 0
-        transpose_octaves = 0
+        state.octave = self.default_octave
+        state.velocity = self.default_velocity
+        state.tempo = self.default_tempo
+        state.current_pan = 64  # MIDI center pan
+        state.perc_key = 0
+        state.transpose_octaves = 0
         current_channel = start_voice_num
-        slur_enabled = False  # Track slur state
-        roll_enabled = False  # Track roll state
-        staccato_percentage = 100  # Track staccato multiplier (100 = normal)
-        utility_duration_override = None  # One-shot duration override for next note
-        master_volume = 1.0  # Master volume multiplier (SoM) - 1.0 = normal (100%), range 0.0-1.0
-        volume_multiplier = 1.0  # Volume multiplier (CT/FF3) - 1.0 = normal (100%), range 0.0-1.0
+        state.slur_enabled = False  # Track slur state
+        state.roll_enabled = False  # Track roll state
+        state.staccato_percentage = 100  # Track staccato multiplier (100 = normal)
+        state.utility_duration_override = None  # One-shot duration override for next note
+        state.master_volume = 1.0  # Master volume multiplier (SoM) - 1.0 = normal (100%), range 0.0-1.0
+        state.volume_multiplier = 1.0  # Volume multiplier (CT/FF3) - 1.0 = normal (100%), range 0.0-1.0
 
         # Fade state (SPC-style) for velocity strategy
-        volume_fade_active = False
-        volume_fade_target = 0.0
-        volume_fade_delta = 0.0
-        volume_fade_ticks_remaining = 0
+        state.volume_fade_active = False
+        state.volume_fade_target = 0.0
+        state.volume_fade_delta = 0.0
+        state.volume_fade_ticks_remaining = 0
 
         # Loop execution state
-        loop_stack = []  # Stack of {start_idx, count, iteration, octave}
+        state.loop_stack = []  # Stack of {start_idx, count, iteration, octave}
 
         # Use global target time directly (no per-track calculation needed)
 
         # Event pointer for execution
-        i = 0
+        state.i = 0
         # Most game music loops infinitely. Allow enough iterations for ~2 full playthroughs
         # Typical: 100-200 IR events, with loops expanding to 10,000-20,000 iterations
         # However, deeply nested loops (e.g., FF3 song 3E with 4 nested count=6 loops) can
@@ -694,49 +723,88 @@ class SNESUnified(SequenceFormat):
         # - Minimum of 50000 ensures adequate headroom
         max_iterations = max(len(ir_events) * 1000, 50000)
         iteration_count = 0
+        loop_iterations = 0  # Jumps back by LOOP_END and backwards GOTOs
+        stop = 'end'  # Why execution stopped (see SequenceFormat._iter_track_pass2())
 
-        while i < len(ir_events) and iteration_count < max_iterations:
+        if window is not None and window.resume is not None:
+            # Continue from a seek checkpoint instead of the first event
+            state = window.restore(SNESPass2State)
+            ir_events = all_track_data['tracks'][state.current_voice_num]['ir_events']
+            loop_info = all_track_data['tracks'][state.current_voice_num].get('loop_info', {})
+
+        while state.i < len(ir_events) and iteration_count < max_iterations:
             iteration_count += 1
 
+            # Hand finished events to the consumer (a TIE can still extend the last note)
+            ready, cursor = self._pass2_ready(state.midi_events, state.total_time)
+            if ready:
+                batch = state.midi_events[:ready]
+                del state.midi_events[:ready]  # Only the held-back tail is kept
+                emitted += ready
+                if window is not None:
+                    batch = window.filter(batch)
+                if batch:
+                    elapsed_time += time.time() - start_time
+                    yield cursor, batch
+                    start_time = time.time()
+                if endless and cursor > progress:
+                    # Brakes only bound the work between two steps forward in time
+                    progress = cursor
+                    iteration_count = 0
+                    elapsed_time = 0.0
+                    emitted = 0
+            if window is not None:
+                if window.end_tick is not None and cursor >= window.end_tick:
+                    stop = 'window_end'
+                    break
+                if window.checkpoint_due(state.total_time):
+                    window.checkpoint(state)
+
             # Check if we've reached target playthrough time
-            if target_loop_time_midi > 0 and total_time >= target_loop_time_midi:
+            if target_loop_time_midi > 0 and state.total_time >= target_loop_time_midi:
+                stop = 'target_time'
                 break
 
             # Emergency brakes (only warn, not error - looping is normal)
-            if time.time() - start_time > max_time_seconds:
+            if elapsed_time + time.time() - start_time > max_time_seconds:
                 # Silently stop - time limit reached (normal for looping songs)
+                stop = 'time_limit'
                 break
-            if len(midi_events) > max_midi_events:
+            if emitted + len(state.midi_events) > max_midi_events:
                 # Silently stop - MIDI event limit reached (normal for looping songs)
+                stop = 'event_limit'
                 break
 
-            if i < 0 or i >= len(ir_events):
-                print(f"WARNING: Track {start_voice_num} invalid event index {i}, stopping")
+            if state.i < 0 or state.i >= len(ir_events):
+                print(f"WARNING: Track {start_voice_num} invalid event index {state.i}, stopping")
+                stop = 'bad_goto'
                 break
-            event = ir_events[i]
+            event = ir_events[state.i]
 
             if event.type == IREventType.NOTE:
                 # Extract state from metadata (stored in pass 1)
                 # NOTE: octave and velocity are tracked as state variables, not in metadata
                 # This allows loops to modify them during playback
-                perc_key = event.metadata['perc_key']
-                transpose_octaves = event.metadata['transpose']
+                # The patch slot is resolved here rather than in Pass 1 so patch_map edits apply directly
+                _, state.transpose_octaves, state.perc_key = self._resolve_patch(
+                    event.metadata['patch_bank'], event.metadata['patch_slot'])
+                state.transpose_octaves += event.metadata.get('octave_offset', 0)
 
                 # Calculate MIDI note
                 assert event.note_num is not None, "NOTE event must have note_num"
                 assert event.duration is not None, "NOTE event must have duration"
-                midi_note = 12 * (octave + transpose_octaves) + event.note_num
+                midi_note = 12 * (state.octave + state.transpose_octaves) + event.note_num
 
                 # Check if we're in percussion mode
-                if perc_key:
+                if state.perc_key:
                     midi_channel = 9  # Percussion channel
-                    midi_note = perc_key
+                    midi_note = state.perc_key
                 else:
                     midi_channel = current_channel
 
                 # Apply utility duration override (one-shot for this note only)
-                native_duration = utility_duration_override if utility_duration_override is not None else event.duration
-                utility_duration_override = None  # Clear after use
+                native_duration = state.utility_duration_override if state.utility_duration_override is not None else event.duration
+                state.utility_duration_override = None  # Clear after use
 
                 # Scale ORIGINAL native duration to MIDI ticks
                 # This is ALWAYS used for time advancement (next event timing)
@@ -744,19 +812,19 @@ class SNESUnified(SequenceFormat):
 
                 # Calculate note-off duration (gate timing OR staccato - mutually exclusive)
                 # Order of priority: slur/roll > staccato > gate
-                if slur_enabled or roll_enabled:
+                if state.slur_enabled or state.roll_enabled:
                     # Slur/roll: play full duration (no gap before next note)
                     gate_adjusted_dur = midi_dur
-                elif staccato_percentage < 100:
+                elif state.staccato_percentage < 100:
                     # Staccato: apply percentage reduction (replaces gate timing)
                     # Apply to ORIGINAL duration, not already-reduced duration
-                    gate_adjusted_dur = int(native_duration * staccato_percentage / 100) * tick_scale
+                    gate_adjusted_dur = int(native_duration * state.staccato_percentage / 100) * tick_scale
                 else:
                     # Normal articulation: apply standard gate timing (2 native ticks before end)
-                    gate_adjusted_dur = (native_duration - gate_time) * tick_scale
+                    gate_adjusted_dur = (native_duration - state.gate_time) * tick_scale
 
                 # Calculate MIDI velocity using helper method
-                adjusted_velocity = self._scale_volume_to_midi(velocity, volume_multiplier, master_volume, velocity_scale)
+                adjusted_velocity = self._scale_volume_to_midi(state.velocity, state.volume_multiplier, state.master_volume, velocity_scale)
 
                 # Strategy: velocity, expression, or cc7
                 if midi_strategy in ['expression', 'cc7']:
@@ -767,9 +835,9 @@ class SNESUnified(SequenceFormat):
                     # For expression, also generate CC11 before note
                     # (VOLUME event already generated CC11, but regenerate for safety)
                     if midi_strategy == 'expression':
-                        midi_events.append({
+                        state.midi_events.append({
                             'type': 'controller',
-                            'time': total_time,
+                            'time': state.total_time,
                             'channel': midi_channel,
                             'controller': 11,  # Expression
                             'value': adjusted_velocity
@@ -779,9 +847,9 @@ class SNESUnified(SequenceFormat):
                     note_velocity = adjusted_velocity
 
                 # Add MIDI note event
-                midi_events.append({
+                state.midi_events.append({
                     'type': 'note',
-                    'time': total_time,
+                    'time': state.total_time,
                     'duration': gate_adjusted_dur,  # Adjusted for articulation
                     'note': midi_note,
                     'velocity': note_velocity,
@@ -789,18 +857,18 @@ class SNESUnified(SequenceFormat):
                 })
 
                 # ALWAYS advance time by FULL MIDI duration (unmodified by staccato/gate)
-                total_time += midi_dur
+                state.total_time += midi_dur
 
                 # Advance fade states by this event's duration (native ticks)
-                if volume_fade_active and volume_fade_ticks_remaining > 0:
-                    ticks_to_advance = min(native_duration, volume_fade_ticks_remaining)
-                    velocity += volume_fade_delta * ticks_to_advance
-                    volume_fade_ticks_remaining -= ticks_to_advance
-                    if volume_fade_ticks_remaining <= 0:
-                        velocity = volume_fade_target  # Snap to target
-                        volume_fade_active = False
+                if state.volume_fade_active and state.volume_fade_ticks_remaining > 0:
+                    ticks_to_advance = min(native_duration, state.volume_fade_ticks_remaining)
+                    state.velocity += state.volume_fade_delta * ticks_to_advance
+                    state.volume_fade_ticks_remaining -= ticks_to_advance
+                    if state.volume_fade_ticks_remaining <= 0:
+                        state.velocity = state.volume_fade_target  # Snap to target
+                        state.volume_fade_active = False
 
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.REST:
                 # Rest just advances time
@@ -808,18 +876,18 @@ class SNESUnified(SequenceFormat):
                 assert event.duration is not None, "REST event must have duration"
                 native_duration = event.duration
                 midi_dur = native_duration * tick_scale
-                total_time += midi_dur
+                state.total_time += midi_dur
 
                 # Advance fade states by this event's duration (native ticks)
-                if volume_fade_active and volume_fade_ticks_remaining > 0:
-                    ticks_to_advance = min(native_duration, volume_fade_ticks_remaining)
-                    velocity += volume_fade_delta * ticks_to_advance
-                    volume_fade_ticks_remaining -= ticks_to_advance
-                    if volume_fade_ticks_remaining <= 0:
-                        velocity = volume_fade_target  # Snap to target
-                        volume_fade_active = False
+                if state.volume_fade_active and state.volume_fade_ticks_remaining > 0:
+                    ticks_to_advance = min(native_duration, state.volume_fade_ticks_remaining)
+                    state.velocity += state.volume_fade_delta * ticks_to_advance
+                    state.volume_fade_ticks_remaining -= ticks_to_advance
+                    if state.volume_fade_ticks_remaining <= 0:
+                        state.velocity = state.volume_fade_target  # Snap to target
+                        state.volume_fade_active = False
 
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.TIE:
                 # Tie extends the last note
@@ -827,126 +895,121 @@ class SNESUnified(SequenceFormat):
                 assert event.duration is not None, "TIE event must have duration"
                 native_duration = event.duration
                 tie_dur = native_duration * tick_scale
-                for j in range(len(midi_events) - 1, -1, -1):
-                    if midi_events[j]['type'] == 'note':
-                        midi_events[j]['duration'] += tie_dur
+                for j in range(len(state.midi_events) - 1, -1, -1):
+                    if state.midi_events[j]['type'] == 'note':
+                        state.midi_events[j]['duration'] += tie_dur
                         break
-                total_time += tie_dur
+                state.total_time += tie_dur
 
                 # Advance fade states by this event's duration (native ticks)
-                if volume_fade_active and volume_fade_ticks_remaining > 0:
-                    ticks_to_advance = min(native_duration, volume_fade_ticks_remaining)
-                    velocity += volume_fade_delta * ticks_to_advance
-                    volume_fade_ticks_remaining -= ticks_to_advance
-                    if volume_fade_ticks_remaining <= 0:
-                        velocity = volume_fade_target  # Snap to target
-                        volume_fade_active = False
+                if state.volume_fade_active and state.volume_fade_ticks_remaining > 0:
+                    ticks_to_advance = min(native_duration, state.volume_fade_ticks_remaining)
+                    state.velocity += state.volume_fade_delta * ticks_to_advance
+                    state.volume_fade_ticks_remaining -= ticks_to_advance
+                    if state.volume_fade_ticks_remaining <= 0:
+                        state.velocity = state.volume_fade_target  # Snap to target
+                        state.volume_fade_active = False
 
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.TEMPO:
                 # Tempo change
                 assert event.value is not None, "TEMPO event must have value"
-                midi_events.append({
+                state.midi_events.append({
                     'type': 'tempo',
-                    'time': total_time,
+                    'time': state.total_time,
                     'tempo': event.value
                 })
-                tempo = event.value
-                i += 1
+                state.tempo = event.value
+                state.i += 1
 
             elif event.type == IREventType.TEMPO_FADE:
                 # Tempo fade - generate tempo events at 2-tick intervals
                 assert event.duration is not None and event.value is not None, "TEMPO_FADE must have duration and value"
                 fade_duration = event.duration * tick_scale  # Convert to MIDI ticks
                 target_tempo = event.value
-                start_tempo = tempo
+                start_tempo = state.tempo
 
                 # Generate interpolated tempo events
                 fade_events = self._generate_fade_events(
-                    'tempo', start_tempo, target_tempo, fade_duration, total_time
+                    'tempo', start_tempo, target_tempo, fade_duration, state.total_time
                 )
-                midi_events.extend(fade_events)
+                state.midi_events.extend(fade_events)
 
                 # Update current tempo to target
-                tempo = target_tempo
-                i += 1
+                state.tempo = target_tempo
+                state.i += 1
 
             elif event.type == IREventType.PATCH_CHANGE:
                 # Patch change
-                assert event.gm_patch is not None, "PATCH_CHANGE event must have gm_patch"
-                if event.gm_patch < 0:
-                    # Percussion mode
-                    perc_key = abs(event.gm_patch)
-                    transpose_octaves = event.transpose
-                else:
-                    # Regular instrument
-                    perc_key = 0
-                    transpose_octaves = event.transpose
-                    midi_events.append({
+                assert event.patch_slot is not None, "PATCH_CHANGE event must have patch_slot"
+                gm_patch, state.transpose_octaves, state.perc_key = self._resolve_patch(event.patch_bank, event.patch_slot)
+                if gm_patch >= 0:
+                    # Regular instrument (negative = percussion mode, no program change)
+                    state.midi_events.append({
                         'type': 'program_change',
-                        'time': total_time,
-                        'patch': event.gm_patch
+                        'time': state.total_time,
+                        'patch': gm_patch
                     })
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.OCTAVE_SET:
                 assert event.value is not None, "OCTAVE_SET event must have value"
-                octave = event.value
-                i += 1
+                state.octave = event.value
+                state.i += 1
 
             elif event.type == IREventType.OCTAVE_INC:
-                octave += 1
-                i += 1
+                state.octave += 1
+                state.i += 1
 
             elif event.type == IREventType.OCTAVE_DEC:
-                octave -= 1
-                i += 1
+                state.octave -= 1
+                state.i += 1
 
             elif event.type == IREventType.VOLUME:
                 # IR stores normalized value (0-255)
-                velocity = int(event.value)
+                state.velocity = int(event.value)
 
                 # Cancel any active volume fade (immediate volume change overrides fade)
-                volume_fade_active = False
+                state.volume_fade_active = False
 
                 # For controller-based strategies, generate controller event immediately
                 if midi_strategy == 'expression':
                     # Expression strategy: Use CC11
-                    expr_value = self._scale_volume_to_midi(velocity, volume_multiplier, master_volume, velocity_scale)
-                    midi_events.append({
+                    expr_value = self._scale_volume_to_midi(state.velocity, state.volume_multiplier, state.master_volume, velocity_scale)
+                    state.midi_events.append({
                         'type': 'controller',
-                        'time': total_time,
+                        'time': state.total_time,
                         'channel': current_channel,
                         'controller': 11,  # Expression
                         'value': expr_value
                     })
                 elif midi_strategy == 'cc7':
                     # CC7 strategy: Use CC7 (Main Volume)
-                    cc7_value = self._scale_volume_to_midi(velocity, volume_multiplier, master_volume, velocity_scale)
-                    midi_events.append({
+                    cc7_value = self._scale_volume_to_midi(state.velocity, state.volume_multiplier, state.master_volume, velocity_scale)
+                    state.midi_events.append({
                         'type': 'controller',
-                        'time': total_time,
+                        'time': state.total_time,
                         'channel': current_channel,
                         'controller': 7,  # Main Volume
                         'value': cc7_value
                     })
                 # else: velocity strategy stores in state variable for notes
 
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.PAN:
                 # Update current pan value
-                current_pan = int(event.value)
+                state.current_pan = int(event.value)
                 # Generate immediate MIDI CC 10 pan event
-                midi_events.append({
+                state.midi_events.append({
                     'type': 'controller',
-                    'time': total_time,
+                    'time': state.total_time,
                     'channel': current_channel,
                     'controller': 10,  # Pan CC
-                    'value': current_pan
+                    'value': state.current_pan
                 })
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.VOLUME_FADE:
                 # Volume fade - behavior depends on strategy
@@ -958,21 +1021,21 @@ class SNESUnified(SequenceFormat):
                 if midi_strategy == 'velocity':
                     # Velocity strategy: Activate fade state (SPC-style)
                     # Fade updates velocity state variable gradually over time
-                    volume_fade_active = True
-                    volume_fade_target = target_volume_ir
-                    volume_fade_delta = self._calculate_fade_delta(velocity, target_volume_ir, fade_duration_native)
-                    volume_fade_ticks_remaining = fade_duration_native
+                    state.volume_fade_active = True
+                    state.volume_fade_target = target_volume_ir
+                    state.volume_fade_delta = self._calculate_fade_delta(state.velocity, target_volume_ir, fade_duration_native)
+                    state.volume_fade_ticks_remaining = fade_duration_native
 
                     # No controller events generated - notes will use fading velocity
 
                 else:
                     # Controller strategies (expression/cc7): Generate controller events
                     fade_duration_midi = fade_duration_native * tick_scale  # Convert to MIDI ticks
-                    start_volume_ir = velocity  # Current velocity state (IR value 0-255)
+                    start_volume_ir = state.velocity  # Current velocity state (IR value 0-255)
 
                     # Scale BOTH start and target to MIDI range with multipliers
-                    start_volume_midi = self._scale_volume_to_midi(start_volume_ir, volume_multiplier, master_volume, velocity_scale)
-                    target_volume_midi = self._scale_volume_to_midi(target_volume_ir, volume_multiplier, master_volume, velocity_scale)
+                    start_volume_midi = self._scale_volume_to_midi(start_volume_ir, state.volume_multiplier, state.master_volume, velocity_scale)
+                    target_volume_midi = self._scale_volume_to_midi(target_volume_ir, state.volume_multiplier, state.master_volume, velocity_scale)
 
                     # Determine which controller to use
                     controller_num = 11 if midi_strategy == 'expression' else 7
@@ -980,137 +1043,138 @@ class SNESUnified(SequenceFormat):
                     # Generate interpolated controller events using SCALED values
                     fade_events = self._generate_fade_events(
                         'controller', start_volume_midi, target_volume_midi,
-                        fade_duration_midi, total_time, current_channel, controller_num
+                        fade_duration_midi, state.total_time, current_channel, controller_num
                     )
-                    midi_events.extend(fade_events)
+                    state.midi_events.extend(fade_events)
 
                     # Update velocity state immediately to target (IR value)
-                    velocity = target_volume_ir
+                    state.velocity = target_volume_ir
 
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.PAN_FADE:
                 # Pan fade - generate CC 10 events at 2-tick intervals
                 assert event.duration is not None and event.value is not None, "PAN_FADE must have duration and value"
                 fade_duration = event.duration * tick_scale  # Convert to MIDI ticks
                 target_pan = event.value
-                start_pan = current_pan
+                start_pan = state.current_pan
 
                 # Generate interpolated pan events
                 fade_events = self._generate_fade_events(
                     'controller', start_pan, target_pan, fade_duration,
-                    total_time, current_channel, 10  # CC 10 = pan
+                    state.total_time, current_channel, 10  # CC 10 = pan
                 )
-                midi_events.extend(fade_events)
+                state.midi_events.extend(fade_events)
 
                 # Update current pan to target
-                current_pan = target_pan
-                i += 1
+                state.current_pan = target_pan
+                state.i += 1
 
             elif event.type == IREventType.SLUR_ON:
-                slur_enabled = True
+                state.slur_enabled = True
                 # Emit MIDI CC 68 (legato pedal) = 127
-                midi_events.append({
+                state.midi_events.append({
                     'type': 'controller',
-                    'time': total_time,
+                    'time': state.total_time,
                     'controller': 68,  # Legato pedal CC
                     'value': 127
                 })
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.SLUR_OFF:
-                slur_enabled = False
+                state.slur_enabled = False
                 # Emit MIDI CC 68 (legato pedal) = 0
-                midi_events.append({
+                state.midi_events.append({
                     'type': 'controller',
-                    'time': total_time,
+                    'time': state.total_time,
                     'controller': 68,  # Legato pedal CC
                     'value': 0
                 })
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.ROLL_ON:
-                roll_enabled = True
-                i += 1
+                state.roll_enabled = True
+                state.i += 1
 
             elif event.type == IREventType.ROLL_OFF:
-                roll_enabled = False
-                i += 1
+                state.roll_enabled = False
+                state.i += 1
 
             elif event.type == IREventType.STACCATO:
                 # Set staccato percentage for all subsequent notes
                 assert event.value is not None, "STACCATO event must have value"
-                staccato_percentage = int(event.value)
-                i += 1
+                state.staccato_percentage = int(event.value)
+                state.i += 1
 
             elif event.type == IREventType.UTILITY_DURATION:
                 # Override duration for next note only
                 assert event.value is not None, "UTILITY_DURATION event must have value"
-                utility_duration_override = int(event.value)
-                i += 1
+                state.utility_duration_override = int(event.value)
+                state.i += 1
 
             elif event.type == IREventType.MASTER_VOLUME:
                 # Set master volume (SoM 0xF8) - global volume multiplier
                 # Value is normalized float 0.0-1.0 from Pass 1
                 assert event.value is not None, "MASTER_VOLUME event must have value"
                 if apply_master_volume_config:
-                    master_volume = float(event.value)
+                    state.master_volume = float(event.value)
                 # If disabled, keep master_volume at 1.0 (no effect)
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.VOLUME_MULTIPLIER:
                 # Set volume multiplier (CT/FF3 0xF4/0xFD) - per-track multiplier
                 # Value is normalized float 0.0-1.0 from Pass 1
                 assert event.value is not None, "VOLUME_MULTIPLIER event must have value"
                 if apply_multiplier:
-                    volume_multiplier = float(event.value)
+                    state.volume_multiplier = float(event.value)
                 # If disabled, keep volume_multiplier at 1.0 (no effect)
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.PERCUSSION_MODE_ON:
                 # Percussion mode handling is done in Pass 1
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.PERCUSSION_MODE_OFF:
                 # Percussion mode handling is done in Pass 1
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.LOOP_START:
                 # Push loop onto stack
-                loop_stack.append({
-                    'start_idx': i + 1,  # Start after LOOP_START
+                state.loop_stack.append({
+                    'start_idx': state.i + 1,  # Start after LOOP_START
                     'count': event.loop_count,
                     'iteration': 0,
-                    'octave': octave,
+                    'octave': state.octave,
                     'end_idx': None  # Will be set when we find LOOP_END
                 })
-                i += 1
+                state.i += 1
 
             elif event.type == IREventType.LOOP_END:
                 # End of loop body - decide if we repeat
-                if loop_stack:
-                    loop = loop_stack[-1]
+                if state.loop_stack:
+                    loop = state.loop_stack[-1]
                     loop['count'] -= 1
 
                     if loop['count'] >= 0:
                         # Repeat: jump back to loop start
-                        i = loop['start_idx']
+                        state.i = loop['start_idx']
+                        loop_iterations += 1
                         # Restore octave if needed
                         if event.restore_octave:
-                            octave = loop['octave']
+                            state.octave = loop['octave']
                     else:
                         # Done looping: pop and continue
-                        loop_stack.pop()
-                        i += 1
+                        state.loop_stack.pop()
+                        state.i += 1
                 else:
                     # No matching loop start? Just continue
-                    i += 1
+                    state.i += 1
 
             elif event.type == IREventType.LOOP_BREAK:
                 # Selective repeat (F5): conditional jump on specific iteration
                 # This increments the current loop iteration and jumps if it matches the condition
-                if loop_stack:
-                    loop = loop_stack[-1]
+                if state.loop_stack:
+                    loop = state.loop_stack[-1]
                     loop['iteration'] += 1
 
                     if loop['iteration'] == event.condition:
@@ -1123,21 +1187,22 @@ class SNESUnified(SequenceFormat):
                                 break
 
                         if target_idx is not None:
-                            i = target_idx
-                            loop_stack.pop()  # Exit this loop level
+                            state.i = target_idx
+                            state.loop_stack.pop()  # Exit this loop level
                         else:
                             # Target not found, just continue
-                            i += 1
+                            state.i += 1
                     else:
                         # Condition not met: continue to next event
-                        i += 1
+                        state.i += 1
                 else:
                     # No loop context, just skip
-                    i += 1
+                    state.i += 1
 
             elif event.type == IREventType.GOTO:
                 # Determine GOTO type and handle accordingly
                 if event.target_offset is None:
+                    stop = 'bad_goto'
                     break  # Invalid GOTO
 
                 # Find target track and event
@@ -1145,47 +1210,59 @@ class SNESUnified(SequenceFormat):
 
                 if result is None:
                     # Target not found - halt
+                    stop = 'bad_goto'
                     break
 
                 target_track, target_idx = result
 
                 # Classify GOTO type
                 is_backwards = event.target_offset < event.offset
-                is_cross_track = target_track != current_voice_num
+                is_cross_track = target_track != state.current_voice_num
 
                 if is_backwards and not is_cross_track:
                     # Backwards loop within same track
-                    if loop_info and loop_info.get('has_backwards_goto', False) and target_loop_time > 0:
+                    if loop_info and loop_info.get('has_backwards_goto', False) and (target_loop_time > 0 or endless):
                         # Follow loop until target time reached
-                        i = target_idx
+                        state.i = target_idx
+                        loop_iterations += 1
                     else:
                         # No loop playback requested - halt at loop point
+                        stop = 'halt'
                         break
                 else:
                     # Forward GOTO or cross-track GOTO - follow as normal continuation
-                    current_voice_num = target_track
-                    ir_events = all_track_data['tracks'][current_voice_num]['ir_events']
-                    i = target_idx
+                    state.current_voice_num = target_track
+                    ir_events = all_track_data['tracks'][state.current_voice_num]['ir_events']
+                    state.i = target_idx
 
                     # Switch to target track's loop_info
-                    loop_info = all_track_data['tracks'][current_voice_num].get('loop_info', {})
+                    loop_info = all_track_data['tracks'][state.current_voice_num].get('loop_info', {})
 
                     # target_loop_time is global - no need to recalculate
 
             elif event.type == IREventType.HALT:
                 # End of track
+                stop = 'halt'
                 break
 
             else:
                 # Other event types (vibrato, tremolo, etc.) are not yet expanded
                 # Just skip for now
-                i += 1
+                state.i += 1
 
         # Check if we hit the iteration limit
         if iteration_count >= max_iterations:
             print(f"WARNING: Track {start_voice_num} hit max iteration limit ({max_iterations}), possible infinite loop")
+            stop = 'iteration_limit'
+
+        if stats is not None:
+            stats['loop_iterations'] = loop_iterations
+            stats['stop'] = stop
 
-        return midi_events
+        if window is not None:
+            state.midi_events = window.filter(state.midi_events)
+        if state.midi_events:
+            yield state.total_time, state.midi_events
 
     def _read_song_pointer_table(self) -> Dict[int, Tuple[int, int]]:
         """Read song pointer table - supports both FF2 and FF3 styles via config."""
@@ -1236,6 +1313,16 @@ class SNESUnified(SequenceFormat):
 
         return rom_offset + self.smc_header_size
 
+    def _init_render_state(self, config: Dict):
+        """Set up the state Pass 2 needs from config (initial voice state, patch resolver)."""
+        self.default_tempo = config.get('default_tempo', 255)
+        self.default_octave = config.get('default_octave', 4)
+        self.default_velocity = config.get('default_velocity', 64)
+
+        # Patch map (patch_map_low is used by the FF3/CT dual_map handler);
+        # Pass 1 records patch map keys, Pass 2 resolves them
+        self.patch_resolver = PatchResolver(config.get('patch_map'), config.get('patch_map_low'))
+
     def _read_rom_table(self, address: int, size: int, data_type: str) -> List[int]:
         """Read a table from the ROM using instance method for address conversion."""
         file_offset = self._snes_addr_to_offset(address)
@@ -1366,11 +1453,13 @@ class SNESUnified(SequenceFormat):
                 offsets.append(buffer_offset)
         return offsets
 
-    def _resolve_patch(self, inst_id: int, handler: Optional[Dict] = None,
-                      instrument_table: Optional[List[int]] = None) -> tuple[int, int, int]:
-        """Resolve an instrument ID to GM patch, transpose, and percussion key.
+    def _patch_slot(self, inst_id: int, handler: Optional[Dict] = None,
+                    instrument_table: Optional[List[int]] = None) -> Tuple[int, int]:
+        """Resolve an instrument ID to its patch_map bank and slot.
 
-        This centralizes the patch mapping logic used by both patch_change and percussion mode.
+        This is the ROM-dependent half of patch resolution (instrument table
+        lookup); the slot is stored in the IR and mapped to a GM patch by
+        self.patch_resolver, so patch_map edits don't need a new Pass 1.
 
         Args:
             inst_id: Raw instrument ID (from operand or percussion table)
@@ -1378,13 +1467,12 @@ class SNESUnified(SequenceFormat):
             instrument_table: Instrument table for inst_table lookups
 
         Returns:
-            Tuple of (gm_patch, transpose_octaves, perc_key)
-            - gm_patch: General MIDI patch number (negative = percussion GM key)
-            - transpose_octaves: Octave transpose for this instrument
-            - perc_key: Percussion key (0 if not percussion, abs(gm_patch) if percussion)
+            Tuple of (patch_bank, patch_slot)
+            - patch_bank: PatchResolver.BANK_HIGH (patch_map) or BANK_LOW (patch_map_low)
+            - patch_slot: Key into that patch map
         """
         actual_inst_id = inst_id
-        patch_map_to_use = self.patch_map
+        bank = PatchResolver.BANK_HIGH
 
         # If handler is provided, resolve inst_id through instrument_table
         if handler and instrument_table:
@@ -1409,28 +1497,53 @@ class SNESUnified(SequenceFormat):
                 else:
                     # Use low patch map directly (inst_id stays the same)
                     actual_inst_id = inst_id
-                    if self.patch_map_low:
-                        patch_map_to_use = self.patch_map_low
+                    bank = PatchResolver.BANK_LOW
 
         # Note: When called without handler (e.g., percussion mode), always use patch_map
         # patch_map_low is only for opcodes with dual_map handler
+        return (bank, actual_inst_id)
 
-        # Look up in patch map
-        if actual_inst_id in patch_map_to_use:
-            patch_info = patch_map_to_use[actual_inst_id]
-            gm_patch = patch_info['gm_patch']
-            transpose_octaves = patch_info.get('transpose', 0)
+    def _patch_slot_table(self, handler: Optional[Dict],
+                          instrument_table: Optional[List[int]]) -> List[Tuple[int, int]]:
+        """Return _patch_slot() results for every byte instrument ID.
 
-            # Check if this is percussion (negative GM patch number)
-            if gm_patch < 0:
-                perc_key = abs(gm_patch)
-            else:
-                perc_key = 0
+        Computed once per (handler, song instrument table) so the inst_table/dual_map
+        indirection in Pass 1 is a single list index.
 
-            return (gm_patch, transpose_octaves, perc_key)
-        else:
-            # Instrument not found in patch map
+        Args:
+            handler: Handler config (type/param), as for _patch_slot()
+            instrument_table: Song's instrument table
+
+        Returns:
+            List of (patch_bank, patch_slot) indexed by instrument ID (0x00-0xFF)
+        """
+        key = (handler.get('type', 'inst_table') if handler else None,
+               handler.get('param', 0) if handler else None,
+               tuple(instrument_table or ()))
+        table = self._patch_slot_tables.get(key)
+        if table is None:
+            table = [self._patch_slot(inst_id, handler, instrument_table) for inst_id in range(0x100)]
+            self._patch_slot_tables[key] = table
+        return table
+
+    def _resolve_patch(self, patch_bank: int, patch_slot: int) -> tuple[int, int, int]:
+        """Resolve a patch slot to GM patch, transpose, and percussion key.
+
+        Args:
+            patch_bank: Bank returned by _patch_slot()
+            patch_slot: Slot returned by _patch_slot()
+
+        Returns:
+            Tuple of (gm_patch, transpose_octaves, perc_key)
+            - gm_patch: General MIDI patch number (negative = percussion GM key)
+            - transpose_octaves: Octave transpose for this instrument
+            - perc_key: Percussion key (0 if not percussion, abs(gm_patch) if percussion)
+        """
+        table = self.patch_resolver.banks[patch_bank]
+        if not 0 <= patch_slot < len(table.gm_patch):
+            # Instruments not found in the patch map resolve to (0, 0)
             return (0, 0, 0)
+        return (table.gm_patch[patch_slot], table.transpose[patch_slot], table.perc_key[patch_slot])
 
     def _parse_track_pass1(self, data: bytes, offset: int, track_num: int,
                           instrument_table: List[int], vaddroffset: int = 0,
@@ -1455,10 +1568,12 @@ class SNESUnified(SequenceFormat):
         octave = self.default_octave
         velocity = self.default_velocity
         tempo = self.default_tempo
-        perc_key = 0
+        perc_key = 0  # Only used to annotate the disassembly
         percussion_mode = False  # Track percussion mode state
-        transpose_octaves = 0
+        patch_bank, patch_slot = PatchResolver.BANK_HIGH, 0  # Current patch_map entry
         inst_id = 0  # Current instrument ID from table
+        # (patch_bank, patch_slot) per instrument ID under the game-wide instrument mapping
+        patch_slots = self._patch_slot_table(self.instrument_mapping, instrument_table)
 
         # Track loop depth for disassembly indentation (but don't execute loops)
         loop_depth = 0
@@ -1517,9 +1632,13 @@ class SNESUnified(SequenceFormat):
 
                         # Resolve patch mapping for percussion instrument
                         # Use game-wide instrument mapping
-                        gm_patch, perc_transpose, resolved_perc_key = self._resolve_patch(
-                            perc_inst_id, self.instrument_mapping, instrument_table
-                        )
+                        if perc_inst_id < len(patch_slots):
+                            perc_bank, perc_slot = patch_slots[perc_inst_id]
+                        else:
+                            perc_bank, perc_slot = self._patch_slot(
+                                perc_inst_id, self.instrument_mapping, instrument_table
+                            )
+                        resolved_perc_key = self._resolve_patch(perc_bank, perc_slot)[2]
 
                         # Override note if percussion table specifies it (non-zero)
                         if perc_note != 0:
@@ -1535,8 +1654,9 @@ class SNESUnified(SequenceFormat):
                         event = make_note(p, actual_note_num, dur)
                         event.metadata = {
                             'velocity': perc_vol,  # Use volume from percussion table
-                            'perc_key': resolved_perc_key,  # GM percussion key
-                            'transpose': perc_transpose + actual_octave_offset,  # Apply transpose + octave offset
+                            'patch_bank': perc_bank,  # GM percussion key and transpose
+                            'patch_slot': perc_slot,  # are resolved in Pass 2
+                            'octave_offset': actual_octave_offset,
                             'track_num': 9,  # MIDI percussion channel
                             'inst_id': perc_inst_id,
                             'percussion_mode': True
@@ -1554,8 +1674,8 @@ class SNESUnified(SequenceFormat):
                         # NOTE: octave and velocity are NOT stored here - tracked as state in Pass 2
                         # because loops can modify them during execution
                         event.metadata = {
-                            'perc_key': perc_key,
-                            'transpose': transpose_octaves,
+                            'patch_bank': patch_bank,
+                            'patch_slot': patch_slot,
                             'track_num': track_num,
                             'inst_id': inst_id
                         }
@@ -1661,13 +1781,14 @@ class SNESUnified(SequenceFormat):
                 elif semantic == "patch_change" and len(operands) >= 1:
                     # Use game-wide mapping, fall back to opcode-specific
                     if handler is None:
-                        handler = self.instrument_mapping
+                        slots = patch_slots
+                    else:
+                        slots = self._patch_slot_table(handler, instrument_table)
 
-                    # Use helper function to resolve patch mapping
+                    # Use helper functions to resolve patch mapping
                     inst_id = operands[0]
-                    gm_patch, transpose_octaves, perc_key = self._resolve_patch(
-                        inst_id, handler, instrument_table
-                    )
+                    patch_bank, patch_slot = slots[inst_id]
+                    gm_patch, _, perc_key = self._resolve_patch(patch_bank, patch_slot)
 
                     # Add disassembly annotation
                     if gm_patch < 0:
@@ -1678,7 +1799,7 @@ class SNESUnified(SequenceFormat):
                         line += f" -> GM patch {gm_patch}"
 
                     # Create IR event for patch change
-                    event = make_patch_change(p, inst_id, gm_patch, transpose_octaves, operands)
+                    event = make_patch_change(p, inst_id, patch_slot, patch_bank, operands)
                     ir_events.append(event)
 
                 elif semantic == "octave_set" and len(operands) >= 1:
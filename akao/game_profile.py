@@ -0,0 +1,167 @@
+"""
+Compiled game configs.
+
+A game's YAML config is parsed (with PyYAML's C loader when available),
+validated and normalized once into a GameProfile:
+  - hex-string keys of the opcode and patch maps become ints
+  - the song list becomes SongMetadata
+  - the format handler's derived tables (e.g. the SNES opcode dispatch and
+    names) are computed by its compile_config()
+Profiles are cached as pickles in a per-user cache directory (see
+default_cache_dir()), one per config file, and are reused while the file's
+SHA-256 is unchanged. Later runs and server reloads skip YAML parsing (and the
+yaml import) altogether.
+"""
+
+import os
+import pickle
+import hashlib
+import contextlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from build_cache import atomic_output
+from format_base import SongMetadata, load_format_handler
+
+
+# Bump when GameProfile or a handler's compile_config() output changes, so
+# cached profiles are rebuilt
+PROFILE_VERSION = 1
+
+# Config sections keyed by opcode or instrument ID (int or "0x.." string)
+INT_KEY_SECTIONS = ('opcodes', 'patch_map', 'patch_map_low')
+
+CONSOLE_TYPES = ('psx', 'snes')
+
+
+@dataclass
+class GameProfile:
+    """A validated, normalized game config."""
+    path: str  # Config file the profile was compiled from
+    digest: str  # SHA-256 of the config file
+    config: Dict  # Normalized config, as used by the extractor and format handlers
+    console_type: str
+    format: str
+    songs: List[SongMetadata] = field(default_factory=list)
+    handler_tables: Dict[str, Any] = field(default_factory=dict)  # From the handler's compile_config()
+    version: int = PROFILE_VERSION
+
+
+def default_cache_dir() -> Path:
+    """Profile cache directory: $AKAO_CACHE_DIR, or ~/.cache/akao."""
+    return Path(os.environ.get('AKAO_CACHE_DIR') or Path.home() / '.cache' / 'akao')
+
+
+def load_yaml(source: Union[str, bytes, Path]) -> Any:
+    """Parse YAML with the C loader if PyYAML was built with libyaml.
+
+    Args:
+        source: YAML text (str or bytes) or a file path
+    """
+    import yaml  # Only needed when a profile (or batch file) is parsed
+    if isinstance(source, Path):
+        source = source.read_bytes()
+    return yaml.load(source, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def _normalize_keys(section: str, table, path: str) -> Dict:
+    if not isinstance(table, dict):
+        raise ValueError(f"{path}: {section} must be a mapping")
+    normalized = {}
+    for key, value in table.items():
+        try:
+            normalized[key if isinstance(key, int) else int(str(key), 0)] = value
+        except ValueError:
+            raise ValueError(f"{path}: {section}: key {key!r} is not an integer") from None
+    return normalized
+
+
+def compile_profile(config: Any, path: str = '<config>', digest: str = '') -> GameProfile:
+    """Validate and normalize a parsed game config.
+
+    Args:
+        config: Parsed YAML
+        path: Config file, for error messages
+        digest: SHA-256 of the config file
+
+    Returns:
+        GameProfile
+
+    Raises:
+        ValueError: If the config is malformed (unknown format or console
+            type, bad song entries, non-integer opcode/patch map keys)
+    """
+    if not isinstance(config, dict):
+        raise ValueError(f"{path}: config must be a mapping")
+    config = dict(config)
+
+    console_type = config.get('console_type', 'psx')
+    if console_type not in CONSOLE_TYPES:
+        raise ValueError(f"{path}: unknown console_type {console_type!r} (choose from {', '.join(CONSOLE_TYPES)})")
+
+    for section in INT_KEY_SECTIONS:
+        if config.get(section) is not None:
+            config[section] = _normalize_keys(section, config[section], path)
+
+    songs = []
+    for entry in config.get('songs') or []:
+        if not isinstance(entry, dict) or not isinstance(entry.get('id'), int):
+            raise ValueError(f"{path}: every song needs an integer 'id' (got {entry!r})")
+        try:
+            songs.append(SongMetadata(**entry))
+        except TypeError as e:
+            raise ValueError(f"{path}: song {entry['id']:02X}: {e}") from None
+
+    format_name = config.get('format', 'akao_newstyle')
+    try:
+        handler_class = load_format_handler(format_name)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+    return GameProfile(path=str(path), digest=digest, config=config, console_type=console_type,
+                       format=format_name, songs=songs, handler_tables=handler_class.compile_config(config))
+
+
+def _cache_file(config_path: Path, cache_dir: Path) -> Path:
+    """Cache file for a config: one per config path, overwritten when the config changes."""
+    path_key = hashlib.sha256(str(config_path.resolve()).encode('utf-8')).hexdigest()[:16]
+    return cache_dir / f"{config_path.stem}-{path_key}.profile.pickle"
+
+
+def load_profile(config_path: Union[str, Path], cache_dir: Optional[Path] = None,
+                 use_cache: bool = True) -> GameProfile:
+    """Load a game config as a GameProfile, from the profile cache if it is current.
+
+    The cache is best effort: unreadable or stale cache files are rebuilt, and
+    a cache directory that can't be written is ignored.
+
+    Args:
+        config_path: Game YAML config
+        cache_dir: Profile cache directory (default: default_cache_dir())
+        use_cache: False to always parse the YAML (nothing is cached)
+
+    Returns:
+        GameProfile
+    """
+    config_path = Path(config_path)
+    data = config_path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    cache_file = _cache_file(config_path, cache_dir or default_cache_dir()) if use_cache else None
+
+    if cache_file is not None:
+        with contextlib.suppress(Exception):  # Missing, truncated or from an older version
+            with open(cache_file, 'rb') as f:
+                profile = pickle.load(f)
+            if isinstance(profile, GameProfile) and profile.version == PROFILE_VERSION and profile.digest == digest:
+                profile.path = str(config_path)
+                return profile
+
+    profile = compile_profile(load_yaml(data), str(config_path), digest)
+
+    if cache_file is not None:
+        with contextlib.suppress(OSError):
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_output(cache_file) as tmp:
+                with open(tmp, 'wb') as f:
+                    pickle.dump(profile, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return profile
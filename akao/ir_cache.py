@@ -0,0 +1,294 @@
+"""
+Binary IR cache: Pass 1 results and loop analysis stored for re-rendering.
+
+Writing a song's IR after Pass 1 lets later runs regenerate MIDI/MusicXML (e.g.
+after tuning midi_render settings) without reading the ROM/ISO or re-running
+Pass 1. Files are loaded with mmap.
+
+File layout (all integers little-endian):
+  magic       4 bytes  b'AKIR'
+  version     uint16   IR_CACHE_VERSION
+  reserved    uint16
+  toc_offset  uint64   location of the table of contents
+  toc_len     uint32   length of the table of contents
+  columns     one typed array per IREvent field and voice, 8-byte aligned
+  toc         Python literal (UTF-8) with song info, header, loop analysis,
+              event type names and, per voice, the location of each column
+
+Variable-length fields are stored as a flat values column plus a per-event
+start index (operands), or as a literal keyed by event index (metadata).
+"""
+
+import ast
+import sys
+import mmap
+import struct
+from array import array
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from ir_events import IREvent, IREventType
+
+
+IR_CACHE_MAGIC = b'AKIR'
+IR_CACHE_VERSION = 2
+IR_CACHE_EXT = '.akir'
+
+_PREAMBLE = struct.Struct('<4sHHQI')
+
+# Stand-in for None in integer columns
+_NONE = -(1 << 63)
+
+# Kinds stored alongside the float64 value column (IREvent.value is int|float|None)
+_VALUE_NONE, _VALUE_INT, _VALUE_FLOAT = 0, 1, 2
+
+# Optional integer fields, stored as int64 columns
+_INT_FIELDS = ('note_num', 'duration', 'loop_count', 'target_offset', 'condition',
+               'inst_id', 'patch_slot')
+
+
+class IRCacheError(ValueError):
+    """Raised when an IR cache file is missing, corrupt or from another version."""
+
+
+def _column(typecode: str, values) -> array:
+    """Build a little-endian typed column."""
+    column = array(typecode, values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def _encode_voice(ir_events: List[IREvent], type_index: Dict[IREventType, int]) -> Tuple[Dict[str, array], Dict]:
+    """Split a voice's IR events into typed columns.
+
+    Returns:
+        (columns, metadata) where metadata maps event index -> metadata dict
+    """
+    types = []
+    offsets = []
+    ints: Dict[str, List[int]] = {name: [] for name in _INT_FIELDS}
+    values = []
+    value_kinds = []
+    restore_octave = []
+    patch_bank = []
+    operand_starts = [0]
+    operands: List[int] = []
+    metadata = {}
+
+    for idx, event in enumerate(ir_events):
+        types.append(type_index[event.type])
+        offsets.append(event.offset)
+        for name in _INT_FIELDS:
+            value = getattr(event, name)
+            ints[name].append(_NONE if value is None else value)
+
+        value = event.value
+        if value is None:
+            value_kinds.append(_VALUE_NONE)
+            values.append(0.0)
+        elif isinstance(value, float):
+            value_kinds.append(_VALUE_FLOAT)
+            values.append(value)
+        else:
+            value_kinds.append(_VALUE_INT)
+            values.append(float(value))
+
+        restore_octave.append(-1 if event.restore_octave is None else int(event.restore_octave))
+        patch_bank.append(event.patch_bank)
+
+        operands.extend(event.operands)
+        operand_starts.append(len(operands))
+
+        if event.metadata:
+            metadata[idx] = event.metadata
+
+    columns = {
+        'type': _column('B', types),
+        'offset': _column('q', offsets),
+        'value': _column('d', values),
+        'value_kind': _column('b', value_kinds),
+        'restore_octave': _column('b', restore_octave),
+        'patch_bank': _column('B', patch_bank),
+        'operand_start': _column('q', operand_starts),
+        'operands': _column('q', operands),
+    }
+    for name in _INT_FIELDS:
+        columns[name] = _column('q', ints[name])
+    return columns, metadata
+
+
+def write_ir_cache(path: Path, song, track_data: Dict, loop_analysis: Dict):
+    """Write Pass 1 results and loop analysis for one song.
+
+    Disassembly lines are not stored; text disassembly needs the source image.
+
+    Args:
+        path: Output file path
+        song: Song metadata
+        track_data: Output from parse_all_tracks()
+        loop_analysis: Output from analyze_song_structure()
+    """
+    event_types = list(IREventType)
+    type_index = {event_type: i for i, event_type in enumerate(event_types)}
+
+    with open(path, 'wb') as f:
+        # Placeholder preamble; the TOC location is filled in at the end
+        f.write(_PREAMBLE.pack(IR_CACHE_MAGIC, IR_CACHE_VERSION, 0, 0, 0))
+
+        voices = []
+        for voice_num in sorted(track_data['tracks'].keys()):
+            track = track_data['tracks'][voice_num]
+            columns, metadata = _encode_voice(track['ir_events'], type_index)
+            locations = {}
+            for name, column in columns.items():
+                f.write(b'\0' * (-f.tell() % 8))  # Align for zero-copy casts
+                locations[name] = (column.typecode, f.tell(), len(column) * column.itemsize)
+                column.tofile(f)
+            voices.append({
+                'voice_num': voice_num,
+                'offset': track['offset'],
+                'count': len(track['ir_events']),
+                'metadata': metadata,
+                'columns': locations,
+            })
+
+        toc = {
+            'song': {'id': song.id, 'title': song.title},
+            'header': track_data['header'],
+            'loop_analysis': loop_analysis,
+            'event_types': [event_type.name for event_type in event_types],
+            'voices': voices,
+        }
+        toc_bytes = repr(toc).encode('utf-8')
+        toc_offset = f.tell()
+        f.write(toc_bytes)
+
+        f.seek(0)
+        f.write(_PREAMBLE.pack(IR_CACHE_MAGIC, IR_CACHE_VERSION, 0, toc_offset, len(toc_bytes)))
+
+
+class IRCacheFile:
+    """Memory-mapped IR cache file.
+
+    Use as a context manager; the returned track data is independent of the
+    mapping and stays valid after the file is closed.
+    """
+
+    def __init__(self, path: Path):
+        """Open and validate an IR cache file.
+
+        Args:
+            path: Path to a file written by write_ir_cache()
+
+        Raises:
+            IRCacheError: If the file is not a valid IR cache of this version
+        """
+        self.path = Path(path)
+        try:
+            with open(self.path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise IRCacheError(f"Cannot read IR cache {self.path}: {e}")
+
+        try:
+            magic, version, _, toc_offset, toc_len = _PREAMBLE.unpack_from(self._mmap, 0)
+            if magic != IR_CACHE_MAGIC:
+                raise IRCacheError(f"{self.path} is not an IR cache file")
+            if version != IR_CACHE_VERSION:
+                raise IRCacheError(f"{self.path}: IR cache version {version}, expected {IR_CACHE_VERSION}")
+            toc_bytes = self._mmap[toc_offset:toc_offset + toc_len]
+            self.toc = ast.literal_eval(toc_bytes.decode('utf-8'))
+            self._event_types = [IREventType[name] for name in self.toc['event_types']]
+        except (struct.error, SyntaxError, ValueError, KeyError) as e:
+            self.close()
+            if isinstance(e, IRCacheError):
+                raise
+            raise IRCacheError(f"{self.path}: corrupt IR cache ({e})")
+
+    def close(self):
+        """Release the memory mapping."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def song_id(self) -> int:
+        return self.toc['song']['id']
+
+    @property
+    def title(self) -> str:
+        return self.toc['song']['title']
+
+    def _read_column(self, voice: Dict, name: str):
+        """Return a column as a sequence of Python numbers."""
+        typecode, start, size = voice['columns'][name]
+        with memoryview(self._mmap)[start:start + size] as raw:
+            if sys.byteorder == 'little':
+                with raw.cast(typecode) as column:
+                    return column.tolist()
+            swapped = array(typecode, raw.tobytes())
+        swapped.byteswap()
+        return swapped.tolist()
+
+    def _decode_voice(self, voice: Dict) -> List[IREvent]:
+        """Rebuild a voice's IREvent list from its columns."""
+        col = {name: self._read_column(voice, name) for name in voice['columns']}
+        metadata = voice['metadata']
+        event_types = self._event_types
+        operand_start = col['operand_start']
+        operands = col['operands']
+
+        events = []
+        for i in range(voice['count']):
+            kind = col['value_kind'][i]
+            if kind == _VALUE_NONE:
+                value = None
+            elif kind == _VALUE_INT:
+                value = int(col['value'][i])
+            else:
+                value = col['value'][i]
+            restore = col['restore_octave'][i]
+
+            fields = {name: (None if col[name][i] == _NONE else col[name][i]) for name in _INT_FIELDS}
+            events.append(IREvent(
+                type=event_types[col['type'][i]],
+                offset=col['offset'][i],
+                value=value,
+                operands=operands[operand_start[i]:operand_start[i + 1]],
+                restore_octave=None if restore < 0 else bool(restore),
+                patch_bank=col['patch_bank'][i],
+                metadata=metadata.get(i, {}),
+                **fields,
+            ))
+        return events
+
+    def track_data(self) -> Dict:
+        """Return the song's track data in the shape produced by parse_all_tracks().
+
+        disasm_lines are empty (not stored in the cache).
+        """
+        tracks = {}
+        for voice in self.toc['voices']:
+            tracks[voice['voice_num']] = {
+                'offset': voice['offset'],
+                'ir_events': self._decode_voice(voice),
+                'disasm_lines': [],
+            }
+        return {'header': self.toc['header'], 'tracks': tracks}
+
+    def loop_analysis(self) -> Dict:
+        """Return the stored loop analysis (as from analyze_song_structure())."""
+        return self.toc['loop_analysis']
+
+
+def load_ir_cache(path: Path) -> Tuple[Dict, Dict]:
+    """Load (track_data, loop_analysis) from an IR cache file."""
+    with IRCacheFile(path) as cache:
+        return cache.track_data(), cache.loop_analysis()
@@ -83,9 +83,11 @@ class IREvent:
     restore_octave: Optional[bool] = None  # For loop_end, restore octave to value at loop_start
 
     # For patch changes - track instrument context
+    # GM patch and transpose are resolved from the patch map in Pass 2 (PatchResolver),
+    # so patch map edits do not invalidate the IR
     inst_id: Optional[int] = None  # Game-specific instrument ID
-    gm_patch: Optional[int] = None  # General MIDI patch (negative = percussion)
-    transpose: int = 0  # Octave transpose for this instrument
+    patch_slot: Optional[int] = None  # Patch map key (after instrument table lookup)
+    patch_bank: int = 0  # Patch map holding patch_slot (0 = patch_map, 1 = patch_map_low)
 
     # Additional metadata
     metadata: Dict[str, Any] = field(default_factory=dict)
@@ -217,15 +219,23 @@ def make_tempo_fade(offset: int, duration: int, target_bpm: float,
     )
 
 
-def make_patch_change(offset: int, inst_id: int, gm_patch: int,
-                     transpose: int = 0, operands: Optional[List[int]] = None) -> IREvent:
-    """Create a patch change event."""
+def make_patch_change(offset: int, inst_id: int, patch_slot: int,
+                     patch_bank: int = 0, operands: Optional[List[int]] = None) -> IREvent:
+    """Create a patch change event.
+
+    Args:
+        offset: Byte offset in original data
+        inst_id: Instrument ID operand
+        patch_slot: Patch map key the instrument resolves to
+        patch_bank: Patch map holding patch_slot (see PatchResolver)
+        operands: Raw operand bytes from the original format
+    """
     return IREvent(
         type=IREventType.PATCH_CHANGE,
         offset=offset,
         inst_id=inst_id,
-        gm_patch=gm_patch,
-        transpose=transpose,
+        patch_slot=patch_slot,
+        patch_bank=patch_bank,
         operands=operands or []
     )
 
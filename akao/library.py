@@ -0,0 +1,198 @@
+"""
+Library API: render songs into memory or caller-supplied file objects.
+
+For embedding the extractor in other programs. Nothing is written to disk:
+
+    from library import open_game
+
+    with open_game('ff9.yaml', 'ff9.iso') as game:
+        song = game.song(0x0D)
+        midi = song.midi_bytes()          # bytes
+        score = song.musicxml()           # str (bytes with compressed=True)
+        with open('battle.mid', 'wb') as f:
+            song.midi_bytes(f)            # or straight into a file object
+
+The image, executable and IMG file handles are closed when the with block
+ends (or on Game.close()), even if rendering fails.
+"""
+
+import io
+import contextlib
+from typing import IO, Dict, Iterator, List, Optional, Union
+
+from extractor import SequenceExtractor
+from format_base import SongMetadata
+from ir_cache import IRCacheFile
+from pipeline import SongPipeline
+
+
+class Song:
+    """One song of a game, rendered on demand.
+
+    Pass 1, loop analysis and the MIDI render are done once and shared by all
+    of the song's outputs.
+    """
+
+    def __init__(self, extractor: SequenceExtractor, metadata: SongMetadata, alternate: bool = False):
+        """Initialize (nothing is read until an output is requested).
+
+        Args:
+            extractor: Loaded extractor of the song's game
+            metadata: Song metadata from the game config
+            alternate: Use the alternate voice pointers (FF3)
+        """
+        self.extractor = extractor
+        self.metadata = metadata
+        self.name = extractor.output_basename(metadata, alternate=alternate)  # Output filename without extension
+        self._pipeline = SongPipeline(extractor, metadata, self.name, extractor.output_dir,
+                                      use_alternate_pointers=alternate)
+        if extractor.from_ir:
+            with IRCacheFile(self._pipeline.output_path('ircache')) as cache:
+                self._pipeline.preload(tracks=cache.track_data(), loops=cache.loop_analysis())
+
+    @property
+    def id(self) -> int:
+        return self.metadata.id
+
+    @property
+    def title(self) -> Optional[str]:
+        return self.metadata.title
+
+    def is_empty(self) -> bool:
+        """True if the song has no valid voice data (every output raises ValueError)."""
+        return self._pipeline.is_empty()
+
+    def has_alternate(self) -> bool:
+        """True if the song has an alternate version (see Game.song())."""
+        return not self.is_empty() and self._pipeline.get('tracks')['header'].get('has_alternate_pointers', False)
+
+    def _stage(self, stage: str):
+        if self.is_empty():
+            raise ValueError(f"Song {self.id:02X} has no valid voice data")
+        return self._pipeline.get(stage)
+
+    def disasm(self) -> str:
+        """Text disassembly (the .txt output)."""
+        return self.extractor.disassemble_to_text(self.metadata, self._stage('tracks'))
+
+    def ir(self) -> str:
+        """IR dump (the .ir output)."""
+        return self.extractor.dump_ir_to_text(self.metadata, self._stage('tracks'), self._stage('loops'))
+
+    def midi_bytes(self, out: Optional[IO[bytes]] = None) -> Optional[bytes]:
+        """Standard MIDI File (the .mid output).
+
+        Args:
+            out: Binary file object to write to (None = return the bytes)
+
+        Returns:
+            The MIDI file, or None if it was written to out
+        """
+        return _render(out, io.BytesIO, lambda f: self.extractor.midi_generator.write_midi(
+            f, *self._stage('midi_events')))
+
+    def musicxml(self, out: Optional[IO] = None, compressed: bool = False) -> Union[str, bytes, None]:
+        """MusicXML score (the .musicxml or .mxl output).
+
+        Args:
+            out: File object to write to (binary for compressed; None = return the score)
+            compressed: Compressed MusicXML (.mxl) instead of plain
+
+        Returns:
+            The score (str, or bytes if compressed), or None if it was written to out
+        """
+        return _render(out, io.BytesIO if compressed else io.StringIO, lambda f: self.extractor.generate_musicxml(
+            self.metadata, self._stage('tracks'), self._stage('loops'), f, compressed=compressed))
+
+    def debug_events(self, out: Optional[IO] = None) -> Optional[str]:
+        """Raw MIDI events as NDJSON (the .events output).
+
+        Args:
+            out: File object to write to (None = return the text)
+        """
+        return _render(out, io.StringIO, lambda f: self.extractor.midi_generator.write_debug_events(
+            f, *self._stage('midi_events')))
+
+    def loop_points(self) -> Optional[Dict]:
+        """Loop start/end in ticks and seconds (loop_mode: markers), or None."""
+        return self.extractor.midi_generator.loop_points(self._stage('midi_events')[1])
+
+
+def _render(out: Optional[IO], buffer_type, write) -> Union[str, bytes, None]:
+    """Call write(file) on out, or on a new buffer whose contents are returned."""
+    if out is not None:
+        write(out)
+        return None
+    buffer = buffer_type()
+    write(buffer)
+    return buffer.getvalue()
+
+
+class Game:
+    """A loaded game: its config, image, format handler and ROM tables."""
+
+    def __init__(self, extractor: SequenceExtractor):
+        """Wrap a loaded extractor (see open_game()).
+
+        Args:
+            extractor: Extractor to render songs with; closed by close()
+        """
+        self.extractor = extractor
+        self._closed = False
+
+    @property
+    def songs(self) -> List[SongMetadata]:
+        """Metadata of the songs in the game config."""
+        return list(self.extractor.profile.songs)
+
+    def song(self, song_id: int, alternate: bool = False) -> Song:
+        """Return a song of the game.
+
+        Args:
+            song_id: Song ID from the game config
+            alternate: The song's alternate version (FF3 alternate voice pointers)
+
+        Raises:
+            KeyError: If the song ID is not in the config
+            ValueError: If the game has been closed
+        """
+        if self._closed:
+            raise ValueError("Game is closed")
+        for metadata in self.songs:
+            if metadata.id == song_id:
+                return Song(self.extractor, metadata, alternate)
+        raise KeyError(f"Song ID {song_id:02X} not found in config")
+
+    def __iter__(self) -> Iterator[Song]:
+        """Iterate over the songs in config order."""
+        for metadata in self.songs:
+            yield self.song(metadata.id)
+
+    def close(self):
+        """Close the image and every file handle (safe to call twice)."""
+        if not self._closed:
+            self._closed = True
+            self.extractor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def open_game(config: str, source: Optional[str] = None, quiet: bool = True, **options) -> Game:
+    """Load a game for rendering into memory.
+
+    Args:
+        config: Path to the game YAML config
+        source: ISO/ROM file containing the game data
+        quiet: Discard the loading messages the command line prints
+        **options: Passed to SequenceExtractor (patch_based_tracks, from_ir)
+
+    Returns:
+        Game, to be closed after use (it is a context manager)
+    """
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        return Game(SequenceExtractor(config, source, **options))
@@ -0,0 +1,227 @@
+"""
+Standard MIDI File writer.
+
+Minimal SMF (format 1) writer used by MidiGenerator. Events are added per track
+in integer ticks, sorted once when the track is finished, and encoded with
+delta-times and running status directly into a buffered output file.
+
+Event ordering and duplicate handling follow the rules of the MIDIUtil library
+that was previously used, so existing output is reproduced note for note:
+  - events are ordered by (tick, event class, insertion order)
+  - at the same tick: track name/marker, then program/controller, then note off,
+    then note on/tempo
+  - duplicate note on/off, program change, tempo and track name events
+    at the same tick are dropped (controllers are never deduplicated)
+"""
+
+import struct
+from pathlib import Path
+from typing import BinaryIO, List, Tuple, Union
+
+
+# Secondary sort order for events at the same tick
+ORDER_META = 0       # Track name, marker
+ORDER_CHANNEL = 1    # Program change, controller
+ORDER_NOTE_OFF = 2   # Note off (before note on, so repeated notes retrigger)
+ORDER_NOTE_ON = 3    # Note on, tempo
+
+# Event kinds (internal)
+_NOTE_ON = 0x90
+_NOTE_OFF = 0x80
+_CONTROLLER = 0xB0
+_PROGRAM = 0xC0
+_TEMPO = 0x51
+_TRACK_NAME = 0x03
+_MARKER = 0x06
+
+_END_OF_TRACK = b'\x00\xff\x2f\x00'
+
+
+def encode_var_length(value: int) -> bytes:
+    """Encode an integer as a MIDI variable-length quantity.
+
+    Args:
+        value: Non-negative integer
+
+    Returns:
+        VLQ bytes, most significant group first
+    """
+    if value < 0x80:
+        return bytes((value,))
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.reverse()
+    return bytes(out)
+
+
+class MidiTrack:
+    """Event buffer for a single MIDI track.
+
+    Events are stored as compact tuples of
+    (tick, order, seq, kind, channel, data1, data2) and encoded by to_bytes().
+    """
+
+    __slots__ = ('events', '_seq')
+
+    def __init__(self):
+        self.events: List[Tuple] = []
+        self._seq = 0
+
+    def _next_seq(self) -> int:
+        seq = self._seq
+        self._seq += 1
+        return seq
+
+    def add_track_name(self, tick: int, name: str):
+        """Add a track name meta event (encoded as ISO-8859-1)."""
+        self.events.append((tick, ORDER_META, self._next_seq(), _TRACK_NAME, 0,
+                            name.encode('ISO-8859-1', errors='replace'), 0))
+
+    def add_marker(self, tick: int, text: str):
+        """Add a marker meta event (encoded as ISO-8859-1), e.g. loopStart/loopEnd."""
+        self.events.append((tick, ORDER_META, self._next_seq(), _MARKER, 0,
+                            text.encode('ISO-8859-1', errors='replace'), 0))
+
+    def add_tempo(self, tick: int, bpm: float):
+        """Add a tempo meta event.
+
+        Args:
+            tick: Event time in ticks
+            bpm: Tempo in beats per minute
+        """
+        usec_per_quarter = int(60000000 / bpm)
+        self.events.append((tick, ORDER_NOTE_ON, self._next_seq(), _TEMPO, 0,
+                            usec_per_quarter, 0))
+
+    def add_program_change(self, tick: int, channel: int, program: int):
+        """Add a program change event."""
+        self.events.append((tick, ORDER_CHANNEL, self._next_seq(), _PROGRAM,
+                            channel, program, 0))
+
+    def add_controller(self, tick: int, channel: int, controller: int, value: int):
+        """Add a control change event."""
+        self.events.append((tick, ORDER_CHANNEL, self._next_seq(), _CONTROLLER,
+                            channel, controller, value))
+
+    def add_note(self, tick: int, duration: int, channel: int, note: int, velocity: int):
+        """Add a note as a note on/note off pair.
+
+        Args:
+            tick: Note start time in ticks
+            duration: Note length in ticks
+            channel: MIDI channel (0-15)
+            note: MIDI note number (0-127)
+            velocity: Note velocity (also used for the note off)
+        """
+        seq = self._next_seq()
+        self.events.append((tick, ORDER_NOTE_ON, seq, _NOTE_ON, channel, note, velocity))
+        self.events.append((tick + duration, ORDER_NOTE_OFF, seq, _NOTE_OFF, channel, note, velocity))
+
+    def to_bytes(self) -> bytes:
+        """Sort, deduplicate and encode the track's events.
+
+        Returns:
+            Track event data (without the MTrk chunk header), including
+            the end-of-track meta event
+        """
+        self.events.sort()
+
+        data = bytearray()
+        seen = set()
+        last_tick = 0
+        running_status = None
+
+        for tick, _order, _seq, kind, channel, data1, data2 in self.events:
+            # Drop duplicate events (same kind, tick and identifying fields)
+            if kind != _CONTROLLER:
+                key = (kind, tick, channel, data1)
+                if key in seen:
+                    continue
+                seen.add(key)
+
+            data += encode_var_length(tick - last_tick)
+            last_tick = tick
+
+            if kind == _TEMPO:
+                data += b'\xff\x51\x03'
+                data += struct.pack('>L', data1)[1:]
+                running_status = None
+            elif kind == _TRACK_NAME or kind == _MARKER:
+                data += bytes((0xFF, kind))
+                data += encode_var_length(len(data1))
+                data += data1
+                running_status = None
+            else:
+                status = kind | channel
+                if status != running_status:
+                    data.append(status)
+                    running_status = status
+                if kind == _PROGRAM:
+                    data.append(data1)
+                else:
+                    data.append(data1)
+                    data.append(data2)
+
+        data += _END_OF_TRACK
+        return bytes(data)
+
+
+class MidiFileWriter:
+    """Streaming writer for format 1 Standard MIDI Files.
+
+    The header is written on open; each track is encoded and written as soon as
+    it is passed to write_track(), so only one track is held in memory at a time.
+
+    Usage:
+        with MidiFileWriter(path, num_tracks=2) as smf:
+            smf.write_track(tempo_track)
+            smf.write_track(note_track)
+    """
+
+    def __init__(self, output: Union[str, Path, BinaryIO], num_tracks: int,
+                 ticks_per_quarter: int = 96):
+        """Open output and write the MThd header.
+
+        Args:
+            output: File path or binary file object
+            num_tracks: Total number of tracks that will be written
+            ticks_per_quarter: Time division (ticks per quarter note)
+        """
+        if hasattr(output, 'write'):
+            self._file = output
+            self._owns_file = False
+        else:
+            self._file = open(output, 'wb', buffering=64 * 1024)
+            self._owns_file = True
+        self.num_tracks = num_tracks
+        self.tracks_written = 0
+        self._file.write(b'MThd' + struct.pack('>LHHH', 6, 1, num_tracks, ticks_per_quarter))
+
+    def write_track(self, track: MidiTrack):
+        """Encode a track and write it as an MTrk chunk."""
+        if self.tracks_written >= self.num_tracks:
+            raise ValueError(f"More tracks written than declared ({self.num_tracks})")
+        data = track.to_bytes()
+        self._file.write(b'MTrk' + struct.pack('>L', len(data)))
+        self._file.write(data)
+        self.tracks_written += 1
+
+    def close(self):
+        """Finish the file (pads missing tracks with empty ones) and close it."""
+        while self.tracks_written < self.num_tracks:
+            self.write_track(MidiTrack())
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._owns_file:
+            self._file.close()
+            return False
+        self.close()
+        return False
@@ -4,21 +4,103 @@ Output generation for AKAO music sequences.
 Generates MIDI files, MusicXML files, and text disassembly from parsed track data.
 """
 
+import io
 import sys
 import json
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+import heapq
+import contextlib
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from midiutil import MIDIFile
+from typing import IO, Dict, Iterator, List, Optional, Tuple, Union
 
 from ir_events import IREventType
+from midi_writer import MidiFileWriter, MidiTrack
+from scheduler import iter_song_events, split_by_voice
 
 
+# MIDI loop handling (midi_render.loop_mode): unroll intro + 2 loops, or render
+# intro + 1 loop with loop point markers
+LOOP_MODES = ('unroll', 'markers')
+
+# RPG Maker loop convention: CC111 marks the loop start
+LOOP_START_CONTROLLER = 111
+
 # Note names for text output
 NOTE_NAMES = ["C ", "C#", "D ", "D#", "E ", "F ", "F#",
               "G ", "G#", "A ", "A#", "B "]
 
+# An output file path, or a caller-supplied file object (left open)
+Output = Union[str, Path, IO]
+
+# MusicXML pitch spelling (step, alter, octave) per MIDI note number (sharps only)
+_XML_STEPS = ['C', 'C', 'D', 'D', 'E', 'F', 'F', 'G', 'G', 'A', 'A', 'B']
+_XML_ALTERS = [0, 1, 0, 1, 0, 0, 1, 0, 1, 0, 1, 0]
+
+
+def _spell_pitch(midi_note: int) -> Tuple[str, int, str]:
+    """Return MusicXML (step, alter, octave) for a MIDI note number."""
+    note_class = midi_note % 12
+    return _XML_STEPS[note_class], _XML_ALTERS[note_class], str((midi_note // 12) - 1)
+
+
+PITCH_SPELLING = [_spell_pitch(n) for n in range(128)]
+
+
+def _note_order(event: Dict) -> Tuple:
+    """Sort key for note events on a patch-based track."""
+    return (event['time'], event['note'])
+
+
+def organize_by_patch(parsed_tracks: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """Group note events by patch instead of voice.
+
+    Each patch track keeps one note list per voice ('voice_events'), in
+    _note_order; merge_patch_notes() interleaves them lazily.
+
+    Args:
+        parsed_tracks: Voice tracks from Pass 2 ({'voice_num', 'events', 'has_notes'})
+
+    Returns:
+        Tuple of (patch_tracks, tempo_events) where tempo_events are placed on track 0
+    """
+    patch_voices: Dict[int, Dict[int, List]] = {}  # patch -> voice index -> note events
+    conductor_events = []
+
+    for voice_idx, track in enumerate(parsed_tracks):
+        for event in track['events']:
+            if event['type'] == 'note':
+                patch_voices.setdefault(event.get('patch', 0), {}).setdefault(voice_idx, []).append(event)
+            elif event['type'] == 'tempo':
+                # Collect tempo events separately - they go on track 0
+                conductor_events.append(event)
+
+    # Create track info for each patch
+    result = []
+    for patch_num in sorted(patch_voices.keys()):
+        voice_events = []
+        for voice_idx in sorted(patch_voices[patch_num]):
+            notes = patch_voices[patch_num][voice_idx]
+            # Pass 2 emits notes in time order; only same-time notes may need reordering
+            if any(_note_order(a) > _note_order(b) for a, b in zip(notes, notes[1:])):
+                notes.sort(key=_note_order)
+            voice_events.append(notes)
+        result.append({
+            'patch': patch_num,
+            'voice_events': voice_events,
+            'has_notes': True,
+            'is_patch_based': True
+        })
+
+    return result, conductor_events
+
+
+def merge_patch_notes(track_info: Dict) -> Iterator[Dict]:
+    """Stream a patch track's notes from all voices in (time, note) order.
+
+    A k-way heap merge of the per-voice lists; equal keys keep voice order, so
+    the result is the same as a stable sort of all the patch's notes.
+    """
+    return heapq.merge(*track_info['voice_events'], key=_note_order)
+
 
 def disassemble_to_text(song, track_data: Dict, console_type: str,
                        format_handler) -> str:
@@ -145,7 +227,7 @@ def dump_ir_to_text(song, track_data: Dict, loop_analysis: Dict) -> str:
                 parts.append(f"dur={event.duration}")
 
             elif event.type == IREventType.PATCH_CHANGE:
-                parts.append(f"inst_id=0x{event.inst_id:02X} gm_patch={event.gm_patch} transpose={event.transpose}")
+                parts.append(f"inst_id=0x{event.inst_id:02X} patch_slot=0x{event.patch_slot:02X} bank={event.patch_bank}")
 
             elif event.type == IREventType.TEMPO:
                 parts.append(f"value={event.value}")
@@ -188,20 +270,56 @@ def dump_ir_to_text(song, track_data: Dict, loop_analysis: Dict) -> str:
     return '\n'.join(output)
 
 
+@contextlib.contextmanager
+def open_output(output: Output, binary: bool = False) -> Iterator[IO]:
+    """Open an output path for writing, or pass a caller-supplied file object through.
+
+    File objects are not closed. A text write to a binary file object (e.g.
+    BytesIO) is encoded as UTF-8.
+
+    Args:
+        output: File path or file object
+        binary: True to write bytes, False to write text
+
+    Yields:
+        File object to write to
+    """
+    if not hasattr(output, 'write'):
+        with open(output, 'wb' if binary else 'w', **({} if binary else {'encoding': 'utf-8'})) as f:
+            yield f
+    elif binary or isinstance(output, io.TextIOBase):
+        yield output
+    else:
+        stream = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        try:
+            yield stream
+        finally:
+            stream.flush()
+            stream.detach()  # Leave the caller's file object open
+
+
 class MidiGenerator:
     """Generates MIDI files from parsed track data."""
 
-    def __init__(self, format_handler, patch_mapper, patch_based_tracks: bool):
+    def __init__(self, format_handler, patch_mapper, patch_based_tracks: bool,
+                 debug_events: bool = False, loop_mode: str = 'unroll'):
         """Initialize MIDI generator.
 
         Args:
             format_handler: Format handler instance (for Pass 2 parsing)
             patch_mapper: PatchMapper instance for instrument info
             patch_based_tracks: If True, organize tracks by patch; if False, by voice
+            debug_events: If True, also write raw events to a .events NDJSON file
+            loop_mode: 'unroll' renders intro + 2 loops; 'markers' renders intro +
+                1 loop with loopStart/loopEnd markers and CC111 at the loop start
         """
+        if loop_mode not in LOOP_MODES:
+            raise ValueError(f"Unknown loop_mode: {loop_mode} (choose from {', '.join(LOOP_MODES)})")
         self.format_handler = format_handler
         self.patch_mapper = patch_mapper
         self.patch_based_tracks = patch_based_tracks
+        self.debug_events = debug_events
+        self.loop_mode = loop_mode
 
     def generate(self, song, track_data: Dict, loop_analysis: Dict, output_path: Path):
         """Generate MIDI file from sequence with patch mapping support.
@@ -212,12 +330,37 @@ class MidiGenerator:
             loop_analysis: Output from analyze_song_structure()
             output_path: Path to write MIDI file
         """
+        tracks_to_write, conductor_events = self.render(song, track_data, loop_analysis)
+
+        # Debug: Write raw events structure before writing MIDI file
+        if self.debug_events:
+            self.write_debug_events(output_path.with_suffix('.events'), tracks_to_write, conductor_events)
+
+        self.write_midi(output_path, tracks_to_write, conductor_events)
+
+    def render(self, song, track_data: Dict, loop_analysis: Dict) -> Tuple[List[Dict], List[Dict]]:
+        """Run Pass 2 at MIDI length and organize the events into output tracks.
+
+        Args:
+            song: Song metadata (must have .id and .title attributes)
+            track_data: Output from parse_all_tracks()
+            loop_analysis: Output from analyze_song_structure()
+
+        Returns:
+            Tuple of (tracks_to_write, conductor_events). Conductor events are
+            the tempo events, plus loopStart/loopEnd 'marker' events in markers mode.
+        """
         try:
             # Calculate target playthrough time: intro + 2 * loop (in native ticks)
             # Loop analyzer has already found the longest track
             intro_time = loop_analysis.get('longest_intro_time', 0)
             loop_time = loop_analysis.get('longest_loop_time', 0)
-            target_loop_time = intro_time + 2 * loop_time
+            use_markers = self.loop_mode == 'markers' and loop_time > 0
+            if use_markers:
+                # Intro + one loop; players repeat the loop between the markers
+                target_loop_time = intro_time + loop_time
+            else:
+                target_loop_time = intro_time + 2 * loop_time
             print(f"DEBUG generate_midi {song.id:02X} {song.title}: intro_time={intro_time}, loop_time={loop_time}, target_loop_time={target_loop_time}", file=sys.stderr)
 
             # Embed loop_info in track_data for Pass 2
@@ -225,167 +368,170 @@ class MidiGenerator:
                 track_data['tracks'][voice_num]['loop_info'] = \
                     loop_analysis['tracks'][voice_num]['loop_info']
 
-            # Parse all tracks with loop info (Pass 2)
-            parsed_tracks = []
-            for voice_num in sorted(track_data['tracks'].keys()):
-                try:
-                    # Pass 2 - expand IR events into MIDI events
-                    midi_events = self.format_handler._parse_track_pass2(
-                        track_data, voice_num, target_loop_time
-                    )
-                    has_notes = any(e['type'] == 'note' for e in midi_events)
-                    parsed_tracks.append({
-                        'voice_num': voice_num,
-                        'events': midi_events,
-                        'has_notes': has_notes
-                    })
-                except Exception as e:
-                    raise Exception(f"Failed parsing track {voice_num}: {e}") from e
+            # Pass 2 - expand IR events of all voices into one time-ordered MIDI event stream
+            voice_nums = sorted(track_data['tracks'].keys())
+            parsed_tracks, conductor_events = split_by_voice(
+                iter_song_events(self.format_handler, track_data, target_loop_time, voice_nums), voice_nums)
+
+            if use_markers:
+                # Loop points in MIDI ticks (native ticks * 2)
+                loop_start = intro_time * 2
+                loop_end = target_loop_time * 2
+                for track in parsed_tracks:
+                    # Drop fade steps past the loop end and cut notes still sounding there
+                    track['events'] = [event for event in track['events'] if event['time'] < loop_end]
+                    for event in track['events']:
+                        if event['type'] == 'note' and event['time'] + event['duration'] > loop_end:
+                            event['duration'] = loop_end - event['time']
+                conductor_events = [event for event in conductor_events if event['time'] < loop_end]
+                conductor_events.append({'type': 'marker', 'time': loop_start, 'text': 'loopStart'})
+                conductor_events.append({'type': 'marker', 'time': loop_end, 'text': 'loopEnd'})
 
             if self.patch_based_tracks:
                 # Organize by patch
-                tracks_to_write, conductor_events = self._organize_by_patch(parsed_tracks)
+                tracks_to_write, _ = organize_by_patch(parsed_tracks)
             else:
                 # Organize by sequence voice
                 tracks_to_write = [t for t in parsed_tracks if t['has_notes']]
-                # Extract conductor events from voice-based tracks
-                conductor_events = []
-                for track in parsed_tracks:
-                    conductor_events.extend([e for e in track['events'] if e['type'] == 'tempo'])
 
-            # Create MIDI file
+            return tracks_to_write, conductor_events
+        except Exception as e:
+            import traceback
+            raise Exception(f"MIDI generation failed: {e}\n{traceback.format_exc()}") from e
+
+    def write_midi(self, output_path: Output, tracks_to_write: List[Dict], conductor_events: List[Dict]):
+        """Write rendered tracks to a format 1 MIDI file.
+
+        Args:
+            output_path: Path to write MIDI file, or a binary file object
+            tracks_to_write: Output tracks from render()
+            conductor_events: Tempo events from render()
+        """
+        try:
+            # Write MIDI file (format 1: tempo track followed by one track per voice/patch)
             # Use 96 ticks per quarter note to match Perl MIDI module default
             # SNES duration_table values are already in this resolution
-            num_tracks = len(tracks_to_write)
-            midi = MIDIFile(num_tracks, file_format=1, ticks_per_quarternote=96)
-
-            # Add tempo events to first track (tempo events apply globally in MIDI format 1)
-            for event in conductor_events:
-                time_beats = event['time'] / 96.0
-                # Use BPM directly from IR event (already calculated in Pass 1)
-                bpm = event['tempo']
-                midi.addTempo(0, time_beats, bpm)
-
-            # Add tracks (now starting from 0 instead of 1)
-            for track_idx, track_info in enumerate(tracks_to_write):
-                self._write_midi_track(midi, track_idx, track_info, conductor_events if track_idx == 0 else [])
-
-            # Disable deinterleaving to avoid "pop from empty list" errors in MIDIUtil
-            # See: https://github.com/DataGreed/polyendtracker-midi-export/pull/5
-            for track in midi.tracks:
-                track.deinterleave = False
-
-            # Debug: Write raw events structure before writing MIDI file
-            debug_path = output_path.with_suffix('.events')
-            self._write_debug_events(debug_path, tracks_to_write, conductor_events)
-
-            # Write file
-            with open(output_path, 'wb') as f:
-                midi.writeFile(f)
+            with MidiFileWriter(output_path, len(tracks_to_write) + 1, ticks_per_quarter=96) as smf:
+                # Tempo events go on the tempo track (they apply globally in MIDI format 1)
+                tempo_track = MidiTrack()
+                for event in conductor_events:
+                    if event['type'] == 'tempo':
+                        # Use BPM directly from IR event (already calculated in Pass 1)
+                        tempo_track.add_tempo(int(event['time']), event['tempo'])
+                    else:
+                        # Loop point marker (loop_mode: markers)
+                        tempo_track.add_marker(int(event['time']), event['text'])
+                        if event['text'] == 'loopStart':
+                            tempo_track.add_controller(int(event['time']), 0, LOOP_START_CONTROLLER, 0)
+                smf.write_track(tempo_track)
+
+                for track_idx, track_info in enumerate(tracks_to_write):
+                    midi_track = MidiTrack()
+                    self._write_midi_track(midi_track, track_idx, track_info)
+                    smf.write_track(midi_track)
         except Exception as e:
             import traceback
             raise Exception(f"MIDI generation failed: {e}\n{traceback.format_exc()}") from e
 
-    def _organize_by_patch(self, parsed_tracks: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
-        """Reorganize events by patch instead of voice.
+    def loop_points(self, conductor_events: List[Dict]) -> Optional[Dict]:
+        """Loop start/end in ticks and seconds, from render()'s conductor events.
 
         Returns:
-            Tuple of (patch_tracks, tempo_events) where tempo_events are placed on track 0
+            Dict for the .loop.json sidecar, or None if the render has no loop markers
         """
-        # Collect all events across all voices
-        patch_events: Dict[int, List] = {}
-        conductor_events = []
-
-        for track in parsed_tracks:
-            for event in track['events']:
-                if event['type'] == 'note':
-                    patch = event.get('patch', 0)
-                    if patch not in patch_events:
-                        patch_events[patch] = []
-                    patch_events[patch].append(event)
-                elif event['type'] == 'tempo':
-                    # Collect tempo events separately - they go on track 0
-                    conductor_events.append(event)
-
-        # Create track info for each patch
-        result = []
-        for patch_num in sorted(patch_events.keys()):
-            result.append({
-                'patch': patch_num,
-                'events': patch_events[patch_num],
-                'has_notes': True,
-                'is_patch_based': True
-            })
-
-        return result, conductor_events
-
-    def _write_debug_events(self, output_path: Path, tracks_to_write: List[Dict], conductor_events: List[Dict]):
-        """Write debug output of raw MIDI events structure to help diagnose issues."""
-        debug_data = {
-            'tempo_events': conductor_events,  # Tempo events now on track 0
-            'tracks': []
+        markers = {event['text']: event['time'] for event in conductor_events if event['type'] == 'marker'}
+        if 'loopStart' not in markers:
+            return None
+
+        # Walk the tempo map (120 BPM until the first tempo event, as in MIDI)
+        tempos = sorted((event['time'], event['tempo']) for event in conductor_events if event['type'] == 'tempo')
+
+        def seconds(tick):
+            elapsed, last_tick, bpm = 0.0, 0, 120.0
+            for tempo_tick, tempo in tempos:
+                if tempo_tick >= tick:
+                    break
+                elapsed += (tempo_tick - last_tick) * 60.0 / (bpm * 96)
+                last_tick, bpm = tempo_tick, tempo
+            return elapsed + (tick - last_tick) * 60.0 / (bpm * 96)
+
+        return {
+            'ticks_per_quarter': 96,
+            'loop_start_tick': markers['loopStart'],
+            'loop_end_tick': markers['loopEnd'],
+            'loop_start_seconds': round(seconds(markers['loopStart']), 6),
+            'loop_end_seconds': round(seconds(markers['loopEnd']), 6),
         }
 
+    def write_loop_points(self, output_path: Output, loop_points: Dict):
+        """Write loop_points() as a JSON sidecar (to a path or file object)."""
+        with open_output(output_path) as f:
+            json.dump(loop_points, f, indent=1)
+            f.write('\n')
+
+    def _iter_debug_records(self, tracks_to_write: List[Dict], conductor_events: List[Dict]):
+        """Yield debug records for the raw MIDI event structure.
+
+        Yields one dict per tempo (or loop marker) event, then for each track a
+        'track' header record followed by one record per event.
+        """
+        for event in conductor_events:
+            yield {'record': event['type'], **event}  # Conductor events go on the tempo track
+
         for track_idx, track_info in enumerate(tracks_to_write):
-            track_data = {
-                'track_num': track_idx,  # Now 0-based
+            header = {
+                'record': 'track',
+                'track_num': track_idx,  # 0-based, excluding the tempo track
                 'is_patch_based': track_info.get('is_patch_based', False),
             }
 
             if track_info.get('is_patch_based'):
                 patch_num = track_info['patch']
                 patch_info = self.patch_mapper.get_patch_info(patch_num)
-                instrument_name = self.patch_mapper.get_instrument_name(patch_num)
 
-                track_data['patch'] = patch_num
-                track_data['instrument_name'] = instrument_name
-                track_data['gm_patch'] = patch_info.gm_patch
-                track_data['is_percussion'] = patch_info.is_percussion()
-                track_data['transpose'] = patch_info.transpose
+                header['patch'] = patch_num
+                header['instrument_name'] = self.patch_mapper.get_instrument_name(patch_num)
+                header['gm_patch'] = patch_info.gm_patch
+                header['is_percussion'] = patch_info.is_percussion()
+                header['transpose'] = patch_info.transpose
 
                 # Calculate channel assignment
                 if patch_info.is_percussion():
                     channel = 9
                 else:
-                    channel = track_idx  # Now 0-based
+                    channel = track_idx
                     if channel >= 9:
                         channel += 1
-                track_data['channel'] = channel
+                header['channel'] = channel
             else:
-                track_data['voice_num'] = track_info['voice_num']
+                header['voice_num'] = track_info['voice_num']
                 channel = track_info['voice_num']
                 if channel >= 9:
                     channel += 1
-                track_data['channel'] = channel % 16
+                header['channel'] = channel % 16
 
-            # Add events with converted time values
-            track_data['events'] = []
-            for event in track_info['events']:
-                event_copy = dict(event)
-                # Add time in beats for reference
-                event_copy['time_beats'] = event['time'] / 96.0
-                if event['type'] == 'note':
-                    event_copy['duration_beats'] = event['duration'] / 96.0
-                track_data['events'].append(event_copy)
+            yield header
 
-            debug_data['tracks'].append(track_data)
+            events = merge_patch_notes(track_info) if track_info.get('is_patch_based') else track_info['events']
+            for event in events:
+                yield {'record': 'event', 'track_num': track_idx, **event}
 
-        # Write to file
-        with open(output_path, 'w') as f:
-            json.dump(debug_data, f, indent=2)
+    def write_debug_events(self, output_path: Output, tracks_to_write: List[Dict], conductor_events: List[Dict]):
+        """Write debug output of raw MIDI events as NDJSON (one record per line), to a path or file object."""
+        dumps = json.JSONEncoder(separators=(',', ':')).encode
+        with open_output(output_path) as f:
+            for record in self._iter_debug_records(tracks_to_write, conductor_events):
+                f.write(dumps(record))
+                f.write('\n')
 
-    def _write_midi_track(self, midi: MIDIFile, track_num: int, track_info: Dict, tempo_events: Optional[List[Dict]] = None):
-        """Write a single track to MIDI file.
+    def _write_midi_track(self, midi_track: MidiTrack, track_num: int, track_info: Dict):
+        """Fill a MIDI track buffer with one voice's or patch's events.
 
         Args:
-            midi: MIDIFile object
-            track_num: Track number (0-based)
+            midi_track: MidiTrack buffer to add events to
+            track_num: Track number (0-based, excluding the tempo track)
             track_info: Track information dict
-            tempo_events: Optional list of tempo events (only for track 0)
         """
-        if tempo_events is None:
-            tempo_events = []
-
         is_patch_based = track_info.get('is_patch_based', False)
 
         if is_patch_based:
@@ -394,7 +540,7 @@ class MidiGenerator:
             patch_info = self.patch_mapper.get_patch_info(patch_num)
             instrument_name = self.patch_mapper.get_instrument_name(patch_num)
 
-            midi.addTrackName(track_num, 0, f"{patch_num:02X} {instrument_name}")
+            midi_track.add_track_name(0, f"{patch_num:02X} {instrument_name}")
 
             # Determine channel based on track number, not patch number
             if patch_info.is_percussion():
@@ -407,37 +553,37 @@ class MidiGenerator:
                     channel += 1  # Skip channel 9 by mapping tracks 9+ to channels 10+
 
             # Set program
-            if not patch_info.is_percussion():
-                midi.addProgramChange(track_num, channel, 0, patch_info.gm_patch)
+            is_percussion = patch_info.is_percussion()
+            if not is_percussion:
+                midi_track.add_program_change(0, channel, patch_info.gm_patch)
+            transpose = patch_info.transpose
+            perc_note = -patch_info.gm_patch
 
             # Add notes - need to handle overlapping notes on same pitch
-            # Sort by time and collect only note events
-            note_events = [e for e in track_info['events'] if e['type'] == 'note']
-            note_events.sort(key=lambda e: (e['time'], e['note']))
+            # Notes arrive merged from all voices in (time, note) order
 
             # Track active notes to prevent overlaps
             # Key: (note_number), Value: end_time
             active_notes = {}
 
-            for event in note_events:
-                time_beats = event['time'] / 96.0
-                duration_beats = event['duration'] / 96.0
+            for event in merge_patch_notes(track_info):
+                current_time = int(event['time'])
+                duration = int(event['duration'])
 
-                if duration_beats <= 0:
+                if duration <= 0:
                     continue
 
                 # Apply transposition
-                note = event['note'] + patch_info.transpose
+                note = event['note'] + transpose
 
                 # For percussion, use GM percussion note if specified
-                if patch_info.is_percussion():
-                    note = -patch_info.gm_patch  # Use the percussion note number
+                if is_percussion:
+                    note = perc_note  # Use the percussion note number
 
                 note = max(0, min(127, note))  # Clamp to valid range
 
                 # Check if there's already an active note at this pitch
-                current_time = event['time']
-                note_end = current_time + event['duration']
+                note_end = current_time + duration
 
                 if note in active_notes:
                     # There's already a note playing - we need to end it before starting new one
@@ -445,20 +591,17 @@ class MidiGenerator:
                     if current_time < active_end:
                         # Notes would overlap - shorten the current note to end before the overlap
                         # Leave at least a small gap
-                        max_duration = max(1, active_end - current_time - 1)  # At least 1 tick gap
-                        note_end = current_time + max_duration
-                        duration_beats = max_duration / 96.0
+                        duration = max(1, active_end - current_time - 1)  # At least 1 tick gap
+                        note_end = current_time + duration
 
                 # Add the note
-                if duration_beats > 0:
-                    midi.addNote(track_num, channel, note,
-                               time_beats, duration_beats, event['velocity'])
-                    # Track this note as active
-                    active_notes[note] = note_end
+                midi_track.add_note(current_time, duration, channel, note, event['velocity'])
+                # Track this note as active
+                active_notes[note] = note_end
         else:
             # Voice-based track
             voice_num = track_info['voice_num']
-            midi.addTrackName(track_num, 0, f"Voice {voice_num:02X}")
+            midi_track.add_track_name(0, f"Voice {voice_num:02X}")
 
             # Default channel mapping (may be overridden by individual notes for percussion)
             default_channel = voice_num
@@ -466,39 +609,87 @@ class MidiGenerator:
                 default_channel += 1
             default_channel = default_channel % 16
 
-            # Track current patch for this voice
-            current_patch = 0
-
             for event in track_info['events']:
-                time_beats = event['time'] / 96.0
+                event_type = event['type']
 
-                if event['type'] == 'program_change':
+                if event_type == 'program_change':
                     # All format handlers store GM patch in IR events (Pass 2 puts this in event['patch'])
-                    gm_patch = event['patch']
-                    midi.addProgramChange(track_num, default_channel, time_beats, gm_patch)
-                    current_patch = gm_patch
+                    midi_track.add_program_change(int(event['time']), default_channel, event['patch'])
 
-                elif event['type'] == 'note':
-                    duration_beats = event['duration'] / 96.0
-                    if duration_beats > 0:
+                elif event_type == 'note':
+                    duration = int(event['duration'])
+                    if duration > 0:
                         # Use channel from event if present (for percussion mode), otherwise use default
                         channel = event.get('channel', default_channel)
 
                         # Transposition already applied in Pass 2 for all formats
-                        note = event['note']
-                        note = max(0, min(127, note))
+                        note = max(0, min(127, event['note']))
 
-                        midi.addNote(track_num, channel, note,
-                                   time_beats, duration_beats, event['velocity'])
+                        midi_track.add_note(int(event['time']), duration, channel, note,
+                                            event['velocity'])
 
-                elif event['type'] == 'controller':
+                elif event_type == 'controller':
                     # Controller change (CC) events
                     # Used for: CC7 (volume fade), CC10 (pan fade), CC11 (expression), CC68 (legato)
                     channel = event.get('channel', default_channel)
-                    midi.addControllerEvent(track_num, channel, time_beats,
-                                          event['controller'], event['value'])
+                    midi_track.add_controller(int(event['time']), channel,
+                                              event['controller'], event['value'])
+
+                # Tempo events are handled on the tempo track, not per-track
+
+
+# Compressed MusicXML (.mxl) container files
+MXL_MIMETYPE = 'application/vnd.recordare.musicxml'
+MXL_CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container>
+  <rootfiles>
+    <rootfile full-path="{path}" media-type="application/vnd.recordare.musicxml+xml"/>
+  </rootfiles>
+</container>
+"""
+
+
+def _xml_escape(text: str) -> str:
+    """Escape text for XML character data or attribute values."""
+    return (text.replace("&", "&amp;").replace("<", "&lt;")
+            .replace("\"", "&quot;").replace(">", "&gt;"))
 
-                # Tempo events are now handled on track 0, not per-track
+
+class XmlStreamWriter:
+    """Incremental XML writer with fixed two-space indentation.
+
+    Elements are written to the stream as soon as they are opened or closed,
+    so nothing but the current nesting depth is kept in memory. The layout
+    matches minidom's toprettyxml(indent='  ') with blank lines removed.
+    """
+
+    def __init__(self, stream):
+        """Write the XML declaration to stream."""
+        self._write = stream.write
+        self._depth = 0
+        self._write('<?xml version="1.0" ?>')
+
+    def _tag(self, tag: str, attrs: Dict) -> str:
+        if not attrs:
+            return tag
+        return tag + ''.join(f' {name}="{_xml_escape(value)}"' for name, value in attrs.items())
+
+    def start(self, tag: str, **attrs):
+        """Open an element that will contain child elements."""
+        self._write(f"\n{'  ' * self._depth}<{self._tag(tag, attrs)}>")
+        self._depth += 1
+
+    def end(self, tag: str):
+        """Close the most recently opened element."""
+        self._depth -= 1
+        self._write(f"\n{'  ' * self._depth}</{tag}>")
+
+    def element(self, tag: str, text: Optional[str] = None, **attrs):
+        """Write a complete element with optional text content."""
+        if text:
+            self._write(f"\n{'  ' * self._depth}<{self._tag(tag, attrs)}>{_xml_escape(text)}</{tag}>")
+        else:
+            self._write(f"\n{'  ' * self._depth}<{self._tag(tag, attrs)}/>")
 
 
 class MusicXmlGenerator:
@@ -516,223 +707,381 @@ class MusicXmlGenerator:
         self.patch_mapper = patch_mapper
         self.patch_based_tracks = patch_based_tracks
 
-    def generate(self, song, track_data: Dict, loop_analysis: Dict, output_path: Path):
+    # 4/4 time, 96 ticks per quarter = 384 ticks per measure
+    DIVISIONS_PER_QUARTER = 96
+    DIVISIONS_PER_MEASURE = DIVISIONS_PER_QUARTER * 4
+
+    def _note_type(self, duration: int) -> str:
+        """Approximate note type name for a duration in divisions."""
+        quarter = self.DIVISIONS_PER_QUARTER
+        if duration >= quarter * 4:
+            return 'whole'
+        elif duration >= quarter * 2:
+            return 'half'
+        elif duration >= quarter:
+            return 'quarter'
+        elif duration >= quarter // 2:
+            return 'eighth'
+        elif duration >= quarter // 4:
+            return '16th'
+        return '32nd'
+
+    def _iter_measures(self, events: List[Dict], transpose: int = 0,
+                       measure_ends: Optional[List[int]] = None):
+        """Bucket a part's time-sorted note events into measures in one pass.
+
+        Advances a measure cursor over the events once; notes that cross a
+        barline are split, and the remainder is carried into the following
+        measure(s) as a tied note.
+
+        Args:
+            events: Note events sorted by time
+            transpose: Semitones added to every note (patch-based tracks)
+            measure_ends: End time of each measure (None = whole 4/4 measures
+                up to the last note)
+
+        Yields:
+            (measure_num, items) where items is a list of either
+            ('forward', duration) or
+            ('note', (step, alter, octave), duration, type, tie_stop, tie_start)
+        """
+        if measure_ends is None:
+            measure_len = self.DIVISIONS_PER_MEASURE
+
+            # Find max time
+            max_time = max(e['time'] + e['duration'] for e in events)
+            num_measures = int((max_time + measure_len - 1) // measure_len)
+            measure_ends = [measure_len * num for num in range(1, num_measures + 1)]
+
+        idx = 0
+        num_events = len(events)
+        carry = []  # (midi_note, remaining_duration) tied over from the previous measure
+        measure_end = 0
+
+        for measure_num, next_end in enumerate(measure_ends, 1):
+            measure_start, measure_end = measure_end, next_end
+
+            # Segments starting in this measure: tied remainders first, then new notes
+            segments = [(measure_start, midi_note, remaining, True) for midi_note, remaining in carry]
+            carry = []
+            while idx < num_events and events[idx]['time'] < measure_end:
+                event = events[idx]
+                segments.append((event['time'], event['note'] + transpose, event['duration'], False))
+                idx += 1
+
+            items = []
+            current_position = measure_start
+
+            for start, midi_note, duration, tie_stop in segments:
+                # Add forward if needed to advance time
+                if start > current_position:
+                    items.append(('forward', start - current_position))
+                    current_position = start
+
+                # Split the note at the barline, carrying the rest forward
+                note_duration = duration
+                tie_start = False
+                if start + duration > measure_end:
+                    note_duration = measure_end - start
+                    carry.append((midi_note, duration - note_duration))
+                    tie_start = True
+
+                if note_duration <= 0:
+                    continue
+
+                spelling = PITCH_SPELLING[midi_note] if 0 <= midi_note < 128 else _spell_pitch(midi_note)
+                items.append(('note', spelling, note_duration, self._note_type(note_duration),
+                              tie_stop, tie_start))
+
+                current_position += note_duration
+
+            # Fill remainder of measure with a forward/rest if needed
+            if current_position < measure_end:
+                items.append(('forward', measure_end - current_position))
+
+            yield measure_num, items
+
+    def _loop_layout(self, loop_start: int, loop_len: int) -> Dict:
+        """Lay out measures and repeat barlines for intro + one pass of the loop.
+
+        A loop of whole measures that starts mid-measure keeps the regular
+        measure grid: the repeat starts at the first barline inside the loop,
+        and the measure holding the loop end (whose tail is the head of the
+        next pass) is a first ending. A second ending holds the same measure
+        cut at the loop end. Otherwise the grid restarts at the loop start, and
+        the measures before the loop start or at the loop end may be short.
+
+        Args:
+            loop_start: Loop start in divisions (MIDI ticks)
+            loop_len: Loop length in divisions
+
+        Returns:
+            Dict with 'measure_ends' (end time of each measure), 'end' (time of
+            the last barline), 'barlines' ((measure_num, location) -> barline
+            fields for _write_barline()) and 'second_ending' (length of the
+            second ending measure, None if there is none)
+        """
+        measure_len = self.DIVISIONS_PER_MEASURE
+        layout = {'barlines': {}, 'second_ending': None}
+
+        if loop_len % measure_len == 0 and loop_start % measure_len:
+            repeat_start = (loop_start // measure_len + 1) * measure_len
+            end = repeat_start + loop_len
+            measure_ends = list(range(measure_len, end + 1, measure_len))
+            layout['barlines'][(len(measure_ends), 'left')] = {'ending': ('1', 'start')}
+            layout['barlines'][(len(measure_ends), 'right')] = {
+                'style': 'light-heavy', 'ending': ('1', 'stop'), 'repeat': 'backward'}
+            layout['second_ending'] = loop_start + loop_len - (end - measure_len)
+            layout['barlines'][(len(measure_ends) + 1, 'left')] = {'ending': ('2', 'start')}
+            layout['barlines'][(len(measure_ends) + 1, 'right')] = {
+                'style': 'light-heavy', 'ending': ('2', 'discontinue')}
+        else:
+            end = loop_start + loop_len
+            measure_ends = list(range(measure_len, loop_start, measure_len))
+            if loop_start:
+                measure_ends.append(loop_start)
+            measure_ends += list(range(loop_start + measure_len, end, measure_len)) + [end]
+            repeat_start = loop_start
+            layout['barlines'][(len(measure_ends), 'right')] = {'style': 'light-heavy', 'repeat': 'backward'}
+
+        # The repeat may start on the first ending's measure (a one-measure loop)
+        forward = measure_ends.index(repeat_start) + 2 if repeat_start else 1
+        layout['barlines'].setdefault((forward, 'left'), {}).update(style='heavy-light', repeat='forward')
+        layout['measure_ends'] = measure_ends
+        layout['end'] = end
+        return layout
+
+    def _clip_items(self, items: List[Tuple], length: int) -> List[Tuple]:
+        """Cut a measure's items at `length` divisions, filling the rest with a forward."""
+        clipped = []
+        position = 0
+        for item in items:
+            if position >= length:
+                break
+            duration = item[1] if item[0] == 'forward' else item[2]
+            if position + duration > length:
+                duration = length - position
+                if item[0] == 'forward':
+                    item = ('forward', duration)
+                else:
+                    item = ('note', item[1], duration, self._note_type(duration), item[4], False)
+            clipped.append(item)
+            position += duration
+        if position < length:
+            clipped.append(('forward', length - position))
+        return clipped
+
+    def generate(self, song, track_data: Dict, loop_analysis: Dict, output_path: Output,
+                 compressed: Optional[bool] = None):
         """Generate MusicXML from sequence data.
 
         Args:
             song: Song metadata (must have .id and .title attributes)
             track_data: Output from parse_all_tracks()
             loop_analysis: Output from analyze_song_structure()
-            output_path: Path to write MusicXML file
+            output_path: Path to write MusicXML file, or a file object (binary
+                for compressed MusicXML)
+            compressed: Write compressed MusicXML (.mxl); None = decide by the
+                path's suffix (plain for file objects)
         """
-        # Calculate target total time (same as MIDI generation)
-        longest_loop_time = 0
-        max_total_time = 0
-        for voice_num in track_data['tracks'].keys():
-            loop_info = loop_analysis['tracks'][voice_num]['loop_info']
-            if loop_info.get('has_backwards_goto', False):
-                intro_time = loop_info.get('intro_time', 0)
-                loop_time = loop_info.get('loop_time', 0)
-                total_time = intro_time + loop_time
-
-                if loop_time > longest_loop_time:
-                    longest_loop_time = loop_time
-                if total_time > max_total_time:
-                    max_total_time = total_time
-
-        target_total_time = max_total_time + longest_loop_time
+        # Render the intro and one pass of the loop (the same loop points as the
+        # MIDI loop markers); repeat barlines stand in for the further passes
+        loop_time = loop_analysis.get('longest_loop_time', 0)
+        layout = None
+        target_total_time = 0
+        if loop_time > 0:
+            layout = self._loop_layout(loop_analysis.get('longest_intro_time', 0) * 2, loop_time * 2)
+            target_total_time = (layout['end'] + 1) // 2  # Native ticks
 
         # Embed loop_info in track_data for Pass 2
         for voice_num in track_data['tracks'].keys():
             track_data['tracks'][voice_num]['loop_info'] = \
                 loop_analysis['tracks'][voice_num]['loop_info']
 
-        # Parse all tracks (Pass 2)
-        parsed_tracks = []
-        for voice_num in sorted(track_data['tracks'].keys()):
-            # Pass 2 - expand IR events into MIDI events
-            midi_events = self.format_handler._parse_track_pass2(
-                track_data, voice_num, target_total_time
-            )
-            has_notes = any(e['type'] == 'note' for e in midi_events)
-            parsed_tracks.append({
-                'voice_num': voice_num,
-                'events': midi_events,
-                'has_notes': has_notes
-            })
+        # Parse all tracks (Pass 2), merged into one time-ordered stream
+        voice_nums = sorted(track_data['tracks'].keys())
+        parsed_tracks, _ = split_by_voice(
+            iter_song_events(self.format_handler, track_data, target_total_time, voice_nums), voice_nums)
+
+        if layout is not None:
+            # Drop notes past the last measure and cut those still sounding there
+            end = layout['end']
+            for track in parsed_tracks:
+                track['events'] = [event for event in track['events']
+                                   if event['type'] != 'note' or event['time'] < end]
+                for event in track['events']:
+                    if event['type'] == 'note' and event['time'] + event['duration'] > end:
+                        event['duration'] = end - event['time']
 
         # Organize tracks
         if self.patch_based_tracks:
-            # Import the organize function from MidiGenerator
-            midi_gen = MidiGenerator(self.format_handler, self.patch_mapper, self.patch_based_tracks)
-            tracks_to_write, _ = midi_gen._organize_by_patch(parsed_tracks)
+            tracks_to_write, _ = organize_by_patch(parsed_tracks)
         else:
             tracks_to_write = [t for t in parsed_tracks if t['has_notes']]
 
-        # Create MusicXML document
-        root = ET.Element('score-partwise', version='3.1')
+        title = song.title if hasattr(song, 'title') and song.title else f"AKAO_{song.id:02X}"
+
+        # Write .mxl (compressed MusicXML) or plain .musicxml, streaming either way
+        is_path = not hasattr(output_path, 'write')
+        if compressed is None:
+            compressed = is_path and Path(output_path).suffix.lower() == '.mxl'
+        if compressed:
+            import zipfile  # Only needed for .mxl
+            score_name = f"{Path(output_path).stem if is_path else 'score'}.musicxml"
+            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                # mimetype must be the first entry, stored uncompressed
+                archive.writestr('mimetype', MXL_MIMETYPE, compress_type=zipfile.ZIP_STORED)
+                archive.writestr('META-INF/container.xml', MXL_CONTAINER.format(
+                    path=_xml_escape(score_name)))
+                with archive.open(score_name, 'w') as raw:
+                    with io.TextIOWrapper(raw, encoding='utf-8') as stream:
+                        self._write_score(stream, title, tracks_to_write, layout)
+        else:
+            with open_output(output_path) as stream:
+                self._write_score(stream, title, tracks_to_write, layout)
+
+    def _write_score(self, stream, title: str, tracks_to_write: List[Dict], layout: Optional[Dict] = None):
+        """Stream a score-partwise document, one part and measure at a time.
+
+        Args:
+            stream: Text stream to write to
+            title: Work title
+            tracks_to_write: Organized tracks (voice- or patch-based)
+            layout: Loop measure layout from _loop_layout() (None = no repeats)
+        """
+        xml = XmlStreamWriter(stream)
+        xml.start('score-partwise', version='3.1')
 
         # Add work title
-        work = ET.SubElement(root, 'work')
-        work_title = ET.SubElement(work, 'work-title')
-        work_title.text = song.title if hasattr(song, 'title') and song.title else f"AKAO_{song.id:02X}"
+        xml.start('work')
+        xml.element('work-title', title)
+        xml.end('work')
 
         # Create part list
-        part_list = ET.SubElement(root, 'part-list')
-
+        xml.start('part-list')
         for track_idx, track_info in enumerate(tracks_to_write):
-            part_id = f"P{track_idx + 1}"
-            score_part = ET.SubElement(part_list, 'score-part', id=part_id)
-            part_name = ET.SubElement(score_part, 'part-name')
-
+            xml.start('score-part', id=f"P{track_idx + 1}")
             if track_info.get('is_patch_based'):
                 patch_num = track_info['patch']
                 instrument_name = self.patch_mapper.get_instrument_name(patch_num)
-                part_name.text = f"{patch_num:02X} {instrument_name}"
+                xml.element('part-name', f"{patch_num:02X} {instrument_name}")
             else:
-                part_name.text = f"Voice {track_info['voice_num'] + 1}"
+                xml.element('part-name', f"Voice {track_info['voice_num'] + 1}")
+            xml.end('score-part')
+        xml.end('part-list')
 
         # Create parts
         for track_idx, track_info in enumerate(tracks_to_write):
-            part_id = f"P{track_idx + 1}"
-            part = ET.SubElement(root, 'part', id=part_id)
+            xml.start('part', id=f"P{track_idx + 1}")
 
-            # Get sorted events
-            events = sorted([e for e in track_info['events'] if e['type'] == 'note'],
-                          key=lambda e: e.get('time', 0))
+            # Get time-ordered note events
+            if track_info.get('is_patch_based'):
+                events = list(merge_patch_notes(track_info))
+            else:
+                events = [e for e in track_info['events'] if e['type'] == 'note']
 
-            if not events:
+            if not events and layout is None:
                 # Empty part - add one empty measure
-                measure = ET.SubElement(part, 'measure', number='1')
-                attributes = ET.SubElement(measure, 'attributes')
-                divisions = ET.SubElement(attributes, 'divisions')
-                divisions.text = '96'
+                xml.start('measure', number='1')
+                xml.start('attributes')
+                xml.element('divisions', '96')
+                xml.end('attributes')
+                xml.end('measure')
+                xml.end('part')
                 continue
 
-            # Calculate measure breaks (4/4 time, 96 ticks per quarter = 384 ticks per measure)
-            divisions_per_quarter = 96
-            divisions_per_measure = divisions_per_quarter * 4
-
-            # Find max time
-            max_time = max(e['time'] + e['duration'] for e in events)
-            num_measures = (max_time + divisions_per_measure - 1) // divisions_per_measure
+            # Apply transposition if patch-based
+            transpose = 0
+            if track_info.get('is_patch_based'):
+                transpose = self.patch_mapper.get_patch_info(track_info['patch']).transpose
 
-            # Create measures
-            for measure_num in range(1, int(num_measures) + 1):
-                measure = ET.SubElement(part, 'measure', number=str(measure_num))
+            measures = self._iter_measures(events, transpose, layout and layout['measure_ends'])
+            if layout is not None and layout['second_ending']:
+                measures = self._with_second_ending(measures, layout['second_ending'])
+            for measure_num, items in measures:
+                xml.start('measure', number=str(measure_num))
 
                 # Add attributes to first measure
                 if measure_num == 1:
-                    attributes = ET.SubElement(measure, 'attributes')
-                    divisions = ET.SubElement(attributes, 'divisions')
-                    divisions.text = str(divisions_per_quarter)
-
-                    time_elem = ET.SubElement(attributes, 'time')
-                    beats = ET.SubElement(time_elem, 'beats')
-                    beats.text = '4'
-                    beat_type = ET.SubElement(time_elem, 'beat-type')
-                    beat_type.text = '4'
-
-                    clef = ET.SubElement(attributes, 'clef')
-                    sign = ET.SubElement(clef, 'sign')
-                    sign.text = 'G'
-                    line = ET.SubElement(clef, 'line')
-                    line.text = '2'
-
-                # Find events in this measure
-                measure_start = (measure_num - 1) * divisions_per_measure
-                measure_end = measure_num * divisions_per_measure
-                measure_events = [e for e in events
-                                if measure_start <= e['time'] < measure_end]
-
-                current_position = measure_start
-
-                for event in measure_events:
-                    # Add forward if needed to advance time
-                    if event['time'] > current_position:
-                        gap = event['time'] - current_position
-                        forward = ET.SubElement(measure, 'forward')
-                        duration_elem = ET.SubElement(forward, 'duration')
-                        duration_elem.text = str(gap)
-                        current_position = event['time']
-
-                    # Calculate note duration, clamping to measure boundary
-                    note_duration = event['duration']
-                    note_end_time = event['time'] + note_duration
-
-                    # If note extends past measure end, clamp it
-                    if note_end_time > measure_end:
-                        note_duration = measure_end - event['time']
-
-                    if note_duration <= 0:
+                    xml.start('attributes')
+                    xml.element('divisions', str(self.DIVISIONS_PER_QUARTER))
+                    xml.start('time')
+                    xml.element('beats', '4')
+                    xml.element('beat-type', '4')
+                    xml.end('time')
+                    xml.start('clef')
+                    xml.element('sign', 'G')
+                    xml.element('line', '2')
+                    xml.end('clef')
+                    xml.end('attributes')
+
+                barlines = layout['barlines'] if layout is not None else {}
+                if (measure_num, 'left') in barlines:
+                    self._write_barline(xml, 'left', **barlines[(measure_num, 'left')])
+
+                for item in items:
+                    if item[0] == 'forward':
+                        xml.start('forward')
+                        xml.element('duration', str(item[1]))
+                        xml.end('forward')
                         continue
 
-                    # Add note
-                    note_elem = ET.SubElement(measure, 'note')
-
-                    # Pitch
-                    pitch = ET.SubElement(note_elem, 'pitch')
-                    midi_note = event['note']
-
-                    # Apply transposition if patch-based
-                    if track_info.get('is_patch_based'):
-                        patch_num = track_info['patch']
-                        patch_info = self.patch_mapper.get_patch_info(patch_num)
-                        midi_note += patch_info.transpose
-
-                    # Convert MIDI note to pitch notation
-                    note_names = ['C', 'C', 'D', 'D', 'E', 'F', 'F', 'G', 'G', 'A', 'A', 'B']
-                    alterations = [0, 1, 0, 1, 0, 0, 1, 0, 1, 0, 1, 0]
-                    octave = (midi_note // 12) - 1
-                    note_class = midi_note % 12
-
-                    step = ET.SubElement(pitch, 'step')
-                    step.text = note_names[note_class]
-
-                    if alterations[note_class] != 0:
-                        alter = ET.SubElement(pitch, 'alter')
-                        alter.text = str(alterations[note_class])
-
-                    octave_elem = ET.SubElement(pitch, 'octave')
-                    octave_elem.text = str(octave)
-
-                    # Duration (clamped to measure boundary)
-                    duration_elem = ET.SubElement(note_elem, 'duration')
-                    duration_elem.text = str(note_duration)
-
-                    # Type (approximate based on duration)
-                    if note_duration >= divisions_per_quarter * 4:
-                        note_type_text = 'whole'
-                    elif note_duration >= divisions_per_quarter * 2:
-                        note_type_text = 'half'
-                    elif note_duration >= divisions_per_quarter:
-                        note_type_text = 'quarter'
-                    elif note_duration >= divisions_per_quarter // 2:
-                        note_type_text = 'eighth'
-                    elif note_duration >= divisions_per_quarter // 4:
-                        note_type_text = '16th'
-                    else:
-                        note_type_text = '32nd'
-
-                    note_type = ET.SubElement(note_elem, 'type')
-                    note_type.text = note_type_text
-
-                    current_position += note_duration
-
-                # Fill remainder of measure with a forward/rest if needed
-                if current_position < measure_end:
-                    remaining = measure_end - current_position
-                    forward = ET.SubElement(measure, 'forward')
-                    duration_elem = ET.SubElement(forward, 'duration')
-                    duration_elem.text = str(remaining)
-
-        # Format and write XML
-        xml_str = ET.tostring(root, encoding='unicode')
-        dom = minidom.parseString(xml_str)
-        pretty_xml = dom.toprettyxml(indent='  ')
-
-        # Remove extra blank lines
-        lines = [line for line in pretty_xml.split('\n') if line.strip()]
-        pretty_xml = '\n'.join(lines)
-
-        output_path.write_text(pretty_xml, encoding='utf-8')
+                    _, (step_text, alter_value, octave_text), note_duration, \
+                        note_type_text, tie_stop, tie_start = item
+
+                    xml.start('note')
+                    xml.start('pitch')
+                    xml.element('step', step_text)
+                    if alter_value != 0:
+                        xml.element('alter', str(alter_value))
+                    xml.element('octave', octave_text)
+                    xml.end('pitch')
+                    xml.element('duration', str(note_duration))
+
+                    # Notes split at a barline are tied across it
+                    if tie_stop:
+                        xml.element('tie', type='stop')
+                    if tie_start:
+                        xml.element('tie', type='start')
+
+                    xml.element('type', note_type_text)
+
+                    if tie_stop or tie_start:
+                        xml.start('notations')
+                        if tie_stop:
+                            xml.element('tied', type='stop')
+                        if tie_start:
+                            xml.element('tied', type='start')
+                        xml.end('notations')
+                    xml.end('note')
+
+                if (measure_num, 'right') in barlines:
+                    self._write_barline(xml, 'right', **barlines[(measure_num, 'right')])
+                xml.end('measure')
+            xml.end('part')
+
+        xml.end('score-partwise')
+
+    def _with_second_ending(self, measures, length: int):
+        """Pass measures through, then repeat the last one cut at `length` as the second ending."""
+        measure_num, items = 0, []
+        for measure_num, items in measures:
+            yield measure_num, items
+        yield measure_num + 1, self._clip_items(items, length)
+
+    @staticmethod
+    def _write_barline(xml, location: str, style: Optional[str] = None,
+                       ending: Optional[Tuple[str, str]] = None, repeat: Optional[str] = None):
+        """Write a <barline> with an optional bar style, ending bracket (number, type) and repeat."""
+        xml.start('barline', location=location)
+        if style:
+            xml.element('bar-style', style)
+        if ending:
+            number, ending_type = ending
+            if ending_type == 'start':
+                xml.element('ending', f"{number}.", number=number, type=ending_type)
+            else:
+                xml.element('ending', number=number, type=ending_type)
+        if repeat:
+            xml.element('repeat', direction=repeat)
+        xml.end('barline')
@@ -0,0 +1,246 @@
+"""
+Per-song extraction pipeline.
+
+Each song is processed as a small graph of stages (sequence data, Pass 1,
+loop analysis, Pass 2, and one stage per output file). Stages are evaluated
+lazily and memoized, so only the work needed by the requested output formats
+is done, and shared stages (e.g. Pass 1) run once per song. Output files are
+written atomically. Pass 1 results can also be preloaded from a binary IR
+cache, in which case the ROM/ISO is never read.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import run_report
+from build_cache import atomic_output
+from ir_cache import IR_CACHE_EXT, write_ir_cache
+
+
+# Output formats in the order they are produced
+OUTPUT_FORMATS = ('txt', 'ir', 'ircache', 'mid', 'events', 'xml')
+
+# Formats written when none are requested explicitly
+DEFAULT_FORMATS = ('txt', 'ir', 'mid', 'xml')
+
+# Formats that can be rendered from a binary IR cache (no disassembly text)
+IR_RENDER_FORMATS = ('ir', 'mid', 'events', 'xml')
+
+# Stage -> stages whose results it consumes (in argument order)
+STAGE_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    'sequence': (),                        # Raw song bytes from ROM/ISO
+    'tracks': ('sequence',),               # Pass 1: disassembly lines + IR events
+    'loops': ('tracks',),                  # Loop analysis / song length
+    'midi_events': ('tracks', 'loops'),    # Pass 2 at MIDI length, organized into tracks
+    'txt': ('tracks',),                    # Text disassembly
+    'ir': ('tracks', 'loops'),             # IR dump
+    'ircache': ('tracks', 'loops'),        # Binary IR cache (for rendering without the ROM/ISO)
+    'mid': ('midi_events',),               # Standard MIDI File
+    'events': ('midi_events',),            # Raw MIDI events (NDJSON debug dump)
+    'xml': ('tracks', 'loops'),            # MusicXML (runs its own Pass 2)
+}
+
+# Stage -> name in run reports (output stages keep their format name)
+REPORT_STAGES = {
+    'sequence': 'read',
+    'tracks': 'pass1',
+    'loops': 'loops',
+    'midi_events': 'pass2',
+}
+
+# Output directory (relative to the output root) for each format
+FORMAT_DIRS = {
+    'txt': 'txt',
+    'ir': 'txt',
+    'ircache': 'ircache',
+    'mid': 'mid',
+    'events': 'mid',
+    'xml': 'xml',
+}
+
+
+def parse_formats(spec: Union[str, Iterable[str], None]) -> Tuple[str, ...]:
+    """Parse an output format selection.
+
+    Args:
+        spec: Comma-separated string (e.g. "mid,xml"), iterable of format
+            names, or None for the default formats
+
+    Returns:
+        Tuple of format names in canonical order
+
+    Raises:
+        ValueError: If an unknown format is requested
+    """
+    if spec is None:
+        return DEFAULT_FORMATS
+    if isinstance(spec, str):
+        spec = spec.split(',')
+    requested = {name.strip().lower() for name in spec if name.strip()}
+    if 'musicxml' in requested:
+        requested.discard('musicxml')
+        requested.add('xml')
+
+    unknown = requested - set(OUTPUT_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown output format(s): {', '.join(sorted(unknown))} "
+                         f"(choose from {','.join(OUTPUT_FORMATS)})")
+    if not requested:
+        raise ValueError("No output formats selected")
+
+    return tuple(f for f in OUTPUT_FORMATS if f in requested)
+
+
+def stages_for(formats: Iterable[str]) -> List[str]:
+    """Return the stages needed for the given formats, in execution order."""
+    order: List[str] = []
+
+    def visit(stage: str):
+        if stage in order:
+            return
+        for dep in STAGE_DEPENDENCIES[stage]:
+            visit(dep)
+        order.append(stage)
+
+    for fmt in formats:
+        visit(fmt)
+    return order
+
+
+class SongPipeline:
+    """Lazily evaluated stages for one song (or one alternate version of it)."""
+
+    def __init__(self, extractor, song, base_name: str, output_root: Path = Path('.'),
+                 data: Optional[bytes] = None, use_alternate_pointers: bool = False, writer=None):
+        """Initialize the pipeline.
+
+        Args:
+            extractor: SequenceExtractor providing parsing and generators
+            song: Song metadata
+            base_name: Output filename without extension
+            output_root: Directory containing the txt/, mid/ and xml/ folders
+            data: Raw sequence data, if already extracted
+            use_alternate_pointers: Parse with alternate voice pointers (FF3)
+            writer: Optional background_io.BackgroundWriter that moves output
+                files into place (None = write them in place atomically)
+        """
+        self.extractor = extractor
+        self.song = song
+        self.base_name = base_name
+        self.output_root = Path(output_root)
+        self.use_alternate_pointers = use_alternate_pointers
+        self.writer = writer
+        self._results: Dict[str, object] = {}
+        self.extra_outputs: List[Path] = []  # Sidecar files written by output stages
+        if data is not None:
+            self._results['sequence'] = data
+
+    def get(self, stage: str):
+        """Return a stage's result, running it (and its dependencies) if needed."""
+        if stage not in self._results:
+            args = [self.get(dep) for dep in STAGE_DEPENDENCIES[stage]]
+            with run_report.span(REPORT_STAGES.get(stage, stage), song=self.base_name):
+                self._results[stage] = getattr(self, f'_stage_{stage}')(*args)
+        return self._results[stage]
+
+    def has_run(self, stage: str) -> bool:
+        """True if the stage has already been evaluated."""
+        return stage in self._results
+
+    def is_empty(self) -> bool:
+        """True if the song has no valid voice data."""
+        return self.get('tracks') is None
+
+    def run(self, formats: Iterable[str]) -> List[Path]:
+        """Produce the requested output files.
+
+        Args:
+            formats: Output format names (see OUTPUT_FORMATS)
+
+        Returns:
+            Paths of the files written, including sidecars (empty if the song
+            has no voice data)
+        """
+        if self.is_empty():
+            return []
+        return [self.get(fmt) for fmt in formats] + self.extra_outputs
+
+    def preload(self, **results):
+        """Supply stage results computed elsewhere (e.g. tracks/loops from an IR cache)."""
+        self._results.update(results)
+
+    def output(self, path: Path):
+        """Context manager yielding the temporary path an output file is written to."""
+        if self.writer is not None:
+            return self.writer.output(path)
+        return atomic_output(path)
+
+    def output_path(self, fmt: str) -> Path:
+        """Output file path for a format."""
+        if fmt == 'xml':
+            ext = self.extractor.musicxml_ext
+        elif fmt == 'events':
+            ext = '.events'
+        elif fmt == 'ircache':
+            ext = IR_CACHE_EXT
+        else:
+            ext = f'.{fmt}'
+        return self.output_root / FORMAT_DIRS[fmt] / f"{self.base_name}{ext}"
+
+    # Stage implementations (arguments follow STAGE_DEPENDENCIES)
+
+    def _stage_sequence(self):
+        return self.extractor.extract_sequence_data(self.song)
+
+    def _stage_tracks(self, data):
+        return self.extractor.parse_all_tracks(self.song, data, self.use_alternate_pointers)
+
+    def _stage_loops(self, track_data):
+        return self.extractor.analyze_song_structure(track_data)
+
+    def _stage_midi_events(self, track_data, loop_analysis):
+        return self.extractor.midi_generator.render(self.song, track_data, loop_analysis)
+
+    def _stage_txt(self, track_data):
+        path = self.output_path('txt')
+        with self.output(path) as tmp:
+            tmp.write_text(self.extractor.disassemble_to_text(self.song, track_data))
+        return path
+
+    def _stage_ir(self, track_data, loop_analysis):
+        path = self.output_path('ir')
+        with self.output(path) as tmp:
+            tmp.write_text(self.extractor.dump_ir_to_text(self.song, track_data, loop_analysis))
+        return path
+
+    def _stage_ircache(self, track_data, loop_analysis):
+        path = self.output_path('ircache')
+        with self.output(path) as tmp:
+            write_ir_cache(tmp, self.song, track_data, loop_analysis)
+        return path
+
+    def _stage_mid(self, rendered):
+        path = self.output_path('mid')
+        with self.output(path) as tmp:
+            self.extractor.midi_generator.write_midi(tmp, *rendered)
+
+        # Loop points in seconds next to the .mid (loop_mode: markers)
+        loop_points = self.extractor.midi_generator.loop_points(rendered[1])
+        if loop_points is not None:
+            sidecar = path.with_suffix('.loop.json')
+            with self.output(sidecar) as tmp:
+                self.extractor.midi_generator.write_loop_points(tmp, loop_points)
+            self.extra_outputs.append(sidecar)
+        return path
+
+    def _stage_events(self, rendered):
+        path = self.output_path('events')
+        with self.output(path) as tmp:
+            self.extractor.midi_generator.write_debug_events(tmp, *rendered)
+        return path
+
+    def _stage_xml(self, track_data, loop_analysis):
+        path = self.output_path('xml')
+        with self.output(path) as tmp:
+            self.extractor.generate_musicxml(self.song, track_data, loop_analysis, tmp)
+        return path
@@ -0,0 +1,407 @@
+"""
+Per-stage timing and counters for extraction runs.
+
+While a RunReport is active, the extraction stages (sequence read, header
+parse, Pass 1, loop analysis, Pass 2 and each output writer) record a span
+with their wall and CPU time, per song and, where a stage works voice by
+voice, per voice. Spans carry counters (IR events, MIDI events, loop
+iterations executed) and Pass 2 voices record why they stopped, so runs that
+hit an emergency brake show up in the report.
+
+The report is written as JSON (--report run.json) and optionally as a Chrome
+trace (--trace run.trace.json, open in chrome://tracing or Perfetto), where
+the spans of --jobs and batch worker processes appear on one timeline.
+
+In memory mode (--memprofile) every span also records, via tracemalloc, its
+peak allocation above what was allocated when it started, the bytes it
+retained, and (for whole-song spans) the source lines that allocated the most
+retained memory. Songs whose peak exceeds a memory budget are flagged.
+tracemalloc measures the whole process, so memory figures are only
+attributable to a stage when songs run one at a time on one thread (with or
+without --jobs, but not with --prefetch).
+
+With no active report, span() and count() do nothing.
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+import tracemalloc
+from typing import Dict, Iterator, List, Optional
+
+from format_base import PASS2_BRAKES
+
+
+REPORT_VERSION = 1
+
+# Allocation sites kept per whole-song span, and per stage in the aggregated report
+TOP_SITES = 5
+
+_report: Optional['RunReport'] = None  # Active report (inherited by forked workers)
+_local = threading.local()  # Per-thread stack of open spans
+
+
+def active() -> Optional['RunReport']:
+    """Return the active report, or None."""
+    return _report
+
+
+def current() -> Optional[Dict]:
+    """Return the innermost open span on this thread, or None."""
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+@contextlib.contextmanager
+def span(stage: str, song: Optional[str] = None, voice: Optional[int] = None) -> Iterator[Optional[Dict]]:
+    """Time a stage into the active report.
+
+    Args:
+        stage: Stage name (read, header, pass1, loops, pass2, txt, ir, ...)
+        song: Song label (default: that of the enclosing span)
+        voice: Voice number, for per-voice spans
+
+    Yields:
+        The span record (None if no report is active)
+    """
+    report = _report
+    if report is None:
+        yield None
+        return
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    if song is None and stack:
+        song = stack[-1]['song']
+    record = report.new_record(stage, song, voice)
+    parent = stack[-1] if stack else None
+    snapshot = None
+    if report.memory:
+        snapshot = _memory_start(record, parent, sites=voice is None)
+    stack.append(record)
+    start_cpu = time.thread_time()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['wall'] = time.perf_counter() - start
+        record['cpu'] = time.thread_time() - start_cpu
+        stack.pop()
+        if report.memory:
+            _memory_end(record, parent, snapshot)
+        report.records.append(record)
+
+
+def _memory_start(record: Dict, parent: Optional[Dict], sites: bool) -> Optional[tracemalloc.Snapshot]:
+    """Start measuring a span's memory; returns the snapshot to diff at the end (if sites)."""
+    current, peak = tracemalloc.get_traced_memory()
+    if parent is not None:
+        # The enclosing span's peak so far, before the peak is reset for this one
+        parent['memory']['peak'] = max(parent['memory']['peak'], peak)
+    tracemalloc.reset_peak()
+    record['memory'] = {'start': current, 'peak': current, 'end': current, 'sites': []}
+    return _snapshot() if sites else None
+
+
+def _memory_end(record: Dict, parent: Optional[Dict], snapshot: Optional[tracemalloc.Snapshot]):
+    """Finish measuring a span's memory (absolute bytes; to_dict() reports them relative to 'start')."""
+    memory = record['memory']
+    memory['end'], peak = tracemalloc.get_traced_memory()
+    memory['peak'] = max(memory['peak'], peak)
+    if parent is not None:
+        parent['memory']['peak'] = max(parent['memory']['peak'], memory['peak'])
+    if snapshot is not None:
+        stats = _snapshot().compare_to(snapshot, 'lineno')
+        memory['sites'] = [{'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                            'bytes': stat.size_diff, 'blocks': stat.count_diff}
+                           for stat in stats[:TOP_SITES] if stat.size_diff > 0]
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    """Snapshot of the traced allocations, without tracemalloc's and the report's own."""
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+
+
+def count(name: str, n: int = 1):
+    """Add to a counter of the innermost open span (no-op without an active report)."""
+    if _report is None:
+        return
+    record = current()
+    if record is not None:
+        record['counters'][name] = record['counters'].get(name, 0) + n
+
+
+class RunReport:
+    """Timing spans and counters collected during a run."""
+
+    def __init__(self, game: Optional[str] = None, memory: bool = False,
+                 memory_budget: Optional[int] = None):
+        """Initialize an empty report.
+
+        Args:
+            game: Game label for the spans recorded (batch runs change it per game)
+            memory: Also record peak and retained memory per span (tracemalloc)
+            memory_budget: Flag songs whose peak exceeds this many bytes (memory mode)
+        """
+        self.game = game
+        self.memory = memory
+        self.memory_budget = memory_budget
+        self.records: List[Dict] = []
+        self.start = time.perf_counter()  # Monotonic, and shared by forked workers on Linux
+        self.wall_seconds: Optional[float] = None
+
+    def new_record(self, stage: str, song: Optional[str], voice: Optional[int] = None,
+                   ts: Optional[float] = None) -> Dict:
+        """Create a span record (not yet added to the report).
+
+        Args:
+            stage: Stage name
+            song: Song label
+            voice: Voice number, or None for a whole-song span
+            ts: Start time in seconds since the report started (default: now)
+        """
+        return {
+            'stage': stage,
+            'game': self.game,
+            'song': song,
+            'voice': voice,
+            'ts': time.perf_counter() - self.start if ts is None else ts,
+            'wall': 0.0,
+            'cpu': 0.0,
+            'pid': os.getpid(),
+            'tid': threading.get_native_id(),
+            'counters': {},
+        }
+
+    def add_voice(self, stage: str, song: Optional[str], voice: int, wall: float, cpu: float,
+                  counters: Dict[str, int], stop: Optional[str] = None):
+        """Record a voice whose work was interleaved with other voices (Pass 2).
+
+        The record has no start time ('ts' None), so it is left off the trace
+        timeline.
+
+        Args:
+            stage: Stage the voice was rendered for (pass2, or xml for MusicXML's own Pass 2)
+            song: Song label
+            voice: Voice number
+            wall: Wall time spent advancing the voice
+            cpu: CPU time spent advancing the voice
+            counters: Counters such as 'midi_events' and 'loop_iterations'
+            stop: Why the voice stopped (one of format_base.PASS2_STOPS)
+        """
+        record = self.new_record(stage, song, voice)
+        record.update(ts=None, wall=wall, cpu=cpu, counters=dict(counters))
+        if stop is not None:
+            record['stop'] = stop
+        self.records.append(record)
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Context manager making this the active report."""
+        global _report
+        previous = _report
+        _report = self
+        trace = self.memory and not tracemalloc.is_tracing()
+        if trace:
+            tracemalloc.start()
+        try:
+            yield self
+        finally:
+            if trace:
+                tracemalloc.stop()
+            _report = previous
+            self.wall_seconds = time.perf_counter() - self.start
+
+    def mark(self) -> int:
+        """Position in the records, for since()."""
+        return len(self.records)
+
+    def since(self, mark: int) -> List[Dict]:
+        """Records added after mark() (e.g. a worker's spans, to send to the parent)."""
+        return self.records[mark:]
+
+    def merge(self, records: List[Dict]):
+        """Add records from a worker process.
+
+        Records made in this process (songs extracted without fork) are
+        already in the report and are skipped.
+        """
+        pid = os.getpid()
+        self.records.extend(record for record in records if record['pid'] != pid)
+
+    def to_dict(self) -> Dict:
+        """Aggregate the records per song, stage and voice.
+
+        Returns:
+            Dict with 'version', 'wall_seconds', 'totals' (stage -> wall, cpu,
+            calls and summed counters), 'counters', 'stops' (stop reason ->
+            voice count), 'brakes' (emergency brake stops only) and 'songs'
+            (list of {'game', 'song', 'stages'}, in order of first record,
+            where each stage also has 'voices': voice -> timing and counters).
+            In memory mode, stages and totals also have 'peak_bytes' (largest
+            peak above the stage's starting allocation), 'retained_bytes' and
+            'top_sites'; songs have 'peak_bytes' (above the song's starting
+            allocation); and 'memory_budget' and 'over_budget' (song labels)
+            are added.
+        """
+        def add_counters(target: Dict, record: Dict):
+            for name, value in record['counters'].items():
+                counters = target.setdefault('counters', {})
+                counters[name] = counters.get(name, 0) + value
+
+        def add(target: Dict, record: Dict):
+            target['wall'] = target.get('wall', 0.0) + record['wall']
+            target['cpu'] = target.get('cpu', 0.0) + record['cpu']
+            target['calls'] = target.get('calls', 0) + 1
+            add_counters(target, record)
+
+        songs: Dict[tuple, Dict] = {}
+        totals: Dict[str, Dict] = {}
+        stops: Dict[str, int] = {}
+        for record in self.records:
+            key = (record['game'], record['song'])
+            song = songs.setdefault(key, {'game': record['game'], 'song': record['song'], 'stages': {}})
+            stage = song['stages'].setdefault(record['stage'], {})
+            total = totals.setdefault(record['stage'], {})
+            if record['voice'] is None:
+                add(stage, record)
+                add(total, record)
+                if 'memory' in record:
+                    _add_memory(stage, record['memory'])
+                    _add_memory(total, record['memory'])
+                continue
+            # Voice counters roll up into the stage; voice times are part of the stage's time
+            voice = stage.setdefault('voices', {}).setdefault(str(record['voice']), {})
+            add(voice, record)
+            add_counters(stage, record)
+            add_counters(total, record)
+            if 'stop' in record:
+                voice['stop'] = record['stop']
+                stops[record['stop']] = stops.get(record['stop'], 0) + 1
+
+        counters: Dict[str, int] = {}
+        for total in totals.values():
+            for name, value in total.get('counters', {}).items():
+                counters[name] = counters.get(name, 0) + value
+
+        result = {
+            'version': REPORT_VERSION,
+            'wall_seconds': self.wall_seconds,
+            'totals': totals,
+            'counters': counters,
+            'stops': stops,
+            'brakes': {stop: n for stop, n in stops.items() if stop in PASS2_BRAKES},
+            'songs': list(songs.values()),
+        }
+        if self.memory:
+            for stage in totals.values():
+                _finish_sites(stage)
+            for song in songs.values():
+                for stage in song['stages'].values():
+                    _finish_sites(stage)
+            result['memory_budget'] = self.memory_budget
+            result['over_budget'] = []
+            for key, song in songs.items():
+                song['peak_bytes'] = self._song_peak(key)
+                if self.memory_budget is not None and song['peak_bytes'] > self.memory_budget:
+                    result['over_budget'].append(song['song'])
+        return result
+
+    def _song_peak(self, key: tuple) -> int:
+        """Peak allocation of a song above what was allocated when it started.
+
+        Measured per process (its sequence may be read in the parent of a
+        --jobs worker), taking the larger.
+        """
+        start: Dict[int, int] = {}
+        peak: Dict[int, int] = {}
+        for record in self.records:
+            if (record['game'], record['song']) != key or 'memory' not in record:
+                continue
+            pid = record['pid']
+            start[pid] = min(start.get(pid, record['memory']['start']), record['memory']['start'])
+            peak[pid] = max(peak.get(pid, 0), record['memory']['peak'])
+        return max((peak[pid] - start[pid] for pid in peak), default=0)
+
+    def memory_summary(self) -> List[str]:
+        """Lines summarizing the memory figures: per stage, top sites and songs over budget."""
+        result = self.to_dict()
+        lines = [f"{'Stage':<8} {'Peak KiB':>12} {'Retained KiB':>14}"]
+        for name, stage in result['totals'].items():
+            if 'peak_bytes' in stage:
+                lines.append(f"{name:<8} {stage['peak_bytes'] / 1024:>12,.1f} {stage['retained_bytes'] / 1024:>14,.1f}")
+        for name, stage in result['totals'].items():
+            if stage.get('top_sites'):
+                lines.append(f"Top retained allocations in {name}:")
+                for site in stage['top_sites']:
+                    lines.append(f"  {site['bytes'] / 1024:>10,.1f} KiB  {site['blocks']:>7} blocks  {site['site']}")
+        if result['songs']:
+            largest = max(result['songs'], key=lambda song: song['peak_bytes'])
+            lines.append(f"Largest song peak: {largest['peak_bytes'] / 1024:,.1f} KiB ({largest['song']})")
+        for label in result['over_budget']:
+            song = next(song for song in result['songs'] if song['song'] == label)
+            lines.append(f"WARNING: {label}: peak {song['peak_bytes'] / 1024:,.1f} KiB exceeds the memory "
+                         f"budget of {self.memory_budget / 1024:,.1f} KiB")
+        return lines
+
+    def write(self, path):
+        """Write the aggregated report (to_dict()) as JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.write('\n')
+
+    def trace_events(self) -> List[Dict]:
+        """Chrome trace events: one complete ('X') event per timed span, plus process names."""
+        events = []
+        processes = {}
+        for record in self.records:
+            if record['ts'] is None:
+                continue  # Interleaved Pass 2 voices have no single interval
+            name = record['stage'] if record['voice'] is None else f"{record['stage']} v{record['voice']}"
+            args = {'song': record['song'], 'cpu_ms': round(record['cpu'] * 1000, 3), **record['counters']}
+            if record['game'] is not None:
+                args['game'] = record['game']
+            if 'memory' in record:
+                memory = record['memory']
+                args['peak_kib'] = round((memory['peak'] - memory['start']) / 1024, 1)
+                args['retained_kib'] = round((memory['end'] - memory['start']) / 1024, 1)
+            events.append({'name': name, 'cat': record['stage'], 'ph': 'X',
+                           'ts': round(record['ts'] * 1e6, 1), 'dur': round(record['wall'] * 1e6, 1),
+                           'pid': record['pid'], 'tid': record['tid'], 'args': args})
+            processes.setdefault(record['pid'], len(processes))
+
+        main_pid = os.getpid()
+        for pid, index in processes.items():
+            label = 'extractor' if pid == main_pid else f'worker {index}'
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': f'{label} ({pid})'}})
+        return events
+
+    def write_trace(self, path):
+        """Write the spans as a Chrome trace-event JSON file."""
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+            f.write('\n')
+
+
+def _add_memory(target: Dict, memory: Dict):
+    """Add a span's memory figures to an aggregate (peak: largest; retained and sites: summed)."""
+    target['peak_bytes'] = max(target.get('peak_bytes', 0), memory['peak'] - memory['start'])
+    target['retained_bytes'] = target.get('retained_bytes', 0) + memory['end'] - memory['start']
+    sites = target.setdefault('top_sites', {})
+    for site in memory['sites']:
+        total = sites.setdefault(site['site'], {'site': site['site'], 'bytes': 0, 'blocks': 0})
+        total['bytes'] += site['bytes']
+        total['blocks'] += site['blocks']
+
+
+def _finish_sites(target: Dict):
+    """Keep an aggregate's TOP_SITES largest allocation sites, as a list."""
+    if 'top_sites' in target:
+        target['top_sites'] = sorted(target['top_sites'].values(), key=lambda site: -site['bytes'])[:TOP_SITES]
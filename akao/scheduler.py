@@ -0,0 +1,155 @@
+"""
+Multi-voice Pass 2 scheduler.
+
+Advances the Pass 2 generators of all voices of a song together and merges
+their output into a single time-ordered event stream. Each voice's generator
+reports a cursor (no later event of that voice starts before it); the voice
+with the lowest cursor is always advanced next, and buffered events are
+released once every voice has moved past their time. Consumers (MIDI and
+MusicXML writers, live playback) therefore receive events in order without a
+global sort.
+
+While a run report is active, the time spent advancing each voice, its MIDI
+event and loop iteration counts and why it stopped are recorded under the
+enclosing stage (pass2, or xml for MusicXML's own Pass 2).
+"""
+
+import time
+import heapq
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import run_report
+
+
+def iter_song_events(format_handler, track_data: Dict, target_loop_time: int = 0,
+                     voice_nums: Optional[List[int]] = None, endless: bool = False,
+                     windows: Optional[Dict] = None) -> Iterator[Dict]:
+    """Render all voices of a song into one time-ordered event stream.
+
+    Events are ordered by (time, voice, generation order), so each voice's
+    events at the same tick keep the order Pass 2 produced them in. Every
+    event is tagged with its 'voice'. Tempo events are conductor events and
+    are emitted once per (time, tempo) even if several voices produce them.
+
+    Args:
+        format_handler: Format handler providing _iter_track_pass2()
+        track_data: Track data with loop_info embedded per track
+        target_loop_time: Target playthrough time in native ticks (0 = no loop expansion)
+        voice_nums: Voices to render (default: all, in ascending order)
+        endless: Follow loops forever; the consumer stops iterating when it has
+            enough (see SequenceFormat._iter_track_pass2())
+        windows: Optional Pass2Window per voice number, to render a time window
+            (see SeekIndex.windows())
+
+    Yields:
+        MIDI event dictionaries with an added 'voice' key
+    """
+    if voice_nums is None:
+        voice_nums = sorted(track_data['tracks'].keys())
+
+    windows = windows or {}
+    report = run_report.active()
+    if report is None:
+        streams = [format_handler._iter_track_pass2(track_data, voice_num, target_loop_time, endless,
+                                                    windows.get(voice_num))
+                   for voice_num in voice_nums]
+    else:
+        stats = [{} for _ in voice_nums]  # Filled in by each voice's Pass 2
+        streams = [_timed(format_handler._iter_track_pass2(track_data, voice_num, target_loop_time, endless,
+                                                           windows.get(voice_num), stats=voice_stats),
+                          voice_stats)
+                   for voice_num, voice_stats in zip(voice_nums, stats)]
+    cursors: List[Tuple[int, int]] = [(0, rank) for rank in range(len(streams))]  # (cursor, voice rank)
+    pending: List[Tuple] = []  # (time, voice rank, seq, event)
+    seq = 0
+    tempo_seen = set()  # (time, tempo) of released tempo events at the current tick
+    tempo_tick = None
+
+    def release(limit):
+        """Yield buffered events starting before limit (None = all)."""
+        nonlocal tempo_tick
+        while pending and (limit is None or pending[0][0] < limit):
+            event = heapq.heappop(pending)[3]
+            if event['type'] == 'tempo':
+                if event['time'] != tempo_tick:
+                    tempo_tick = event['time']
+                    tempo_seen.clear()
+                if event['tempo'] in tempo_seen:
+                    continue
+                tempo_seen.add(event['tempo'])
+            yield event
+
+    try:
+        while cursors:
+            cursor, rank = heapq.heappop(cursors)
+            yield from release(cursor)
+
+            try:
+                next_cursor, events = next(streams[rank])
+            except StopIteration:
+                continue
+            except Exception as e:
+                raise Exception(f"Failed parsing track {voice_nums[rank]}: {e}") from e
+
+            voice_num = voice_nums[rank]
+            for event in events:
+                event['voice'] = voice_num
+                heapq.heappush(pending, (event['time'], rank, seq, event))
+                seq += 1
+            heapq.heappush(cursors, (next_cursor, rank))
+
+        yield from release(None)
+    finally:
+        # Also when the consumer stops early (endless rendering), if partly rendered
+        if report is not None:
+            enclosing = run_report.current()
+            stage = enclosing['stage'] if enclosing is not None else 'pass2'
+            song = enclosing['song'] if enclosing is not None else None
+            for voice_num, voice_stats in zip(voice_nums, stats):
+                counters = {name: voice_stats[name] for name in ('midi_events', 'loop_iterations')
+                            if name in voice_stats}
+                report.add_voice(stage, song, voice_num, voice_stats.get('wall', 0.0),
+                                 voice_stats.get('cpu', 0.0), counters, voice_stats.get('stop'))
+
+
+def _timed(stream: Iterator[Tuple], stats: Dict) -> Iterator[Tuple]:
+    """Pass a voice's Pass 2 batches through, adding the wall and CPU time
+    spent producing them and their event count to stats."""
+    stats.update(wall=0.0, cpu=0.0, midi_events=0)
+    while True:
+        start_cpu = time.thread_time()
+        start = time.perf_counter()
+        try:
+            item = next(stream)
+        except StopIteration:
+            return
+        finally:
+            stats['wall'] += time.perf_counter() - start
+            stats['cpu'] += time.thread_time() - start_cpu
+        stats['midi_events'] += len(item[1])
+        yield item
+
+
+def split_by_voice(events: Iterator[Dict], voice_nums: List[int]) -> Tuple[List[Dict], List[Dict]]:
+    """Collect a merged stream back into per-voice tracks.
+
+    Args:
+        events: Output of iter_song_events()
+        voice_nums: Voices that were rendered
+
+    Returns:
+        Tuple of (parsed_tracks, conductor_events): one
+        {'voice_num', 'events', 'has_notes'} dict per voice (events in time
+        order) and the deduplicated tempo events
+    """
+    tracks = {voice_num: {'voice_num': voice_num, 'events': [], 'has_notes': False}
+              for voice_num in voice_nums}
+    conductor_events = []
+    for event in events:
+        track = tracks[event['voice']]
+        track['events'].append(event)
+        if event['type'] == 'note':
+            track['has_notes'] = True
+        elif event['type'] == 'tempo':
+            conductor_events.append(event)
+    return [tracks[voice_num] for voice_num in voice_nums], conductor_events
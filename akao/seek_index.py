@@ -0,0 +1,88 @@
+"""
+Seek index: Pass 2 interpreter checkpoints for fast time-window rendering.
+
+Rendering a window (e.g. bars 40-60, or a preview of the first few bars) has to
+interpret every event before it, because loops, octave changes and volume fades
+carry state forward. While a voice is rendered, its interpreter state is
+checkpointed every `interval` MIDI ticks; a later window resumes from the last
+checkpoint before its start instead of from the first event.
+
+Checkpoints hold resolved patch values, so an index is only valid for the IR
+and patch maps it was built with. save()/load() take a fingerprint of those
+inputs and discard a cached index that doesn't match.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from build_cache import atomic_output
+from format_base import Pass2Window
+
+
+SEEK_INDEX_VERSION = 1
+
+# Checkpoint spacing in MIDI ticks: 4 bars of 4/4 at 96 ticks per quarter note
+DEFAULT_INTERVAL = 96 * 4 * 4
+
+
+class SeekIndex:
+    """Per-voice Pass 2 checkpoints of one song, filled in as windows are rendered."""
+
+    def __init__(self, interval: int = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.voices: Dict[int, List[Dict]] = {}  # Voice number -> checkpoints in time order
+
+    def window(self, voice_num: int, start_tick: int = 0, end_tick: Optional[int] = None) -> Pass2Window:
+        """Create the Pass 2 window for one voice, sharing this index's checkpoints.
+
+        Args:
+            voice_num: Voice to render
+            start_tick: First MIDI tick to emit
+            end_tick: Stop before this MIDI tick (None = no limit)
+
+        Returns:
+            Pass2Window to pass to the handler's _iter_track_pass2()
+        """
+        return Pass2Window(start_tick, end_tick, self.voices.setdefault(voice_num, []), self.interval)
+
+    def windows(self, voice_nums: List[int], start_tick: int = 0,
+                end_tick: Optional[int] = None) -> Dict[int, Pass2Window]:
+        """Windows for several voices (for scheduler.iter_song_events())."""
+        return {voice_num: self.window(voice_num, start_tick, end_tick) for voice_num in voice_nums}
+
+    def save(self, path: Path, fingerprint: str = ''):
+        """Write the index atomically as JSON.
+
+        Args:
+            path: Output file
+            fingerprint: Digest of the inputs the checkpoints depend on
+        """
+        data = {
+            'seek_index_version': SEEK_INDEX_VERSION,
+            'fingerprint': fingerprint,
+            'interval': self.interval,
+            'voices': {str(voice_num): checkpoints for voice_num, checkpoints in self.voices.items()},
+        }
+        with atomic_output(Path(path)) as tmp:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str = '') -> Optional['SeekIndex']:
+        """Read an index written by save().
+
+        Returns:
+            The index, or None if the file is missing, unreadable, from another
+            version or built from different inputs
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('seek_index_version') != SEEK_INDEX_VERSION or data.get('fingerprint') != fingerprint:
+            return None
+        index = cls(data['interval'])
+        index.voices = {int(voice_num): checkpoints for voice_num, checkpoints in data['voices'].items()}
+        return index
@@ -0,0 +1,318 @@
+"""
+Extraction server: keeps game images, format handlers and Pass 1 results warm.
+
+`extract_akao.py serve` runs a small HTTP server on localhost. It keeps one
+SequenceExtractor per (config, image, options) open, so the ISO, executable
+and ROM tables are loaded once, and keeps the Pass 1 results of recently
+rendered songs in an LRU cache. `extract_akao.py client ...` sends it a
+render request and prints the log, replacing a one-shot run for quick
+edit/render/listen loops.
+
+The config file is checked on every request. If only the patch maps (or the
+song list) changed, they are applied to the loaded extractor and cached Pass 1
+results stay valid for everything but the text disassembly (the IR keeps patch
+map slots, which are resolved in Pass 2). Any other change reloads the game.
+
+Requests (JSON over HTTP, 127.0.0.1 only; requests must name 127.0.0.1 or
+localhost as Host and POST bodies must be application/json, so web pages
+can't reach the server through the browser):
+    POST /render    {"config", "source", "songs", "formats", "output_dir", "cwd",
+                     "patch_based_tracks", "compressed_musicxml", "debug_events"}
+                    -> {"written", "log", "seconds", "pass1_hits", "pass1_misses"}
+    GET  /status    -> loaded games and cache statistics
+    POST /shutdown
+"""
+
+import io
+import os
+import json
+import time
+import contextlib
+import traceback
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from build_cache import PATCH_MAP_SECTIONS, config_digest
+from extractor import SequenceExtractor
+from format_base import SongMetadata
+from game_profile import load_profile
+from pipeline import SongPipeline, parse_formats
+
+
+DEFAULT_PORT = 8765
+
+# Songs whose Pass 1 results are kept
+DEFAULT_PASS1_CACHE = 64
+
+# Host header values (without port) the server answers to
+ALLOWED_HOSTS = ('127.0.0.1', 'localhost')
+
+# SequenceExtractor options a request may set
+EXTRACTOR_OPTIONS = ('patch_based_tracks', 'compressed_musicxml', 'debug_events')
+
+
+def _patch_state(config: Dict) -> str:
+    """The patch map sections of config, for telling whether a cached disassembly is current."""
+    return json.dumps([config.get(section) for section in PATCH_MAP_SECTIONS], sort_keys=True, default=str)
+
+
+class ExtractionServer:
+    """Loaded extractors and cached Pass 1 results, serving render requests."""
+
+    def __init__(self, cache_size: int = DEFAULT_PASS1_CACHE):
+        """Initialize with empty caches.
+
+        Args:
+            cache_size: Number of songs whose Pass 1 results are kept
+        """
+        self.cache_size = cache_size
+        self.games: Dict[Tuple, Dict] = {}  # (config, source, options) -> {'extractor', 'mtime'}
+        self.pass1: OrderedDict = OrderedDict()  # (game key, song, alternate) -> Pass 1 results, LRU order
+        self.stats = {'requests': 0, 'loads': 0, 'patch_reloads': 0, 'pass1_hits': 0, 'pass1_misses': 0}
+
+    def extractor(self, config: str, source: Optional[str], options: Dict) -> Tuple[SequenceExtractor, Tuple]:
+        """Return the loaded extractor for a game, loading or updating it if needed.
+
+        Returns:
+            Tuple of (extractor, game key)
+        """
+        key = (config, source, tuple(sorted(options.items())))
+        mtime = os.stat(config).st_mtime_ns
+        game = self.games.get(key)
+
+        if game is not None and game['mtime'] != mtime:
+            profile = load_profile(config)
+            extractor = game['extractor']
+            if config_digest(profile.config) == config_digest(extractor.config):
+                extractor.reload_patch_maps(profile)
+                game['mtime'] = mtime
+                self.stats['patch_reloads'] += 1
+                print(f"Reloaded patch maps: {config}")
+            else:
+                extractor.close()
+                del self.games[key]
+                for cache_key in [k for k in self.pass1 if k[0] == key]:
+                    del self.pass1[cache_key]
+                game = None
+
+        if game is None:
+            print(f"Loading: {config}")
+            game = {'extractor': SequenceExtractor(config, source, **options), 'mtime': mtime}
+            self.games[key] = game
+            self.stats['loads'] += 1
+        return game['extractor'], key
+
+    def _pipeline(self, extractor: SequenceExtractor, key: Tuple, song: SongMetadata, formats,
+                  output_root: Path, alternate: bool = False, data: Optional[bytes] = None) -> SongPipeline:
+        """Create a song's pipeline, with Pass 1 results from the cache if they are current."""
+        pipeline = SongPipeline(extractor, song, extractor.output_basename(song, alternate=alternate),
+                                output_root, data=data, use_alternate_pointers=alternate)
+        cache_key = (key, json.dumps(asdict(song), sort_keys=True), alternate)
+        cached = self.pass1.get(cache_key)
+        # The disassembly text is annotated with patch map entries at Pass 1
+        if cached is not None and ('txt' not in formats or cached['patches'] == _patch_state(extractor.config)):
+            self.pass1.move_to_end(cache_key)
+            pipeline.preload(tracks=cached['tracks'], loops=cached['loops'])
+            self.stats['pass1_hits'] += 1
+        else:
+            self.stats['pass1_misses'] += 1
+            self.pass1[cache_key] = {'tracks': pipeline.get('tracks'), 'patches': _patch_state(extractor.config),
+                                     'loops': None if pipeline.is_empty() else pipeline.get('loops')}
+            while len(self.pass1) > self.cache_size:
+                self.pass1.popitem(last=False)
+        return pipeline
+
+    def render_song(self, extractor: SequenceExtractor, key: Tuple, song: SongMetadata, formats,
+                    output_root: Path) -> List[Path]:
+        """Render one song (and its alternate version, if any) to the requested formats."""
+        print(f"Processing: {extractor.output_basename(song)}")
+        pipeline = self._pipeline(extractor, key, song, formats, output_root)
+        if pipeline.is_empty():
+            print(f"  SKIP: {song.title} (no valid voice data)")
+            return []
+
+        written = pipeline.run(formats)
+        print(f"  OK: Generated {', '.join(path.name for path in written)}")
+
+        if pipeline.get('tracks')['header'].get('has_alternate_pointers', False):
+            alt_pipeline = self._pipeline(extractor, key, song, formats, output_root, alternate=True,
+                                          data=pipeline.get('sequence') if pipeline.has_run('sequence') else None)
+            if not alt_pipeline.is_empty():
+                written.extend(alt_pipeline.run(formats))
+                print(f"  OK: Generated alternate files for {extractor.output_basename(song, alternate=True)}")
+        return written
+
+    def render(self, request: Dict) -> Dict:
+        """Handle a render request (see module docstring).
+
+        Returns:
+            Dict with the files written, the captured log, the time taken and
+            the Pass 1 cache hits and misses of this request
+        """
+        self.stats['requests'] += 1
+        start = time.perf_counter()
+        hits, misses = self.stats['pass1_hits'], self.stats['pass1_misses']
+        options = {name: bool(request[name]) for name in EXTRACTOR_OPTIONS if name in request}
+        songs = request.get('songs')
+        written: List[Path] = []
+
+        # Paths in the config (e.g. akao_directory) are relative to the client's directory
+        server_cwd = os.getcwd()
+        log = io.StringIO()
+        try:
+            os.chdir(request.get('cwd', server_cwd))
+            with contextlib.redirect_stdout(log):
+                extractor, key = self.extractor(request['config'], request.get('source'), options)
+                plan = extractor.prepare_extraction(songs, request.get('formats'), force=True,
+                                                    output_root=Path(request.get('output_dir', '.')))
+                if plan is not None:
+                    selected, formats, output_root, _ = plan
+                    for song in selected:
+                        try:
+                            written.extend(self.render_song(extractor, key, song, formats, output_root))
+                        except Exception as e:
+                            print(f"  ERROR: {e} {traceback.format_exc()}")
+        finally:
+            os.chdir(server_cwd)
+
+        return {
+            'written': [str(path) for path in written],
+            'log': log.getvalue(),
+            'seconds': round(time.perf_counter() - start, 3),
+            'pass1_hits': self.stats['pass1_hits'] - hits,
+            'pass1_misses': self.stats['pass1_misses'] - misses,
+        }
+
+    def status(self) -> Dict:
+        """Loaded games and cache statistics."""
+        return {
+            'games': [{'config': config, 'source': source} for config, source, _ in self.games],
+            'pass1_cached': len(self.pass1),
+            **self.stats,
+        }
+
+    def close(self):
+        """Close every loaded game's image."""
+        for game in self.games.values():
+            game['extractor'].close()
+        self.games.clear()
+        self.pass1.clear()
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """JSON request handler; self.server.extraction is the ExtractionServer."""
+
+    def _reply(self, status: int, body: Dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _rejected(self, post: bool) -> bool:
+        """Reply with an error if the request may come from a web page; True if so.
+
+        A page can't set the Host header, so rebinding a hostname to 127.0.0.1
+        gives requests with a foreign Host. A cross-site form can only POST
+        form or text bodies; a JSON content type needs the server's consent.
+        """
+        host = self.headers.get('Host', '').rsplit(':', 1)[0].lower()
+        if host not in ALLOWED_HOSTS:
+            self._reply(403, {'error': f"Host {host or '(none)'} not allowed"})
+            return True
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if post and content_type != 'application/json':
+            self._reply(415, {'error': f"Content-Type must be application/json, got {content_type or '(none)'}"})
+            return True
+        return False
+
+    def do_GET(self):
+        if self._rejected(post=False):
+            return
+        if self.path == '/status':
+            self._reply(200, self.server.extraction.status())
+        else:
+            self._reply(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self._rejected(post=True):
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if self.path == '/render':
+                result = self.server.extraction.render(request)
+                print(f"render {Path(request['config']).name} songs={request.get('songs') or 'all'}: "
+                      f"{len(result['written'])} files in {result['seconds']:.2f}s "
+                      f"(Pass 1 cached for {result['pass1_hits']} of "
+                      f"{result['pass1_hits'] + result['pass1_misses']})")
+                self._reply(200, result)
+            elif self.path == '/shutdown':
+                self._reply(200, {'ok': True})
+                self.server.stopping = True
+            else:
+                self._reply(404, {'error': f"Unknown path {self.path}"})
+        except Exception as e:
+            self._reply(500, {'error': str(e), 'traceback': traceback.format_exc()})
+
+    def log_message(self, format, *args):
+        pass  # One summary line per render is printed instead
+
+
+def serve(port: int = DEFAULT_PORT, cache_size: int = DEFAULT_PASS1_CACHE):
+    """Run the extraction server on 127.0.0.1 until a /shutdown request or Ctrl-C."""
+    httpd = HTTPServer(('127.0.0.1', port), _RequestHandler)
+    httpd.extraction = ExtractionServer(cache_size)
+    httpd.stopping = False
+    print(f"Extraction server listening on http://127.0.0.1:{port}/")
+    try:
+        while not httpd.stopping:
+            httpd.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        httpd.extraction.close()
+        print("Extraction server stopped")
+
+
+def send_request(path: str, payload: Optional[Dict] = None, port: int = DEFAULT_PORT) -> Dict:
+    """Send a request to a running server (POST if payload is given, else GET).
+
+    Raises:
+        ConnectionError: If no server is listening on port
+        RuntimeError: If the server could not handle the request
+    """
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=data,
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        body = json.loads(e.read() or b'{}')
+        raise RuntimeError(f"{body.get('error', e)}\n{body.get('traceback', '')}") from e
+    except urllib.error.URLError as e:
+        raise ConnectionError(f"No extraction server on port {port} "
+                              f"(start one with: python extract_akao.py serve)") from e
+
+
+def render_request(config: str, source: Optional[str], song_id: Optional[int] = None, formats=None,
+                   output_dir: str = '.', **options) -> Dict:
+    """Build a /render request, with paths made absolute (the server has its own working directory)."""
+    request = {
+        'config': str(Path(config).resolve()),
+        'source': str(Path(source).resolve()) if source else None,
+        'songs': None if song_id is None else [song_id],
+        'formats': None if formats is None else list(parse_formats(formats)),
+        'output_dir': str(Path(output_dir).resolve()),
+        'cwd': os.getcwd(),
+    }
+    request.update({name: value for name, value in options.items() if name in EXTRACTOR_OPTIONS and value})
+    return request
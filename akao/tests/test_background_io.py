@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Test the song prefetcher and the background output writer (--prefetch)."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import tempfile
+import threading
+from pathlib import Path
+from background_io import BackgroundWriter, SongPrefetcher
+from build_cache import BuildManifest
+
+
+def test_prefetcher_order_and_errors():
+    readers = set()
+
+    def read(song):
+        readers.add(threading.current_thread().name)
+        if song == 3:
+            raise ValueError('bad pointer')
+        return bytes([song])
+
+    with SongPrefetcher(read, [1, 2, 3, 4], depth=2) as prefetcher:
+        items = list(prefetcher)
+    assert [(song, data) for song, data, _ in items] == [(1, b'\x01'), (2, b'\x02'), (3, None), (4, b'\x04')]
+    assert isinstance(items[2][2], ValueError)
+    assert readers == {'song-prefetch'}
+
+    # Stopping early doesn't leave the reader blocked on a full queue
+    with SongPrefetcher(read, list(range(100)), depth=1) as prefetcher:
+        next(iter(prefetcher))
+
+
+def test_writer_moves_outputs_in_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        (root / 'mid').mkdir()
+        manifest = BuildManifest(root, 'v1')
+        with BackgroundWriter(max_pending=1) as writer:
+            for name in ('a', 'b'):
+                with writer.output(root / 'mid' / f"{name}.mid") as spool:
+                    assert spool.name == f"{name}.mid" and spool.parent.parent != root
+                    spool.write_bytes(name.encode())
+                manifest.record(name, 'fp', [root / 'mid' / f"{name}.mid"], [])
+                writer.write_text(manifest.path, manifest.dumps(), skip_after_error=True)
+
+            # A failed write drops the manifest snapshots queued after it
+            with writer.output(root / 'missing' / 'c.mid') as spool:
+                spool.write_bytes(b'c')
+            manifest.record('c', 'fp', [root / 'missing' / 'c.mid'], [])
+            writer.write_text(manifest.path, manifest.dumps(), skip_after_error=True)
+
+        assert (root / 'mid' / 'b.mid').read_bytes() == b'b'
+        assert sorted(p.name for p in (root / 'mid').iterdir()) == ['a.mid', 'b.mid']
+        assert sorted(BuildManifest(root, 'v1').songs) == ['a', 'b']
+        assert [path for path, _ in writer.errors] == [root / 'missing' / 'c.mid']
+
+        manifest.forget_outputs(path for path, _ in writer.errors)
+        assert sorted(manifest.songs) == ['a', 'b']
+
+
+if __name__ == '__main__':
+    test_prefetcher_order_and_errors()
+    test_writer_moves_outputs_in_order()
+    print("All background I/O tests passed")
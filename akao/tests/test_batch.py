@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Test batch file parsing, the batch summary table and extractor cleanup."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import tempfile
+import contextlib
+from pathlib import Path
+import batch
+from batch import BatchJob, load_batch, print_summary
+from benchmarks.fixtures import FixtureSpec, write_game
+from extractor import SequenceExtractor
+
+
+def test_load_batch():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'batch.yaml'
+        path.write_text("jobs: 4\n"
+                        "games:\n"
+                        "  - {config: ct.yaml, source: chrono.smc, songs: [0x15, '0x16'], output_dir: out/ct}\n"
+                        "  - {config: ff9.yaml, source: ff9.iso, songs: 3, formats: mid, image_concurrency: 2}\n")
+        batch = load_batch(path)
+
+    assert batch['jobs'] == 4 and batch['image_concurrency'] == 1
+    assert batch['games'] == [
+        BatchJob('ct.yaml', 'chrono.smc', [0x15, 0x16], 'out/ct'),
+        BatchJob('ff9.yaml', 'ff9.iso', [3], '.', 'mid', 2),
+    ]
+
+
+def test_summary_table():
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        print_summary([{'game': 'ct', 'songs': 2, 'ok': 1, 'skipped': 0, 'failed': 1, 'seconds': 1.25},
+                       {'game': 'ff9', 'songs': 3, 'ok': 1, 'skipped': 2, 'failed': 0, 'seconds': 2.0}], 1.5, 4)
+    lines = out.getvalue().splitlines()
+    assert lines[2].split() == ['ct', '2', '1', '0', '1', '1.2s']
+    assert lines[4].split() == ['Total', '5', '2', '2', '1', '3.2s']
+    assert lines[5] == 'Wall time 1.5s with 4 jobs'
+
+
+class _FailingExtractor(SequenceExtractor):
+    """Extractor whose preparation fails; records that it was closed."""
+
+    closed = []
+
+    def prepare_extraction(self, *args, **kwargs):
+        raise ValueError("bad song list")
+
+    def close(self):
+        _FailingExtractor.closed.append(self)
+        super().close()
+
+
+def test_failed_game_is_closed():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['AKAO_CACHE_DIR'] = tmp
+        saved = batch.SequenceExtractor
+        batch.SequenceExtractor = _FailingExtractor
+        try:
+            config, source = write_game(FixtureSpec('snes_unified', voices=2, length=20, songs=1), Path(tmp))
+            path = Path(tmp) / 'batch.yaml'
+            path.write_text(f"games:\n  - {{config: '{config}', source: '{source}'}}\n")
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                summaries = batch.run_batch(path, jobs=1)
+        finally:
+            batch.SequenceExtractor = saved
+            del os.environ['AKAO_CACHE_DIR']
+
+    assert summaries[0]['failed'] == 1 and 'bad song list' in out.getvalue()
+    assert len(_FailingExtractor.closed) == 1
+
+
+if __name__ == '__main__':
+    test_load_batch()
+    test_summary_table()
+    test_failed_game_is_closed()
+    print("All batch tests passed")
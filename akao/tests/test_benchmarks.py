@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Test the synthetic benchmark fixtures and the baseline comparison."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import tempfile
+from pathlib import Path
+from benchmarks.fixtures import FixtureSpec, SONG_BUILDERS, write_game
+from benchmarks.runner import STAGES, compare, run_scenario
+from ir_events import IREventType
+from library import open_game
+
+
+def test_fixtures_parse():
+    # Every format's fixture runs through all stages, with one track per voice
+    for fmt in SONG_BUILDERS:
+        spec = FixtureSpec(fmt, voices=3, length=40, loop_depth=2, fade_density=0.2, songs=2)
+        results = run_scenario(spec, repeat=1, memory=False)
+        assert set(results) == set(STAGES)
+        assert results['pass1']['events'] > 2 * 3 * 40, fmt
+        assert results['pass2']['events'] > 0, fmt
+        assert results['pass1']['peak_kib'] is None
+
+
+def test_loop_structure():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['AKAO_CACHE_DIR'] = tmp
+        try:
+            config, source = write_game(FixtureSpec('snes_unified', voices=2, length=60, loop_depth=2), Path(tmp))
+            with open_game(str(config), str(source)) as game:
+                extractor, song = game.extractor, game.songs[0]
+                track_data = extractor.parse_all_tracks(song, extractor.extract_sequence_data(song))
+                assert len(track_data['tracks']) == 2
+                for track in track_data['tracks'].values():
+                    types = [event.type for event in track['ir_events']]
+                    # Nested repeats, closed by a backwards goto to the loop point
+                    assert types.count(IREventType.LOOP_START) == types.count(IREventType.LOOP_END) == 2
+                    assert types[-1] == IREventType.GOTO
+                    assert track['ir_events'][-1].target_offset > track['offset']
+                assert extractor.analyze_song_structure(track_data)['longest_loop_time'] > 0
+        finally:
+            del os.environ['AKAO_CACHE_DIR']
+
+
+def test_compare():
+    baseline = {'snes': {'pass1': {'events_per_sec': 1000.0, 'peak_kib': 1000.0},
+                         'xml': {'events_per_sec': 100.0, 'peak_kib': 10.0}}}
+    results = {'snes': {'pass1': {'events_per_sec': 700.0, 'peak_kib': 1300.0},
+                        'xml': {'events_per_sec': 90.0, 'peak_kib': 40.0},  # Within the memory slack
+                        'mid': {'events_per_sec': 1.0, 'peak_kib': None}},  # Not in the baseline
+               'ff7': {'pass1': {'events_per_sec': 1.0, 'peak_kib': 1.0}}}
+    regressions = compare(results, baseline, threshold=0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('snes pass1: 700 events/s')
+    assert 'peak 1,300.0 KiB' in regressions[1]
+    assert compare(results, baseline, threshold=0.5) == []
+
+
+if __name__ == '__main__':
+    test_fixtures_parse()
+    test_loop_structure()
+    test_compare()
+    print("All benchmark tests passed")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Test build manifest fingerprints, up-to-date checks and atomic output."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import tempfile
+import contextlib
+from pathlib import Path
+from benchmarks.fixtures import SNES_DURATIONS, FixtureSpec, write_game
+from build_cache import (BuildManifest, atomic_output, config_digest, patch_digest,
+                         referenced_instruments)
+from extractor import SequenceExtractor
+from format_base import PatchResolver
+from ir_events import IREvent, IREventType
+
+
+def test_patch_digest_only_covers_referenced_entries():
+    config = {'patch_map': {0x10: {'gm_patch': 40}, '0x11': {'gm_patch': 41}}}
+    before = patch_digest(config, [0x10])
+
+    # Editing an unreferenced entry does not change the digest
+    config['patch_map']['0x11'] = {'gm_patch': 42}
+    assert patch_digest(config, [0x10]) == before
+
+    # Editing a referenced entry does
+    config['patch_map'][0x10] = {'gm_patch': 48}
+    assert patch_digest(config, [0x10]) != before
+
+
+def test_config_digest_ignores_song_list_and_patch_maps():
+    config = {'opcodes': {0xC4: {'semantic': 'volume'}}, 'songs': [], 'patch_map': {}}
+    digest = config_digest(config)
+    config['songs'].append({'id': 1})
+    config['patch_map'][1] = 5
+    assert config_digest(config) == digest
+    config['midi_render'] = {'velocity_scale': 0.8}
+    assert config_digest(config) != digest
+
+
+def test_referenced_instruments():
+    patch = IREvent(type=IREventType.PATCH_CHANGE, offset=0, inst_id=0x21, patch_slot=0x40)
+    note = IREvent(type=IREventType.NOTE, offset=2, note_num=0, duration=48,
+                   metadata={'inst_id': 0x05, 'patch_bank': 1, 'patch_slot': 0x06})
+    track_data = {'header': {'instrument_table': [0x40, 0x41]},
+                  'tracks': {0: {'ir_events': [patch, note]}}}
+    assert referenced_instruments(track_data) == [0, 0x05, 0x06, 0x21, 0x40, 0x41]
+
+    # With a resolver, the GM patches the slots map to are included (PatchMapper keys)
+    resolver = PatchResolver({0x40: {'gm_patch': 48}}, {0x06: {'gm_patch': 0x50}})
+    assert referenced_instruments(track_data, resolver) == [0, 0x05, 0x06, 0x21, 48, 0x40, 0x41, 0x50]
+
+
+def test_instrument_index():
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {'patch_map': {0x10: {'gm_patch': 40}, 0x11: {'gm_patch': 41}}}
+        manifest = BuildManifest(Path(tmp), 'v1')
+        manifest.record('01', 'a', [], [0, 0x10])
+        manifest.record('02', 'b', [], [0, 0x11])
+        manifest.record_patches(config)
+        manifest.save()
+
+        config['patch_map'][0x11] = {'gm_patch': 42, 'transpose': -1}
+        reloaded = BuildManifest(Path(tmp), 'v1')
+        assert reloaded.changed_instruments(config) == [0x11]
+        assert reloaded.songs_using([0x11]) == ['02']
+        assert reloaded.songs_using([0]) == ['01', '02']
+
+
+def test_manifest_round_trip_and_atomic_output():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        output = root / 'song.mid'
+        with atomic_output(output) as tmp_path:
+            tmp_path.write_bytes(b'MThd')
+            assert not output.exists()
+        assert output.read_bytes() == b'MThd'
+        assert sorted(p.name for p in root.iterdir()) == ['song.mid']
+
+        manifest = BuildManifest(root, 'v1')
+        manifest.record('01', 'abc', [output], [0, 5])
+        manifest.save()
+
+        reloaded = BuildManifest(root, 'v1')
+        assert reloaded.is_up_to_date('01', 'abc')
+        assert not reloaded.is_up_to_date('01', 'def')
+        assert reloaded.get('01')['instruments'] == [0, 5]
+
+        # A new extractor version invalidates every entry
+        assert not BuildManifest(root, 'v2').is_up_to_date('01', 'abc')
+
+        # Missing outputs force a rebuild
+        output.unlink()
+        assert not reloaded.is_up_to_date('01', 'abc')
+
+
+def test_rom_table_change_rebuilds_songs():
+    def extract(config, source, output_dir):
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(io.StringIO()):
+            extractor = SequenceExtractor(str(config), str(source))
+            extractor.output_dir = output_dir
+            extractor.extract_all(formats='mid')
+        return log.getvalue()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['AKAO_CACHE_DIR'] = tmp
+        try:
+            config, source = write_game(FixtureSpec('snes_unified', voices=2, length=30, songs=2), Path(tmp))
+            output_dir = Path(tmp) / 'out'
+            extract(config, source, output_dir)
+            assert extract(config, source, output_dir).count('(unchanged)') == 2
+            mids = sorted(output_dir.glob('mid/*.mid'))
+            before = [path.read_bytes() for path in mids]
+
+            # Halve the duration table in the ROM; the song data and config are unchanged
+            rom = bytearray(source.read_bytes())
+            table = bytes(SNES_DURATIONS)
+            offset = rom.index(table)
+            rom[offset:offset + len(table)] = bytes(d // 2 for d in SNES_DURATIONS)
+            source.write_bytes(bytes(rom))
+
+            log = extract(config, source, output_dir)
+            assert '(unchanged)' not in log and log.count('OK: Generated') == 2
+            assert all(path.read_bytes() != old for path, old in zip(mids, before))
+        finally:
+            del os.environ['AKAO_CACHE_DIR']
+
+
+if __name__ == '__main__':
+    test_patch_digest_only_covers_referenced_entries()
+    test_config_digest_ignores_song_list_and_patch_maps()
+    test_referenced_instruments()
+    test_instrument_index()
+    test_manifest_round_trip_and_atomic_output()
+    test_rom_table_change_rebuilds_songs()
+    print("All build cache tests passed")
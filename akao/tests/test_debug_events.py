@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Test the opt-in .events debug dump (NDJSON, one compact record per line)."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import json
+import tempfile
+import contextlib
+from pathlib import Path
+from benchmarks.fixtures import FixtureSpec, write_game
+from extractor import SequenceExtractor
+
+
+def _extract(tmp: Path, debug_events: bool) -> Path:
+    """Extract the fixture game's MIDI into tmp/<debug_events>; returns its mid/ directory."""
+    config, source = write_game(FixtureSpec('akao_ff7', voices=2, length=30), tmp)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        extractor = SequenceExtractor(str(config), str(source), debug_events=debug_events)
+        extractor.output_dir = tmp / str(debug_events)
+        extractor.extract_all(formats='mid')
+    return extractor.output_dir / 'mid'
+
+
+def test_events_dump_is_opt_in():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['AKAO_CACHE_DIR'] = tmp
+        try:
+            plain = _extract(Path(tmp), debug_events=False)
+            assert list(plain.glob('*.mid')) and not list(plain.glob('*.events'))
+
+            [events_file] = _extract(Path(tmp), debug_events=True).glob('*.events')
+            lines = events_file.read_text().splitlines()
+        finally:
+            del os.environ['AKAO_CACHE_DIR']
+
+    records = [json.loads(line) for line in lines]
+    # Compact: exactly what the encoder writes with no extra whitespace
+    assert lines == [json.dumps(record, separators=(',', ':')) for record in records]
+
+    kinds = [record['record'] for record in records]
+    assert kinds[0] == 'tempo'  # Conductor events first
+    assert set(kinds) == {'tempo', 'track', 'event'}
+    assert kinds.count('track') == 2
+    # Each track header is followed by its own events
+    track_num = None
+    for record in records:
+        if record['record'] == 'track':
+            track_num = record['track_num']
+            assert record['channel'] == record['voice_num']
+        elif record['record'] == 'event':
+            assert record['track_num'] == track_num
+            assert 'type' in record and 'time' in record
+
+
+if __name__ == '__main__':
+    test_events_dump_is_opt_in()
+    print("All debug events tests passed")
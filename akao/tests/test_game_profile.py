@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Test game config validation, normalization and the profile cache."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import tempfile
+import subprocess
+from pathlib import Path
+from game_profile import compile_profile, load_profile
+
+AKAO_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+CONFIG = """\
+console_type: snes
+format: snes_unified
+opcodes:
+  0xD2: {semantic: tempo, params: 1}
+  "0xD3": {semantic: tempo_fade, params: 2}
+patch_map:
+  "0x10": 40
+  3: {gm_patch: -36}
+songs:
+  - {id: 0x0D, title: Battle}
+"""
+
+
+def test_normalize():
+    config = {'format': 'snes_unified', 'opcodes': {0xD2: {'semantic': 'tempo'}, '0xD3': {'semantic': 'halt'}},
+              'patch_map': {'0x10': 40}, 'songs': [{'id': 1, 'title': 'One'}]}
+    profile = compile_profile(config)
+    assert profile.console_type == 'psx' and profile.format == 'snes_unified'
+    assert list(profile.config['opcodes']) == [0xD2, 0xD3]
+    assert profile.config['patch_map'] == {0x10: 40}
+    assert config['patch_map'] == {'0x10': 40}  # The parsed YAML is left alone
+    assert [(song.id, song.title) for song in profile.songs] == [(1, 'One')]
+    # SNES opcode tables are precomputed for the handler
+    assert profile.handler_tables['opcode_names'] == {0xD2: 'Tempo', 0xD3: 'Halt'}
+    assert profile.handler_tables['opcode_dispatch'][0xD3]['semantic'] == 'halt'
+
+
+def test_validation():
+    for config, message in [
+            ([], 'mapping'),
+            ({'console_type': 'n64'}, 'console_type'),
+            ({'format': 'akao_oldstyle'}, 'akao_oldstyle'),
+            ({'patch_map': {'bass': 33}}, "'bass'"),
+            ({'songs': [{'title': 'No ID'}]}, 'integer'),
+            ({'songs': [{'id': 2, 'tempo': 120}]}, 'tempo')]:
+        try:
+            compile_profile(config, 'game.yaml')
+        except ValueError as e:
+            assert 'game.yaml' in str(e) and message in str(e), str(e)
+        else:
+            assert False, f"accepted {config!r}"
+
+
+def test_profile_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        config = Path(tmp) / 'game.yaml'
+        cache_dir = Path(tmp) / 'cache'
+        config.write_text(CONFIG)
+        profile = load_profile(config, cache_dir)
+        assert profile.config['patch_map'] == {0x10: 40, 3: {'gm_patch': -36}}
+        assert len(list(cache_dir.iterdir())) == 1
+
+        # A cache hit doesn't even import yaml
+        result = subprocess.run(
+            [sys.executable, '-c', "import sys\nfrom pathlib import Path\nfrom game_profile import load_profile\n"
+             f"profile = load_profile({str(config)!r}, Path({str(cache_dir)!r}))\n"
+             "print(profile.songs[0].title, 'yaml' in sys.modules)"],
+            cwd=AKAO_DIR, capture_output=True, text=True, check=True)
+        assert result.stdout.split() == ['Battle', 'False']
+
+        # An edited config is recompiled, replacing its cache file
+        config.write_text(CONFIG.replace('Battle', 'Boss'))
+        assert load_profile(config, cache_dir).songs[0].title == 'Boss'
+        assert len(list(cache_dir.iterdir())) == 1
+
+        # A damaged cache file is rebuilt
+        next(cache_dir.iterdir()).write_bytes(b'not a pickle')
+        assert load_profile(config, cache_dir).songs[0].title == 'Boss'
+
+
+if __name__ == '__main__':
+    test_normalize()
+    test_validation()
+    test_profile_cache()
+    print("All game profile tests passed")
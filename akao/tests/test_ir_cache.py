@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Test the binary IR cache round trip and rendering without ROM data."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import tempfile
+from pathlib import Path
+from format_base import SongMetadata
+from format_psx import AKAONewStyle
+from format_snes import SNESUnified
+from ir_cache import IRCacheError, IRCacheFile, load_ir_cache, write_ir_cache
+from ir_events import (IREvent, IREventType, make_adsr, make_goto, make_loop_end, make_note,
+                       make_patch_change, make_tempo, make_volume)
+
+
+def _track_data():
+    voice0 = [
+        make_tempo(0x10, 132.5, [0x20, 0x30]),
+        make_patch_change(0x13, inst_id=0x21, patch_slot=0x0E, patch_bank=1, operands=[0x21]),
+        make_volume(0x15, 100, [0x64]),
+        IREvent(type=IREventType.NOTE, offset=0x17, note_num=4, duration=48,
+                metadata={'velocity': 90, 'params': [1, 2]}),
+        make_loop_end(0x18, restore_octave=True),
+        make_goto(0x19, 0x13, [0xFE, 0x06, 0xF8, 0xFF]),
+    ]
+    voice2 = [make_note(0x40, 11, 24), make_adsr(0x41, 'attack', 7, [7])]
+    header = {'magic': 'AKAO', 'voice_mask': 0x5, 'track_offsets': [0x10, 0x40],
+              'track_boundaries': {0: (0x10, 0x1D), 2: (0x40, 0x43)}}
+    return {'header': header,
+            'tracks': {0: {'offset': 0x10, 'ir_events': voice0, 'disasm_lines': ['x']},
+                       2: {'offset': 0x40, 'ir_events': voice2, 'disasm_lines': ['y']}}}
+
+
+def test_round_trip():
+    track_data = _track_data()
+    loop_analysis = {'tracks': {0: {'loop_info': {'has_backwards_goto': True, 'intro_time': 0,
+                                                  'loop_time': 48, 'goto_target_idx': 1,
+                                                  'target_time': 96}},
+                                2: {'loop_info': {}}},
+                     'song_length': 96, 'longest_intro_time': 0, 'longest_loop_time': 48}
+    song = SongMetadata(id=0x1F, title='Test')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'song.akir'
+        write_ir_cache(path, song, track_data, loop_analysis)
+
+        with IRCacheFile(path) as cache:
+            assert (cache.song_id, cache.title) == (0x1F, 'Test')
+            loaded = cache.track_data()
+        assert load_ir_cache(path)[1] == loop_analysis
+
+    assert loaded['header'] == track_data['header']
+    for voice_num, track in track_data['tracks'].items():
+        events = loaded['tracks'][voice_num]['ir_events']
+        assert events == track['ir_events']
+        # int/float distinction of IREvent.value survives the float64 column
+        assert [type(e.value) for e in events] == [type(e.value) for e in track['ir_events']]
+        assert loaded['tracks'][voice_num]['offset'] == track['offset']
+
+
+def test_rejects_other_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'song.akir'
+        path.write_bytes(b'MThd' + bytes(20))
+        try:
+            IRCacheFile(path)
+        except IRCacheError as e:
+            assert 'not an IR cache' in str(e)
+        else:
+            assert False, "non-cache file accepted"
+
+
+def test_render_only_handler():
+    config = {'default_velocity': 80}
+    handler = AKAONewStyle.for_rendering(config)
+    assert handler.default_velocity == 80 and handler.default_octave == 4
+
+    track_data = {'tracks': {0: {'ir_events': [make_note(0, 0, 48)], 'loop_info': {}}}}
+    events = handler._parse_track_pass2(track_data, 0)
+    assert [e['type'] for e in events if e['type'] == 'note'] == ['note']
+
+
+def test_patch_map_resolved_at_render_time():
+    # IR from Pass 1 refers to patch map slots; editing the map changes Pass 2 output
+    note = make_note(2, 0, 48)
+    note.metadata = {'patch_bank': 0, 'patch_slot': 0x40, 'track_num': 0, 'inst_id': 0x21}
+    track_data = {'tracks': {0: {'ir_events': [make_patch_change(0, 0x21, 0x40, operands=[0x21]), note],
+                                 'loop_info': {}}}}
+
+    def render(patch_map):
+        handler = SNESUnified.for_rendering({'patch_map': patch_map})
+        return [(e['type'], e.get('patch', e.get('note'))) for e in handler._parse_track_pass2(track_data, 0)
+                if e['type'] in ('program_change', 'note')]
+
+    assert render({0x40: {'gm_patch': 48}}) == [('program_change', 48), ('note', 48)]
+    assert render({'0x40': {'gm_patch': 33, 'transpose': -1}}) == [('program_change', 33), ('note', 36)]
+
+
+if __name__ == '__main__':
+    test_round_trip()
+    test_rejects_other_files()
+    test_render_only_handler()
+    test_patch_map_resolved_at_render_time()
+    print("All IR cache tests passed")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Test the in-memory library API and file object outputs."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import tempfile
+from pathlib import Path
+from game_profile import compile_profile
+from library import Game
+from output_generators import MidiGenerator, open_output
+
+
+class _StubExtractor:
+    """Extractor stand-in with a real MidiGenerator and no image."""
+
+    from_ir = False
+    output_dir = Path('.')
+    musicxml_ext = '.musicxml'
+
+    def __init__(self):
+        self.profile = compile_profile({'songs': [{'id': 1, 'title': 'One'}, {'id': 2, 'title': 'Empty'}]})
+        self.midi_generator = MidiGenerator(None, None, False)
+        self.midi_generator.render = lambda song, track_data, loops: ([], [])
+        self.reads = []
+        self.closed = 0
+
+    def output_basename(self, song, alternate=False):
+        return f"{song.id:02X} {song.title}"
+
+    def extract_sequence_data(self, song):
+        self.reads.append(song.id)
+        return b'data'
+
+    def parse_all_tracks(self, song, data, use_alternate_pointers=False):
+        return {'header': {}, 'tracks': {}} if song.id == 1 else None
+
+    def analyze_song_structure(self, track_data):
+        return {}
+
+    def disassemble_to_text(self, song, track_data):
+        return f"disasm {song.title}\n"
+
+    def generate_musicxml(self, song, track_data, loop_analysis, output, compressed=None):
+        with open_output(output, binary=compressed) as f:
+            f.write(b'PK' if compressed else '<score-partwise/>')
+
+    def close(self):
+        self.closed += 1
+
+
+def test_song_outputs():
+    extractor = _StubExtractor()
+    with Game(extractor) as game:
+        assert [song.id for song in game.songs] == [1, 2]
+        song = game.song(1)
+        assert song.name == '01 One'
+        assert song.disasm() == 'disasm One\n'
+        midi = song.midi_bytes()
+        assert midi.startswith(b'MThd') and b'MTrk' in midi
+        out = io.BytesIO()
+        assert song.midi_bytes(out) is None and out.getvalue() == midi
+        assert song.musicxml() == '<score-partwise/>'
+        assert song.musicxml(compressed=True) == b'PK'
+        assert song.loop_points() is None
+        # Pass 1 ran once for all outputs
+        assert extractor.reads == [1]
+
+        empty = game.song(2)
+        assert empty.is_empty()
+        try:
+            empty.midi_bytes()
+        except ValueError as e:
+            assert '02' in str(e)
+        else:
+            assert False, "empty song rendered"
+        try:
+            game.song(3)
+        except KeyError:
+            pass
+        else:
+            assert False, "unknown song ID accepted"
+
+    assert extractor.closed == 1
+    game.close()
+    assert extractor.closed == 1
+    try:
+        game.song(1)
+    except ValueError:
+        pass
+    else:
+        assert False, "closed game rendered"
+
+
+def test_open_output():
+    # Text written to a binary file object is UTF-8, and the object stays open
+    buffer = io.BytesIO()
+    with open_output(buffer) as f:
+        f.write('é')
+    assert buffer.getvalue() == 'é'.encode('utf-8') and not buffer.closed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'out.bin'
+        with open_output(path, binary=True) as f:
+            f.write(b'\x00\x01')
+        assert path.read_bytes() == b'\x00\x01'
+
+
+if __name__ == '__main__':
+    test_song_outputs()
+    test_open_output()
+    print("All library tests passed")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Test that PSX loop_mode "unroll" plays intro + two loops without emergency brakes."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import tempfile
+from pathlib import Path
+from benchmarks.fixtures import FixtureSpec, write_game
+from format_psx import AKAONewStyle
+from ir_events import make_goto, make_note, make_volume
+from library import open_game
+from pipeline import SongPipeline
+from run_report import RunReport
+
+# Voices of very different loop lengths (new-style repeats play 255 times), so
+# the shorter ones play many passes to fill the longest voice's two loops
+SPEC = FixtureSpec('akao_newstyle', voices=4, length=100, loop_depth=1, fade_density=0.05)
+
+TICK_SCALE = 2  # Native ticks -> MIDI ticks
+
+
+def test_unroll_plays_two_loops_without_brakes():
+    report = RunReport()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['AKAO_CACHE_DIR'] = tmp
+        try:
+            config, source = write_game(SPEC, Path(tmp))
+            with open_game(str(config), str(source)) as game, report.activate():
+                extractor = game.extractor
+                song = game.songs[0]
+                pipeline = SongPipeline(extractor, song, '', data=extractor.extract_sequence_data(song))
+                loops = pipeline.get('loops')
+                tracks, _ = pipeline.get('midi_events')
+        finally:
+            del os.environ['AKAO_CACHE_DIR']
+
+    result = report.to_dict()
+    assert result['brakes'] == {}
+    assert result['stops'] == {'target_time': SPEC.voices}
+
+    # Every voice runs up to intro + two loops of the longest voice
+    target = (loops['longest_intro_time'] + 2 * loops['longest_loop_time']) * TICK_SCALE
+    assert loops['longest_loop_time'] > 0
+    assert len(tracks) == SPEC.voices
+    for track in tracks:
+        notes = [event for event in track['events'] if event['type'] == 'note']
+        end = max(note['time'] + note['duration'] for note in notes)
+        longest = max(note['duration'] for note in notes)
+        assert target <= end < target + longest
+
+
+def test_pass_without_time_still_brakes():
+    # The iteration limit restarts with each pass only if the pass moved time forward
+    handler = AKAONewStyle.for_rendering({})
+    ir_events = [make_note(0, 0, 24), make_volume(1, 100), make_goto(2, 1)]
+    track_data = {'tracks': {0: {'ir_events': ir_events, 'loop_info': handler._analyze_track_loops(ir_events)}}}
+    stats = {}
+    for _ in handler._iter_track_pass2(track_data, 0, target_loop_time=96, stats=stats):
+        pass
+    assert stats['stop'] == 'iteration_limit'
+
+
+if __name__ == '__main__':
+    test_unroll_plays_two_loops_without_brakes()
+    test_pass_without_time_still_brakes()
+    print("All loop unroll tests passed")
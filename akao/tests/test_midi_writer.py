@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Test the Standard MIDI File writer (delta-times, running status, ordering) and loop markers."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import struct
+from format_base import PatchMapper
+from format_psx import AKAONewStyle
+from ir_events import make_goto, make_note, make_tempo
+from midi_writer import MidiFileWriter, MidiTrack, encode_var_length
+from output_generators import MidiGenerator
+
+
+def test_var_length():
+    assert encode_var_length(0) == b'\x00'
+    assert encode_var_length(0x7F) == b'\x7f'
+    assert encode_var_length(0x80) == b'\x81\x00'
+    assert encode_var_length(0x2000) == b'\xc0\x00'
+    assert encode_var_length(0x3FFF) == b'\xff\x7f'
+    assert encode_var_length(0x4000) == b'\x81\x80\x00'
+
+
+def test_running_status_and_ordering():
+    track = MidiTrack()
+    track.add_track_name(0, "Voice 00")
+    # Added out of order: second note first
+    track.add_note(96, 96, 0, 62, 100)
+    track.add_note(0, 96, 0, 60, 100)
+    track.add_program_change(0, 0, 5)
+
+    data = track.to_bytes()
+    expected = (
+        b'\x00\xff\x03\x08Voice 00'   # Track name first
+        b'\x00\xc0\x05'               # Program change before notes at the same tick
+        b'\x00\x90\x3c\x64'           # Note on C4
+        b'\x60\x80\x3c\x64'           # Note off C4 before next note on
+        b'\x00\x90\x3e\x64'           # Note on D4
+        b'\x60\x80\x3e\x64'           # Note off D4
+        b'\x00\xff\x2f\x00'           # End of track
+    )
+    assert data == expected
+
+
+def test_running_status_reuse():
+    track = MidiTrack()
+    track.add_controller(0, 3, 7, 100)
+    track.add_controller(2, 3, 7, 90)
+    track.add_controller(4, 3, 7, 80)
+
+    # Status byte written once, then data bytes only
+    assert track.to_bytes() == b'\x00\xb3\x07\x64\x02\x07\x5a\x02\x07\x50\x00\xff\x2f\x00'
+
+
+def test_duplicates_removed():
+    track = MidiTrack()
+    track.add_note(0, 48, 0, 60, 100)
+    track.add_note(0, 48, 0, 60, 80)     # Same tick/pitch/channel - dropped
+    track.add_tempo(0, 120)
+    track.add_tempo(0, 120)              # Same tick/tempo - dropped
+
+    data = track.to_bytes()
+    assert data.count(b'\xff\x51\x03') == 1
+    assert data.count(b'\x3c\x64') == 2  # One note on, one note off
+    assert b'\x3c\x50' not in data
+
+
+def test_file_layout():
+    buf = io.BytesIO()
+    tempo_track = MidiTrack()
+    tempo_track.add_tempo(0, 120)
+    with MidiFileWriter(buf, num_tracks=2, ticks_per_quarter=96) as smf:
+        smf.write_track(tempo_track)
+        # Second track omitted: close() pads with an empty track
+
+    data = buf.getvalue()
+    assert data[:14] == b'MThd' + struct.pack('>LHHH', 6, 1, 2, 96)
+    assert data[14:18] == b'MTrk'
+    length = struct.unpack('>L', data[18:22])[0]
+    assert data[22:22 + length] == b'\x00\xff\x51\x03\x07\xa1\x20\x00\xff\x2f\x00'
+    assert data[22 + length:] == b'MTrk\x00\x00\x00\x04\x00\xff\x2f\x00'
+
+
+class _Song:
+    id = 0x01
+    title = 'Song'
+
+
+def test_loop_markers():
+    handler = AKAONewStyle.for_rendering({})
+    # Intro: one quarter note; loop: a quarter note and a half note held past the loop end
+    ir_events = [make_tempo(0, 60.0), make_note(1, 0, 48), make_note(2, 2, 48), make_note(3, 4, 96),
+                 make_goto(4, 2)]
+    loop_info = handler._analyze_track_loops(ir_events)
+    loop_analysis = {'tracks': {0: {'loop_info': loop_info}},
+                     'longest_intro_time': loop_info['intro_time'], 'longest_loop_time': loop_info['loop_time']}
+    track_data = {'tracks': {0: {'ir_events': ir_events}}}
+
+    gen = MidiGenerator(handler, PatchMapper(), False, loop_mode='markers')
+    tracks, conductor = gen.render(_Song(), track_data, loop_analysis)
+    assert [(e['text'], e['time']) for e in conductor if e['type'] == 'marker'] == [('loopStart', 96),
+                                                                                    ('loopEnd', 384)]
+    notes = [e for e in tracks[0]['events'] if e['type'] == 'note']
+    assert [e['time'] for e in notes] == [0, 96, 192]  # Intro + exactly one loop
+    assert max(e['time'] + e['duration'] for e in notes) <= 384
+
+    points = gen.loop_points(conductor)
+    assert (points['loop_start_seconds'], points['loop_end_seconds']) == (1.0, 4.0)  # 60 BPM
+
+    buf = io.BytesIO()
+    gen.write_midi(buf, tracks, conductor)
+    assert b'\xff\x06\x09loopStart' in buf.getvalue() and b'\xff\x06\x07loopEnd' in buf.getvalue()
+    assert b'\xb0\x6f\x00' in buf.getvalue()  # CC111 at the loop start
+
+    unrolled, conductor = MidiGenerator(handler, PatchMapper(), False).render(_Song(), track_data, loop_analysis)
+    assert len([e for e in unrolled[0]['events'] if e['type'] == 'note']) == 5
+    assert gen.loop_points(conductor) is None
+
+
+if __name__ == '__main__':
+    test_var_length()
+    test_running_status_and_ordering()
+    test_running_status_reuse()
+    test_duplicates_removed()
+    test_file_layout()
+    test_loop_markers()
+    print("All MIDI writer tests passed")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Test MusicXML measure bucketing and the streaming (.musicxml/.mxl) writer."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import zipfile
+import tempfile
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+from pathlib import Path
+from format_base import PatchMapper
+from output_generators import MusicXmlGenerator, XmlStreamWriter, merge_patch_notes, organize_by_patch
+
+
+def _note(time, duration, note=60):
+    return {'type': 'note', 'time': time, 'duration': duration, 'note': note, 'velocity': 100}
+
+
+def test_measures_split_at_barline():
+    gen = MusicXmlGenerator(None, PatchMapper(), False)
+    # Starts on beat 4 of measure 1 and lasts a half note, so it crosses into measure 2
+    events = [_note(288, 192, 61), _note(576, 96, 64)]
+
+    measures = list(gen._iter_measures(events))
+    assert [num for num, _ in measures] == [1, 2]
+
+    m1, m2 = measures[0][1], measures[1][1]
+    assert m1 == [('forward', 288),
+                  ('note', ('C', 1, '4'), 96, 'quarter', False, True)]
+    assert m2 == [('note', ('C', 1, '4'), 96, 'quarter', True, False),
+                  ('forward', 96),
+                  ('note', ('E', 0, '4'), 96, 'quarter', False, False),
+                  ('forward', 96)]
+
+
+def test_stream_writer_matches_minidom_layout():
+    buf = io.StringIO()
+    xml = XmlStreamWriter(buf)
+    xml.start('score-partwise', version='3.1')
+    xml.start('work')
+    xml.element('work-title', 'Tom & Jerry <1>')
+    xml.end('work')
+    xml.element('tie', type='stop')
+    xml.end('score-partwise')
+
+    root = ET.Element('score-partwise', version='3.1')
+    work = ET.SubElement(root, 'work')
+    ET.SubElement(work, 'work-title').text = 'Tom & Jerry <1>'
+    ET.SubElement(root, 'tie', type='stop')
+    pretty = minidom.parseString(ET.tostring(root, encoding='unicode')).toprettyxml(indent='  ')
+    expected = '\n'.join(line for line in pretty.split('\n') if line.strip())
+
+    assert buf.getvalue() == expected
+
+
+class _StubHandler:
+    """Format handler stand-in returning fixed Pass 2 events."""
+
+    def _iter_track_pass2(self, track_data, voice_num, target_time, endless=False, window=None):
+        yield 0, [_note(0, 384)]
+
+
+class _StubSong:
+    id = 0x01
+    title = 'Song'
+
+
+def test_mxl_container():
+    gen = MusicXmlGenerator(_StubHandler(), PatchMapper(), False)
+    track_data = {'tracks': {0: {}}}
+    loop_analysis = {'tracks': {0: {'loop_info': {}}}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = Path(tmp) / 'song.musicxml'
+        gen.generate(_StubSong(), track_data, loop_analysis, plain)
+        compressed = Path(tmp) / 'song.mxl'
+        gen.generate(_StubSong(), track_data, loop_analysis, compressed)
+
+        with zipfile.ZipFile(compressed) as archive:
+            assert archive.namelist()[0] == 'mimetype'
+            container = ET.fromstring(archive.read('META-INF/container.xml'))
+            assert container.find('rootfiles/rootfile').get('full-path') == 'song.musicxml'
+            assert archive.read('song.musicxml') == plain.read_bytes()
+
+        score = ET.parse(plain).getroot()
+        assert score.find('work/work-title').text == 'Song'
+        assert score.find('part/measure/note/type').text == 'whole'
+
+
+class _LoopingHandler:
+    """Format handler stand-in returning a rising quarter-note line."""
+
+    def _iter_track_pass2(self, track_data, voice_num, target_time, endless=False, window=None):
+        yield 0, [_note(time, 96, 60 + time // 96) for time in range(0, 1920, 96)]
+
+
+class _LongNoteHandler:
+    """Format handler stand-in returning one note held across two barlines."""
+
+    def _iter_track_pass2(self, track_data, voice_num, target_time, endless=False, window=None):
+        yield 0, [_note(192, 768, 62)]
+
+
+def test_notes_tied_across_barlines():
+    gen = MusicXmlGenerator(_LongNoteHandler(), PatchMapper(), False)
+    track_data = {'tracks': {0: {}}}
+    loop_analysis = {'tracks': {0: {'loop_info': {}}}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'song.musicxml'
+        gen.generate(_StubSong(), track_data, loop_analysis, path)
+        measures = ET.parse(path).getroot().findall('part/measure')
+
+    # Half note, whole note, half note: the held note is split at each barline, not clamped
+    notes = [m.findall('note') for m in measures]
+    assert [[n.find('duration').text for n in ns] for ns in notes] == [['192'], ['384'], ['192']]
+    assert all(n.find('pitch/step').text == 'D' for ns in notes for n in ns)
+    ties = [[t.get('type') for t in ns[0].findall('tie')] for ns in notes]
+    assert ties == [['start'], ['stop', 'start'], ['stop']]
+    tied = [[t.get('type') for t in ns[0].findall('notations/tied')] for ns in notes]
+    assert tied == ties
+    assert measures[0].find('forward/duration').text == '192'
+
+
+def test_repeat_barlines():
+    gen = MusicXmlGenerator(_LoopingHandler(), PatchMapper(), False)
+    track_data = {'tracks': {0: {}}}
+    # One-measure loop starting halfway through measure 1 (native ticks are half a division)
+    loop_analysis = {'longest_intro_time': 96, 'longest_loop_time': 192, 'tracks': {0: {'loop_info': {}}}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'song.musicxml'
+        gen.generate(_StubSong(), track_data, loop_analysis, path)
+        measures = ET.parse(path).getroot().findall('part/measure')
+
+    # Intro + loop head, then the first ending (loop tail + next loop head), then the second ending
+    assert [m.get('number') for m in measures] == ['1', '2', '3']
+    pitches = [[n.find('pitch/step').text for n in m.findall('note')] for m in measures]
+    assert pitches == [['C', 'C', 'D', 'D'], ['E', 'F', 'F', 'G'], ['E', 'F']]
+    # The second ending stops at the loop end
+    assert measures[2].find('forward') is None
+
+    def barline(measure, location):
+        element = measure.find(f"barline[@location='{location}']")
+        return [(child.tag, child.get('direction') or child.get('number'), child.get('type'))
+                for child in element] if element is not None else None
+
+    assert barline(measures[0], 'left') is None
+    assert barline(measures[1], 'left') == [('bar-style', None, None), ('ending', '1', 'start'),
+                                            ('repeat', 'forward', None)]
+    assert barline(measures[1], 'right') == [('bar-style', None, None), ('ending', '1', 'stop'),
+                                             ('repeat', 'backward', None)]
+    assert barline(measures[2], 'right') == [('bar-style', None, None), ('ending', '2', 'discontinue')]
+
+    # A loop that isn't whole measures restarts the measure grid at the loop start
+    layout = gen._loop_layout(500, 1000)
+    assert layout['measure_ends'] == [384, 500, 884, 1268, 1500]
+    assert layout['barlines'][(3, 'left')]['repeat'] == 'forward'
+    assert layout['barlines'][(5, 'right')]['repeat'] == 'backward'
+    assert layout['second_ending'] is None
+
+
+def test_patch_merge_matches_stable_sort():
+    def patched(event, patch):
+        return dict(event, patch=patch)
+
+    voices = [
+        [patched(_note(0, 48, 64), 1), patched(_note(48, 48, 60), 2), {'type': 'tempo', 'time': 0, 'tempo': 120},
+         patched(_note(96, 48, 62), 1), patched(_note(96, 0, 55), 1)],
+        [patched(_note(0, 96, 60), 1), patched(_note(96, 48, 62), 1)],
+    ]
+    tracks = [{'voice_num': i, 'events': events, 'has_notes': True} for i, events in enumerate(voices)]
+    patch_tracks, tempo_events = organize_by_patch(tracks)
+
+    assert [t['patch'] for t in patch_tracks] == [1, 2]
+    assert len(tempo_events) == 1
+    expected = sorted([e for events in voices for e in events if e.get('patch') == 1],
+                      key=lambda e: (e['time'], e['note']))
+    merged = list(merge_patch_notes(patch_tracks[0]))
+    assert [id(e) for e in merged] == [id(e) for e in expected]
+
+
+if __name__ == '__main__':
+    test_measures_split_at_barline()
+    test_stream_writer_matches_minidom_layout()
+    test_mxl_container()
+    test_notes_tied_across_barlines()
+    test_repeat_barlines()
+    test_patch_merge_matches_stable_sort()
+    print("All MusicXML tests passed")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Test --jobs extraction: worker processes, log order and manifest merging."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import time
+import tempfile
+import contextlib
+from pathlib import Path
+from build_cache import BuildManifest
+from extractor import SequenceExtractor
+from format_base import SongMetadata
+
+
+class _StubExtractor:
+    """Extractor stand-in whose songs write their sequence bytes and worker PID."""
+
+    from_ir = False
+    _config_hash = 'config'
+    _extract_parallel = SequenceExtractor._extract_parallel
+
+    def __init__(self):
+        self.config = {}
+        self.song_times = {}
+        self.reads = []
+
+    def extract_sequence_data(self, song):
+        self.reads.append(os.getpid())
+        return bytes([song.id])
+
+    def process_song(self, song, formats, output_root, manifest=None, force=False, data=None):
+        print(f"Processing: {song.title}")
+        print(f"WARNING: Track {song.id} hit max iteration limit", file=sys.stderr)
+        # Later songs finish first, so the log is only ordered if it is replayed in song order
+        time.sleep(0.02 * (4 - song.id))
+        path = output_root / f"{song.title}.txt"
+        path.write_text(f"{data[0]} {os.getpid()}")
+        manifest.record(f"{song.id:02X}", 'fp', [path], [song.id])
+        if manifest.autosave:
+            manifest.save()
+        print(f"  OK: Generated {path.name}")
+        return [path]
+
+
+def test_parallel_log_order_and_manifest():
+    songs = [SongMetadata(id=i, title=f"Song{i}") for i in range(1, 5)]
+    extractor = _StubExtractor()
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        manifest = BuildManifest(root, 'v1')
+        log = io.StringIO()
+        errors = io.StringIO()
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(errors):
+            extractor._extract_parallel(songs, ('txt',), root, manifest, False, jobs=4)
+
+        # Worker warnings stay with their song's log, in the order they were written
+        lines = log.getvalue().splitlines()
+        assert lines[:-1] == [line for i in range(1, 5)
+                              for line in (f"Processing: Song{i}",
+                                           f"WARNING: Track {i} hit max iteration limit",
+                                           f"  OK: Generated Song{i}.txt")]
+        assert errors.getvalue() == ''
+        assert lines[-1].startswith('Extracted 4 songs with 4 jobs') and '(4 ok, 0 skipped, 0 failed' in lines[-1]
+
+        # Songs ran in workers, from bytes read once in the parent
+        outputs = [(root / f"Song{i}.txt").read_text().split() for i in range(1, 5)]
+        assert [data for data, _ in outputs] == ['1', '2', '3', '4']
+        assert str(os.getpid()) not in {pid for _, pid in outputs}
+        assert extractor.reads == [os.getpid()] * 4
+        assert sorted(extractor.song_times) == ['01', '02', '03', '04']
+
+        # Every worker's manifest entry was merged and saved by the parent
+        assert manifest.autosave
+        assert sorted(BuildManifest(root, 'v1').songs) == ['01', '02', '03', '04']
+
+
+if __name__ == '__main__':
+    test_parallel_log_order_and_manifest()
+    print("All parallel extraction tests passed")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Test compiled patch lookup tables (PatchResolver, PatchMapper, SNES slot tables)."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from format_base import PatchMapper, PatchResolver
+from format_snes import SNESUnified
+
+
+def test_resolver_tables():
+    resolver = PatchResolver({0x10: {'gm_patch': 33, 'transpose': -1, 'name': 'Bass'},
+                              '0x11': {'gm_patch': -38}, 0x120: 5},
+                             {0x02: {'gm_patch': 80}})
+    high = resolver.banks[PatchResolver.BANK_HIGH]
+    assert len(high.gm_patch) == 0x121
+    assert resolver.resolve(PatchResolver.BANK_HIGH, 0x10) == (33, -1)
+    assert resolver.names[high.name_id[0x10]] == 'Bass'
+    assert (high.gm_patch[0x11], high.perc_key[0x11]) == (-38, 38)
+    assert resolver.resolve(PatchResolver.BANK_HIGH, 0x120) == (5, 0)
+    assert resolver.resolve(PatchResolver.BANK_LOW, 0x02) == (80, 0)
+
+    # Unmapped, out-of-range and missing slots fall back to (0, 0)
+    assert resolver.resolve(PatchResolver.BANK_LOW, 0x10) == (0, 0)
+    assert resolver.resolve(PatchResolver.BANK_HIGH, 0x1000) == (0, 0)
+    assert resolver.resolve(PatchResolver.BANK_HIGH, None) == (0, 0)
+
+    # Without patch_map_low, the low bank is the main patch map
+    assert PatchResolver({0x10: {'gm_patch': 33}}).resolve(PatchResolver.BANK_LOW, 0x10) == (33, 0)
+
+
+def test_patch_mapper_defaults():
+    mapper = PatchMapper({0x05: {'gm_patch': -38}, 0x06: 40})
+    assert mapper.get_instrument_name(0x05) == 'Percussion (GM 38)'
+    assert mapper.get_instrument_name(0x06) == 'Violin'
+    assert mapper.get_patch_info(0x07) is mapper.get_patch_info(0x1000) is PatchMapper.DEFAULT_PATCH
+    assert mapper.get_instrument_name(-1) == 'Acoustic Grand Piano'
+
+
+def test_snes_slot_table():
+    handler = SNESUnified.for_rendering({})
+    handler._patch_slot_tables = {}
+    dual_map = {'type': 'dual_map', 'param': 0x20}
+    table = handler._patch_slot_table(dual_map, [0x31, 0x32])
+    assert table[0x21] == (PatchResolver.BANK_HIGH, 0x32)
+    assert table[0x05] == (PatchResolver.BANK_LOW, 0x05)
+    assert table[0x30] == (PatchResolver.BANK_HIGH, 0)  # Past the end of the instrument table
+    assert handler._patch_slot_table(dual_map, [0x31, 0x32]) is table
+
+
+if __name__ == '__main__':
+    test_resolver_tables()
+    test_patch_mapper_defaults()
+    test_snes_slot_table()
+    print("All patch resolver tests passed")
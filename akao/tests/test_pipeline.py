@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Test output format selection and lazy evaluation of pipeline stages."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import tempfile
+from pathlib import Path
+from pipeline import SongPipeline, parse_formats, stages_for
+
+
+def test_parse_formats():
+    assert parse_formats(None) == ('txt', 'ir', 'mid', 'xml')
+    assert parse_formats('xml, mid') == ('mid', 'xml')
+    assert parse_formats(['musicxml', 'events']) == ('events', 'xml')
+    try:
+        parse_formats('mid,wav')
+    except ValueError as e:
+        assert 'wav' in str(e)
+    else:
+        assert False, "unknown format accepted"
+
+
+def test_stages_for():
+    assert stages_for(['txt']) == ['sequence', 'tracks', 'txt']
+    assert stages_for(['mid', 'events']) == ['sequence', 'tracks', 'loops', 'midi_events', 'mid', 'events']
+
+
+class _CountingExtractor:
+    """Extractor stand-in recording which steps were run."""
+
+    musicxml_ext = '.musicxml'
+
+    def __init__(self):
+        self.calls = []
+        self.midi_generator = self
+
+    def extract_sequence_data(self, song):
+        self.calls.append('sequence')
+        return b'data'
+
+    def parse_all_tracks(self, song, data, use_alternate_pointers=False):
+        self.calls.append('pass1')
+        return {'header': {}, 'tracks': {}}
+
+    def analyze_song_structure(self, track_data):
+        self.calls.append('loops')
+        return {}
+
+    def disassemble_to_text(self, song, track_data):
+        self.calls.append('disasm')
+        return ''
+
+    def render(self, song, track_data, loop_analysis):
+        self.calls.append('pass2')
+        return [], []
+
+    def write_midi(self, path, tracks, conductor):
+        self.calls.append('write_midi')
+        path.write_bytes(b'')
+
+    def write_debug_events(self, path, tracks, conductor):
+        self.calls.append('write_events')
+        path.write_text('')
+
+    def loop_points(self, conductor):
+        return None
+
+
+def test_only_needed_stages_run():
+    extractor = _CountingExtractor()
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        (root / 'mid').mkdir()
+        pipeline = SongPipeline(extractor, song=None, base_name='song', output_root=root)
+        written = pipeline.run(['mid', 'events'])
+
+        # Pass 1 and Pass 2 run once and are shared; no disassembly/IR/MusicXML work
+        assert extractor.calls == ['sequence', 'pass1', 'loops', 'pass2', 'write_midi', 'write_events']
+        assert written == [root / 'mid' / 'song.mid', root / 'mid' / 'song.events']
+        assert all(path.exists() for path in written)
+        assert not pipeline.has_run('xml')
+
+
+if __name__ == '__main__':
+    test_parse_formats()
+    test_stages_for()
+    test_only_needed_stages_run()
+    print("All pipeline tests passed")
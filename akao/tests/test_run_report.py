@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Test the run report: stage spans, Pass 2 voice results and the trace export."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import io
+import json
+import tempfile
+import contextlib
+from pathlib import Path
+from benchmarks.fixtures import FixtureSpec, write_game
+from extractor import SequenceExtractor
+from format_base import PASS2_STOPS
+import run_report
+from run_report import RunReport
+
+
+def test_spans_and_counters():
+    report = RunReport(game='test')
+    with run_report.span('pass1', song='01'):
+        assert run_report.active() is None  # Not active yet: nothing recorded
+    with report.activate():
+        with run_report.span('pass1', song='01'):
+            for voice in range(2):
+                with run_report.span('pass1', voice=voice):
+                    run_report.count('ir_events', 10 + voice)
+        report.add_voice('pass2', '01', 0, 0.5, 0.25, {'midi_events': 7}, stop='event_limit')
+    assert run_report.active() is None
+
+    result = report.to_dict()
+    assert [song['song'] for song in result['songs']] == ['01']
+    pass1 = result['songs'][0]['stages']['pass1']
+    assert pass1['calls'] == 1 and set(pass1['voices']) == {'0', '1'}
+    assert pass1['counters'] == {'ir_events': 21}
+    assert result['counters'] == {'ir_events': 21, 'midi_events': 7}
+    assert result['stops'] == result['brakes'] == {'event_limit': 1}
+
+    # Interleaved Pass 2 voices have no interval on the timeline
+    names = [event['name'] for event in report.trace_events() if event['ph'] == 'X']
+    assert sorted(names) == ['pass1', 'pass1 v0', 'pass1 v1']
+
+
+def test_memory_mode():
+    report = RunReport(memory=True, memory_budget=512 * 1024)
+    kept = []
+    with report.activate():
+        with run_report.span('pass1', song='big'):
+            with run_report.span('header'):
+                temporary = bytearray(2 * 1024 * 1024)  # Freed before the span ends
+                del temporary
+            kept.append(bytearray(64 * 1024))
+        with run_report.span('pass1', song='small'):
+            kept.append(bytearray(1024))
+
+    result = report.to_dict()
+    songs = {song['song']: song for song in result['songs']}
+    # The nested span's peak counts towards the enclosing one
+    assert songs['big']['stages']['header']['peak_bytes'] >= 2 * 1024 * 1024
+    assert songs['big']['stages']['pass1']['peak_bytes'] >= 2 * 1024 * 1024
+    assert 64 * 1024 <= songs['big']['stages']['pass1']['retained_bytes'] < 2 * 1024 * 1024
+    assert 'test_run_report.py' in songs['big']['stages']['pass1']['top_sites'][0]['site']
+    assert songs['small']['peak_bytes'] < 512 * 1024
+    assert result['over_budget'] == ['big']
+    assert any(line.startswith('WARNING: big:') for line in report.memory_summary())
+
+
+def test_extract_all_report():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['AKAO_CACHE_DIR'] = tmp
+        try:
+            config, source = write_game(FixtureSpec('akao_ff7', voices=3, length=40, songs=2), Path(tmp))
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                extractor = SequenceExtractor(str(config), str(source))
+                extractor.output_dir = Path(tmp) / 'out'
+                report = RunReport()
+                extractor.extract_all(formats='mid,xml', jobs=2, report=report)
+            report.write_trace(Path(tmp) / 'run.trace.json')
+            trace = json.loads((Path(tmp) / 'run.trace.json').read_text())
+        finally:
+            del os.environ['AKAO_CACHE_DIR']
+
+    result = report.to_dict()
+    assert len(result['songs']) == 2
+    for song in result['songs']:
+        assert song['game'] == Path(config).stem
+        assert {'read', 'header', 'pass1', 'loops', 'pass2', 'mid', 'xml'} <= set(song['stages'])
+        for stage in ('pass1', 'pass2', 'xml'):
+            assert set(song['stages'][stage]['voices']) == {'0', '1', '2'}
+        for voice in song['stages']['pass2']['voices'].values():
+            assert voice['stop'] in PASS2_STOPS
+            assert voice['counters']['midi_events'] > 0
+    assert result['counters']['ir_events'] > 2 * 3 * 40
+    assert result['counters']['loop_iterations'] > 0
+    assert result['brakes'] == {}
+
+    # Songs ran in worker processes, which are named on the timeline
+    spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+    assert {event['pid'] for event in spans} - {os.getpid()}
+    assert any(event['ph'] == 'M' and event['args']['name'].startswith('worker') for event in trace['traceEvents'])
+
+
+if __name__ == '__main__':
+    test_spans_and_counters()
+    test_memory_mode()
+    test_extract_all_report()
+    print("All run report tests passed")
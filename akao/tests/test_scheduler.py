@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Test the multi-voice Pass 2 scheduler and incremental (streaming) Pass 2 output."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from format_base import SequenceFormat
+from format_psx import AKAONewStyle
+import itertools
+from ir_events import IREvent, IREventType, make_goto, make_note, make_tempo
+from scheduler import iter_song_events, split_by_voice
+
+
+class _StubHandler:
+    """Pass 2 stand-in replaying fixed (cursor, events) batches per voice."""
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.calls = []
+
+    def _iter_track_pass2(self, track_data, voice_num, target_time, endless=False, window=None):
+        for cursor, events in self.batches[voice_num]:
+            self.calls.append(voice_num)
+            yield cursor, [dict(e) for e in events]
+
+
+def _ev(event_type, time, **fields):
+    return {'type': event_type, 'time': time, **fields}
+
+
+def test_merged_stream_order():
+    handler = _StubHandler({
+        0: [(48, [_ev('tempo', 0, tempo=120), _ev('note', 0, note=60)]),
+            (96, [_ev('controller', 48, value=1), _ev('note', 96, note=62)])],
+        1: [(48, [_ev('tempo', 0, tempo=120), _ev('note', 0, note=50)]),
+            (192, [_ev('note', 48, note=52), _ev('tempo', 96, tempo=90)])],
+    })
+    track_data = {'tracks': {0: {}, 1: {}}}
+    events = list(iter_song_events(handler, track_data))
+
+    assert [(e['time'], e['voice'], e['type']) for e in events] == [
+        (0, 0, 'tempo'), (0, 0, 'note'), (0, 1, 'note'),  # Duplicate tempo dropped
+        (48, 0, 'controller'), (48, 1, 'note'),
+        (96, 0, 'note'), (96, 1, 'tempo'),
+    ]
+    # Voices are advanced together (lowest cursor first), not one after the other
+    assert handler.calls == [0, 1, 0, 1]
+
+    tracks, conductor = split_by_voice(iter(events), [0, 1])
+    assert [len(t['events']) for t in tracks] == [4, 3]
+    assert [e['tempo'] for e in conductor] == [120, 90]
+
+
+def test_tie_holds_back_last_note():
+    ready, cursor = SequenceFormat._pass2_ready(
+        [_ev('note', 0), _ev('controller', 0), _ev('note', 48), _ev('controller', 48)], 96)
+    assert (ready, cursor) == (2, 48)
+
+    # A TIE after the last yielded batch still extends the note
+    handler = AKAONewStyle.for_rendering({})
+    ir_events = [make_tempo(0, 120.0), make_note(1, 0, 24),
+                 IREvent(type=IREventType.TIE, offset=2, duration=24), make_note(3, 2, 24)]
+    track_data = {'tracks': {0: {'ir_events': ir_events, 'loop_info': {}}}}
+    merged = [e for e in iter_song_events(handler, track_data) if e['type'] == 'note']
+    notes = [e for e in handler._parse_track_pass2(track_data, 0) if e['type'] == 'note']
+    assert [e['duration'] for e in merged] == [e['duration'] for e in notes]
+    assert merged[0]['duration'] > 48
+
+
+def test_endless_stream_keeps_bounded_buffer():
+    handler = AKAONewStyle.for_rendering({})
+    ir_events = [make_tempo(0, 120.0), make_note(1, 0, 24), make_note(2, 2, 24), make_goto(3, 1)]
+    loop_info = handler._analyze_track_loops(ir_events)
+    track_data = {'tracks': {0: {'ir_events': ir_events, 'loop_info': loop_info}}}
+
+    # Well past the per-track event brake: an endless stream only stops when the consumer does
+    stream = handler._iter_track_pass2(track_data, 0, endless=True)
+    batches = itertools.islice(stream, 120000)
+    times = [e['time'] for _, events in batches for e in events if e['type'] == 'note']
+    assert len(times) > 100000
+    assert times == sorted(times) and times[-1] == (len(times) - 1) * 48
+    # Only the batch just handed out and the held-back note are buffered
+    assert len(stream.gi_frame.f_locals['state'].midi_events) <= 2
+
+    merged = iter_song_events(handler, track_data, endless=True)
+    notes = [e for e in itertools.islice(merged, 200) if e['type'] == 'note']
+    assert [e['time'] for e in notes[:3]] == [0, 48, 96]
+
+
+if __name__ == '__main__':
+    test_merged_stream_order()
+    test_tie_holds_back_last_note()
+    test_endless_stream_keeps_bounded_buffer()
+    print("All scheduler tests passed")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Test Pass 2 time windows and seek checkpoints (Pass2Window, SeekIndex)."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import json
+import tempfile
+from dataclasses import MISSING, fields
+from pathlib import Path
+from format_base import Pass2State, Pass2Window
+from format_psx import AKAOBase, AKAONewStyle
+from format_snes import SNESPass2State, SNESUnified
+from ir_events import (make_goto, make_note, make_pan_fade, make_rest, make_tempo,
+                       make_tempo_fade, make_volume_fade)
+from seek_index import SeekIndex
+
+
+def _track_data(handler):
+    # Fades run across checkpoints, so some of their events are handed out early
+    ir_events = [make_tempo(0, 120.0), make_pan_fade(1, 200, 10), make_note(2, 0, 24),
+                 make_volume_fade(3, 150, 40), make_note(4, 2, 36), make_rest(5, 12),
+                 make_tempo_fade(6, 60, 90.0), make_note(7, 4, 24), make_note(8, 5, 48), make_goto(9, 2)]
+    loop_info = handler._analyze_track_loops(ir_events)
+    return {'tracks': {0: {'ir_events': ir_events, 'loop_info': loop_info}}}
+
+
+def _render(handler, track_data, window=None, end_tick=None):
+    events = []
+    for cursor, batch in handler._iter_track_pass2(track_data, 0, endless=True, window=window):
+        events.extend(batch)
+        if window is None and cursor >= end_tick:
+            break
+    return events
+
+
+def _expected(full, start_tick, end_tick):
+    """Events in the window, preceded by the settings in effect at its start."""
+    chase = {}
+    for event in full:
+        if event['time'] < start_tick and event['type'] != 'note':
+            key = (event['type'], event.get('channel'), event.get('controller'))
+            if key not in chase or event['time'] >= chase[key]['time']:
+                chase[key] = event
+    window = [e for e in full if start_tick <= e['time'] < end_tick]
+    chased = sorted(chase.values(), key=lambda e: e['time']) if window and start_tick else []
+    return [dict(e, time=start_tick) for e in chased] + window
+
+
+def test_window_matches_full_render():
+    handler = AKAONewStyle.for_rendering({})
+    track_data = _track_data(handler)
+    full = _render(handler, track_data, end_tick=6000)
+    index = SeekIndex(interval=96)
+
+    for start_tick, end_tick in [(1000, 2000), (0, 500), (1500, 1700), (4321, 5000)]:
+        expected = _expected(full, start_tick, end_tick)
+        first = _render(handler, track_data, index.window(0, start_tick, end_tick))
+        resumed_window = index.window(0, start_tick, end_tick)
+        assert start_tick == 0 or resumed_window.resume is not None
+        assert first == expected
+        assert _render(handler, track_data, resumed_window) == expected
+
+    checkpoints = index.voices[0]
+    assert [cp['time'] for cp in checkpoints] == sorted(cp['time'] for cp in checkpoints)
+    assert any(cp['ahead'] for cp in checkpoints)
+
+
+def test_seek_index_roundtrip():
+    handler = AKAONewStyle.for_rendering({})
+    track_data = _track_data(handler)
+    index = SeekIndex(interval=192)
+    expected = _render(handler, track_data, index.window(0, 3000, 3500))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'song.seek.json'
+        index.save(path, fingerprint='abc')
+        assert SeekIndex.load(path, fingerprint='other') is None
+        loaded = SeekIndex.load(path, fingerprint='abc')
+
+    window = loaded.window(0, 3000, 3500)
+    assert window.resume['time'] > 2500
+    assert _render(handler, track_data, window) == expected
+
+
+def _changed_state(state_class):
+    """A state_class instance with every field away from its default."""
+    values = {}
+    for f in fields(state_class):
+        default = f.default if f.default is not MISSING else f.default_factory()
+        if isinstance(default, bool):
+            values[f.name] = not default
+        elif isinstance(default, list):
+            values[f.name] = [{'time': 5, 'type': f.name}]
+        elif default is None:
+            values[f.name] = 3
+        else:
+            values[f.name] = default + 7
+    return state_class(**values)
+
+
+def test_checkpoint_restores_every_state_field():
+    for state_class in (Pass2State, SNESPass2State):
+        state = _changed_state(state_class)
+        window = Pass2Window(interval=1)
+        window.checkpoint(state)
+        state.midi_events.append({'time': 9, 'type': 'note'})  # The checkpoint holds a copy
+
+        checkpoints = json.loads(json.dumps(window.checkpoints))  # As SeekIndex saves them
+        restored = Pass2Window(start_tick=state.total_time, checkpoints=checkpoints).restore(state_class)
+        assert restored == _changed_state(state_class)
+
+
+def test_pass2_keeps_state_in_state_object():
+    # A field that is also a local of the generator would silently not be checkpointed
+    for handler_class, state_class in ((AKAOBase, Pass2State), (SNESUnified, SNESPass2State)):
+        local_names = set(handler_class._iter_track_pass2.__code__.co_varnames)
+        assert not local_names & {f.name for f in fields(state_class)}
+
+
+if __name__ == '__main__':
+    test_window_matches_full_render()
+    test_seek_index_roundtrip()
+    test_checkpoint_restores_every_state_field()
+    test_pass2_keeps_state_in_state_object()
+    print("All seek index tests passed")
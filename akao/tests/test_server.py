@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Test extraction server requests, request origin checks and the no-server client error."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import json
+import socket
+import threading
+import http.client
+from http.server import HTTPServer
+from pathlib import Path
+from server import ExtractionServer, _RequestHandler, _patch_state, render_request, send_request
+
+
+def test_render_request():
+    request = render_request('game.yaml', 'game.iso', 0x0D, 'mid,xml', output_dir='out',
+                             compressed_musicxml=True, debug_events=False, from_ir=True)
+    assert request['config'] == str(Path('game.yaml').resolve())
+    assert request['source'] == str(Path('game.iso').resolve())
+    assert request['output_dir'] == str(Path('out').resolve())
+    assert request['cwd'] == os.getcwd()
+    assert request['songs'] == [0x0D]
+    assert request['formats'] == ['mid', 'xml']
+    # Only set extractor options are sent; unknown ones are dropped
+    assert request['compressed_musicxml'] is True
+    assert 'debug_events' not in request and 'from_ir' not in request
+
+    request = render_request('game.yaml', None)
+    assert request['source'] is None and request['songs'] is None and request['formats'] is None
+
+
+def test_patch_state():
+    config = {'name': 'Game', 'patch_map': {0: {'gm_patch': 5}}}
+    state = _patch_state(config)
+    assert _patch_state({**config, 'name': 'Other'}) == state
+    assert _patch_state({**config, 'patch_map': {0: {'gm_patch': 6}}}) != state
+
+
+def test_no_server():
+    # Find a free port, so nothing is listening on it
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    try:
+        send_request('/status', port=port)
+    except ConnectionError as e:
+        assert 'extract_akao.py serve' in str(e)
+    else:
+        assert False, "expected ConnectionError"
+
+
+def test_rejects_browser_requests():
+    httpd = HTTPServer(('127.0.0.1', 0), _RequestHandler)
+    httpd.extraction = ExtractionServer()
+    httpd.stopping = False
+    port = httpd.server_address[1]
+    thread = threading.Thread(target=lambda: [httpd.handle_request() for _ in range(5)], daemon=True)
+    thread.start()
+
+    def post(path, headers):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        connection.request('POST', path, body=b'{}', headers=headers)
+        response = connection.getresponse()
+        status, body = response.status, json.loads(response.read())
+        connection.close()
+        return status, body
+
+    try:
+        # A cross-site form post (no JSON content type)
+        status, body = post('/shutdown', {'Content-Type': 'text/plain'})
+        assert status == 415 and 'application/json' in body['error']
+        # A page whose hostname was rebound to 127.0.0.1
+        status, body = post('/shutdown', {'Content-Type': 'application/json', 'Host': f'evil.example:{port}'})
+        assert status == 403 and 'evil.example' in body['error']
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        connection.request('GET', '/status', headers={'Host': 'evil.example'})
+        assert connection.getresponse().status == 403
+        connection.close()
+        assert not httpd.stopping
+
+        # The client's own requests still go through
+        assert send_request('/status', port=port)['requests'] == 0
+        assert post('/shutdown', {'Content-Type': 'application/json', 'Host': 'localhost'}) == (200, {'ok': True})
+    finally:
+        thread.join(timeout=5)
+        httpd.server_close()
+    assert httpd.stopping  # Set after the reply is sent, so only checked once the handler is done
+
+
+if __name__ == '__main__':
+    test_render_request()
+    test_patch_state()
+    test_no_server()
+    test_rejects_browser_requests()
+    print("All server tests passed")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Test lazy imports (the CLI's start-up time is checked by python -m benchmarks)."""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import subprocess
+from format_base import load_format_handler
+
+AKAO_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+def _loaded_modules(code: str) -> set:
+    """Run code in a fresh interpreter and return the top-level modules it loaded."""
+    result = subprocess.run([sys.executable, '-c', f"{code}\nimport sys\nprint(' '.join(sys.modules))"],
+                            cwd=AKAO_DIR, capture_output=True, text=True, check=True)
+    return {name.split('.')[0] for name in result.stdout.splitlines()[-1].split()}
+
+
+def test_extractor_import_is_lazy():
+    loaded = _loaded_modules("import extractor")
+    for name in ('pycdlib', 'format_psx', 'format_snes', 'multiprocessing', 'background_io', 'zipfile'):
+        assert name not in loaded, f"import extractor loaded {name}"
+
+
+def test_single_process_extraction_is_lazy():
+    # A one-song run on a synthetic game never needs worker processes
+    loaded = _loaded_modules(
+        "import os, io, contextlib, tempfile\n"
+        "from pathlib import Path\n"
+        "from benchmarks.fixtures import FixtureSpec, write_game\n"
+        "from extractor import SequenceExtractor\n"
+        "with tempfile.TemporaryDirectory() as tmp:\n"
+        "    os.environ['AKAO_CACHE_DIR'] = tmp\n"
+        "    config, source = write_game(FixtureSpec('snes_unified', voices=2, length=20, songs=1), Path(tmp))\n"
+        "    with contextlib.redirect_stdout(io.StringIO()):\n"
+        "        extractor = SequenceExtractor(str(config), str(source))\n"
+        "        extractor.output_dir = Path(tmp) / 'out'\n"
+        "        extractor.extract_all(formats='mid')\n"
+        "    assert list((Path(tmp) / 'out' / 'mid').glob('*.mid'))")
+    assert 'format_snes' in loaded
+    for name in ('multiprocessing', 'background_io', 'pycdlib'):
+        assert name not in loaded, f"one-song extraction loaded {name}"
+
+
+def test_usage_error_loads_no_backends():
+    loaded = _loaded_modules("import sys, extract_akao\nsys.argv = ['extract_akao.py']\n"
+                             "try:\n    extract_akao.main()\nexcept SystemExit:\n    pass")
+    for name in ('extractor', 'yaml', 'pycdlib', 'format_base', 'server'):
+        assert name not in loaded, f"usage error loaded {name}"
+
+
+def test_format_registry():
+    # Only the configured handler's module is imported
+    loaded = _loaded_modules("from format_base import load_format_handler\nload_format_handler('snes_unified')")
+    assert 'format_snes' in loaded and 'format_psx' not in loaded and 'pycdlib' not in loaded
+    assert load_format_handler('akao_ff7').__name__ == 'AKAOFF7'
+    try:
+        load_format_handler('akao_oldstyle')
+    except ValueError as e:
+        assert 'akao_oldstyle' in str(e)
+    else:
+        assert False, "unknown format accepted"
+
+
+if __name__ == '__main__':
+    test_extractor_import_is_lazy()
+    test_single_process_extraction_is_lazy()
+    test_usage_error_loads_no_backends()
+    test_format_registry()
+    print("All start-up tests passed")